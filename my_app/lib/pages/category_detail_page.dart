@@ -1,5 +1,4 @@
 import 'package:flutter/material.dart';
-import 'dart:convert';
 import '../services/stock_service.dart';
 
 class AppTheme {
@@ -396,7 +395,7 @@ class _CategoryDetailPageState extends State<CategoryDetailPage> {
           ),
 
           // Chart section
-          if (stock.chart != null && stock.chart!.isNotEmpty)
+          if (stock.chartImageUrl != null)
             Container(
               width: double.infinity,
               height: 220, // Increased height for better visualization
@@ -420,11 +419,13 @@ class _CategoryDetailPageState extends State<CategoryDetailPage> {
                   bottomLeft: Radius.circular(16),
                   bottomRight: Radius.circular(16),
                 ),
-                child: Image.memory(
-                  base64Decode(stock.chart!),
+                child: Image.network(
+                  stock.chartImageUrl!,
                   fit: BoxFit
                       .contain, // Changed to contain for better chart visibility
                   filterQuality: FilterQuality.high,
+                  errorBuilder: (context, error, stackTrace) =>
+                      const SizedBox.shrink(),
                 ),
               ),
             ),
@@ -7,7 +7,8 @@ class Stock {
   final double price;
   final String sector;
   final String industry;
-  final String? chart;
+  final String? chartUrl;
+  final String? chartHash;
 
   Stock({
     required this.ticker,
@@ -15,9 +16,14 @@ class Stock {
     required this.price,
     required this.sector,
     required this.industry,
-    this.chart,
+    this.chartUrl,
+    this.chartHash,
   });
 
+  // Absolute URL of the chart image (the server returns a relative path)
+  String? get chartImageUrl =>
+      chartUrl == null ? null : '${StockService.baseUrl}$chartUrl';
+
   factory Stock.fromJson(Map<String, dynamic> json) {
     return Stock(
       ticker: json['ticker'] ?? '',
@@ -25,7 +31,8 @@ class Stock {
       price: (json['price'] ?? 0).toDouble(),
       sector: json['sector'] ?? 'Unknown',
       industry: json['industry'] ?? 'Unknown',
-      chart: json['chart'],
+      chartUrl: json['chart_url'],
+      chartHash: json['chart_hash'],
     );
   }
 }
@@ -0,0 +1,138 @@
+import math
+
+import numpy as np
+
+# How investment_amount is split across the recommended stocks
+ALLOCATION_METHODS = ("risk_parity", "min_variance")
+DEFAULT_ALLOCATION_METHOD = "risk_parity"
+
+# Fraction of every covariance moved to the diagonal before solving. Keeps a year of daily
+# returns from over-trusting pairwise correlations, and the small matrices well conditioned
+COVARIANCE_SHRINKAGE = 0.1
+
+RISK_PARITY_ITERATIONS = 50
+RISK_PARITY_TOLERANCE = 1e-10
+
+TRADING_DAYS = 252
+
+
+def allocation_weights(covariance, method=DEFAULT_ALLOCATION_METHOD):
+    """Long-only portfolio weights (summing to 1) for a covariance matrix of daily returns"""
+    covariance = shrink(covariance)
+    # Weights don't depend on the scale, and solvers behave better near unit variances
+    covariance = covariance / np.mean(np.diag(covariance))
+    if method == "min_variance":
+        return min_variance_weights(covariance)
+    if method == "risk_parity":
+        return risk_parity_weights(covariance)
+    raise ValueError(f"Unknown allocation method: {method}")
+
+
+def shrink(covariance, shrinkage=COVARIANCE_SHRINKAGE):
+    """Covariance with every off-diagonal entry scaled by (1 - shrinkage)"""
+    return (1 - shrinkage) * covariance + shrinkage * np.diag(np.diag(covariance))
+
+
+def min_variance_weights(covariance):
+    """
+    Long-only minimum-variance weights: solves Σw ∝ 1, drops the stocks that come out
+    with a non-positive weight and solves again over the rest.
+    """
+    active = np.arange(len(covariance))
+    while True:
+        raw = np.linalg.solve(covariance[np.ix_(active, active)], np.ones(len(active)))
+        positive = raw > 0
+        if positive.all():
+            break
+        if not positive.any():
+            # Only possible for a degenerate matrix - fall back to the least volatile stock
+            active = active[[np.argmin(np.diag(covariance)[active])]]
+            raw = np.ones(1)
+            break
+        active = active[positive]
+    weights = np.zeros(len(covariance))
+    weights[active] = raw / raw.sum()
+    return weights
+
+
+def risk_parity_weights(covariance, iterations=RISK_PARITY_ITERATIONS, tolerance=RISK_PARITY_TOLERANCE):
+    """
+    Equal risk contribution weights: every stock adds the same amount to portfolio variance.
+    Newton's method on the convex form min ½yᵀΣy - Σ log(y)/n, whose optimum has
+    y_i (Σy)_i equal for all i; the weights are y normalized to sum to 1.
+    """
+    n = len(covariance)
+    budget = 1.0 / n
+    y = 1.0 / np.sqrt(np.diag(covariance) * n)  # Inverse volatility start
+    for _ in range(iterations):
+        gradient = covariance @ y - budget / y
+        if np.abs(gradient).max() < tolerance:
+            break
+        step = np.linalg.solve(covariance + np.diag(budget / (y * y)), gradient)
+        # Backtrack so every y stays positive
+        scale = 1.0
+        while np.any(y - scale * step <= 0):
+            scale /= 2
+        y = y - scale * step
+    return y / y.sum()
+
+
+def whole_shares(weights, prices, amount):
+    """
+    Whole share counts closest to investing `weights` of `amount` without going over it:
+    every target is rounded down, then the leftover cash buys one more share of the stocks
+    that are short of their target by more than half a share, biggest shortfall first.
+    """
+    targets = weights * amount
+    shares = np.floor(targets / prices)
+    cash = amount - float(shares @ prices)
+    shortfall = targets / prices - shares  # In shares, below 1 after rounding down
+    for i in np.argsort(-shortfall, kind="stable"):
+        if shortfall[i] <= 0.5:
+            break
+        if prices[i] <= cash:
+            shares[i] += 1
+            cash -= prices[i]
+    return shares.astype(int)
+
+
+def allocate(symbols, prices, risk, amount, method=DEFAULT_ALLOCATION_METHOD):
+    """
+    Splits `amount` across the recommended `symbols` (with their current `prices`) in whole
+    shares, weighted by `method` over the stocks the RiskModel `risk` covers. Stocks without
+    enough history (or price) are left out; without any risk data the amount is split equally.
+    Returns (positions by symbol, summary of the whole allocation).
+    """
+    prices = {symbol: price for symbol, price in zip(symbols, prices) if price > 0 and math.isfinite(price)}
+    covered = [symbol for symbol in prices if risk is not None and risk.covered(symbol)]
+    covariance = average_correlation = None
+    if covered:
+        weights, covariance, average_correlation = risk.portfolio(covered, method)
+    else:
+        method = "equal"
+        covered = list(prices)
+        weights = np.full(len(covered), 1.0 / len(covered)) if covered else np.empty(0)
+
+    held_prices = np.array([prices[symbol] for symbol in covered], dtype=float)
+    shares = whole_shares(weights, held_prices, amount)
+    values = shares * held_prices
+    invested = float(values.sum())
+
+    positions = {symbol: {"target_weight": 0.0, "shares": 0, "allocated_amount": 0.0} for symbol in symbols}
+    for symbol, weight, count, value in zip(covered, weights.tolist(), shares.tolist(), values.tolist()):
+        positions[symbol] = {"target_weight": round(weight, 4), "shares": count,
+                             "allocated_amount": round(value, 2)}
+
+    annual_volatility = None
+    if covariance is not None and invested > 0:
+        # Of the amount as actually invested in whole shares (cash counts as riskless)
+        held = values / amount
+        annual_volatility = round(math.sqrt(max(float(held @ covariance @ held), 0.0) * TRADING_DAYS) * 100, 2)
+    return positions, {
+        "method": method,
+        "investment_amount": amount,
+        "invested": round(invested, 2),
+        "cash": round(amount - invested, 2),
+        "annual_volatility": annual_volatility,
+        "average_correlation": round(average_correlation, 4) if average_correlation is not None else None,
+    }
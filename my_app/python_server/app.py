@@ -1,100 +1,417 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import json
+import asyncio
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from allocation import ALLOCATION_METHODS, DEFAULT_ALLOCATION_METHOD, allocate
+from asgi import ASGIApp, StreamingResponse, json_response
+from streaming import encode_event, encode_heartbeat, stream_format, stream_headers
 from stock_data import fetch_stock_data
-from stock_recommender import recommend_stocks
+from metrics import Gauge, instrument_app, register_cache
+from responses import use_fast_json
+from recommendation_cache import RecommendationCache
+from refresher import (SharedSnapshotPublisher, SharedSnapshotSource, SnapshotRefresher,
+                       REFRESH_INTERVAL)
 from stock_symbols import INDIAN_STOCK_SYMBOLS
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+instrument_app(app)
+use_fast_json(app)
 
-# Pre-fetch stock data when the server starts to improve response time
-stock_data = {}
+# Recommendations are memoized per normalized profile until the stock data changes
+PREWARM_RECOMMENDATIONS = True
+recommendation_cache = RecommendationCache()
 
-@app.route('/fetch-stock-data', methods=['GET'])
-def get_stock_data():
-    """Endpoint to fetch stock data - can be used for initialization or refresh"""
-    global stock_data
-    try:
-        stock_data = fetch_stock_data(INDIAN_STOCK_SYMBOLS)
-        return jsonify({"status": "success", "message": f"Fetched data for {len(stock_data)} stocks"})
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/recommend', methods=['POST'])
-def get_recommendations():
-    """Endpoint to get stock recommendations based on user input"""
-    global stock_data
-    
-    # If stock data is empty, fetch it first
-    if not stock_data:
-        try:
-            stock_data = fetch_stock_data(INDIAN_STOCK_SYMBOLS)
-        except Exception as e:
-            return jsonify({"status": "error", "message": f"Failed to fetch stock data: {str(e)}"}), 500
+def on_snapshot_published(published):
+    """Resets (and optionally pre-warms) the recommendation cache for a new snapshot"""
+    recommendation_cache.invalidate(published.generation)
+    if PREWARM_RECOMMENDATIONS:
+        recommendation_cache.prewarm(published.snapshot, generation=published.generation)
+
+
+# Production mode: with TRADEFLOW_SNAPSHOT_FILE set, one process refreshes the data
+# (python app.py --publish) and every server worker (e.g. gunicorn -w 8 app:app) maps
+# the published snapshot read-only instead of fetching the universe itself
+SNAPSHOT_FILE = os.environ.get("TRADEFLOW_SNAPSHOT_FILE")
+
+# Stock data is refreshed in the background and swapped in atomically;
+# requests always read refresher.current and never wait on upstream I/O
+if SNAPSHOT_FILE:
+    refresher = SharedSnapshotSource(SNAPSHOT_FILE, on_publish=on_snapshot_published)
+else:
+    refresher = SnapshotRefresher(fetch_stock_data, INDIAN_STOCK_SYMBOLS,
+                                  interval=REFRESH_INTERVAL, on_publish=on_snapshot_published)
+
+
+# Instrumentation (exposed on /metrics)
+register_cache("recommendations", recommendation_cache.cache)
+SNAPSHOT_AGE = Gauge("tradeflow_snapshot_age_seconds", "Seconds since the served stock snapshot was published",
+                     callback=lambda: refresher.status()["snapshot_age"])
+SNAPSHOT_GENERATION = Gauge("tradeflow_snapshot_generation", "Generation of the served stock snapshot",
+                            callback=lambda: refresher.current.generation)
+SNAPSHOT_SYMBOLS = Gauge("tradeflow_snapshot_symbols", "Stocks in the served snapshot",
+                         callback=lambda: len(refresher.current.snapshot))
+
+
+@app.before_request
+def start_refresher():
+    """Makes sure the background refresher is running (also under WSGI servers)"""
+    refresher.start()
+
+
+# Route bodies shared by the Flask routes and asgi_app below; each returns (data, status, headers)
+def still_loading():
+    """Result while stock data hasn't been loaded yet: don't block - ask the client to retry"""
+    refresher.trigger()
+    return {
+        "status": "error",
+        "message": "Stock data is still loading, please retry shortly",
+        "refresh": refresher.status()
+    }, 503, {"Retry-After": "5"}
+
+def refresh_started():
+    """Triggers a background refresh of the stock data - returns immediately"""
+    started = refresher.trigger()
+    return {
+        "status": "accepted" if started else "running",
+        "message": "Refresh started" if started else "A refresh is already in progress",
+        "refresh": refresher.status()
+    }, 202, None
+
+def refresh_status():
+    return {"status": "success", "refresh": refresher.status()}, 200, None
+
+def recommendations_result(read_json):
+    """Recommendations for the profile `read_json()` returns, scored against one consistent snapshot"""
+    published = refresher.current
+    if not published.snapshot:
+        return still_loading()
     
     try:
-        # Get user input from request
-        user_input = request.json
-        
-        # Validate required fields
-        required_fields = [
-            "risk_appetite", "investment_horizon", "investment_goal",
-            "sector_preference", "market_cap_preference", 
-            "dividend_preference", "investment_amount"
-        ]
-        
-        for field in required_fields:
-            if field not in user_input:
-                return jsonify({
-                    "status": "error", 
-                    "message": f"Missing required field: {field}"
-                }), 400
-        
-        # Validate input values
-        if user_input["risk_appetite"] not in ["low", "medium", "high"]:
-            return jsonify({"status": "error", "message": "Invalid risk appetite value"}), 400
-        
-        if user_input["investment_goal"] not in ["growth", "dividends", "both"]:
-            return jsonify({"status": "error", "message": "Invalid investment goal value"}), 400
+        user_input = read_json()
         
-        # Get recommendations - now returns symbols with price guidance
-        recommended_stocks_with_guidance = recommend_stocks(user_input, stock_data)
+        error = validate_user_input(user_input)
+        if error:
+            return {"status": "error", "message": error}, 400, None
         
-        # Format the response
-        result = []
-        for symbol, guidance in recommended_stocks_with_guidance:
-            if symbol in stock_data:
-                # Calculate a match quality score based on various factors
-                result.append({
-                    "symbol": symbol,
-                    "price": stock_data[symbol]["current_price"],
-                    "sector": stock_data[symbol].get("sector", "Unknown"),
-                    "market_cap": stock_data[symbol].get("market_cap", 0),
-                    "beta": stock_data[symbol].get("beta", 1.0),
-                    "dividend_yield": stock_data[symbol].get("dividend_yield", 0),
-                    "change_percent": stock_data[symbol].get("change_percent", 0),
-                    # Add the new price guidance information
-                    "buy_target": guidance["buy_target"],
-                    "sell_target": guidance["sell_target"],
-                    "stop_loss": guidance["stop_loss"],
-                    "strategy": guidance["strategy"]
-                })
-        
-        return jsonify({
+        recommendations, allocation = recommend_for(user_input, published)
+        return {
             "status": "success", 
-            "recommendations": result
-        })
+            "recommendations": recommendations,
+            "allocation": allocation
+        }, 200, None
     
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500, None
 
-if __name__ == "__main__":
-    # Fetch initial stock data when server starts
+def batch_recommendations_result(read_json):
+    """Recommendations for every profile of the batch `read_json()` returns"""
+    published = refresher.current
+    if not published.snapshot:
+        return still_loading()
+    
     try:
-        stock_data = fetch_stock_data(INDIAN_STOCK_SYMBOLS)
-        print(f"Successfully fetched data for {len(stock_data)} stocks")
+        profiles, error = parse_batch(read_json())
+        if error:
+            return {"status": "error", "message": error}, 400, None
+        
+        return {
+            "status": "success",
+            "generation": published.generation,
+            "results": recommend_batch_for(profiles, published)
+        }, 200, None
+    
     except Exception as e:
-        print(f"Error fetching initial stock data: {str(e)}")
+        return {"status": "error", "message": str(e)}, 500, None
+
+def cache_stats():
+    return {"status": "success", "cache": recommendation_cache.stats()}, 200, None
+
+def flask_response(result):
+    data, status, headers = result
+    return jsonify(data), status, headers or {}
+
+@app.route('/fetch-stock-data', methods=['GET'])
+def get_stock_data():
+    """Endpoint to trigger a background refresh of the stock data - returns immediately"""
+    return flask_response(refresh_started())
+
+@app.route('/fetch-stock-data/stream', methods=['GET'])
+def stream_stock_data_refresh():
+    """
+    Triggers a refresh like /fetch-stock-data and streams its progress as NDJSON lines
+    (or Server-Sent Events with ?format=sse or Accept: text/event-stream) until it finishes
+    """
+    fmt = stream_format(request.headers.get('Accept'), request.args.get('format'))
+    watch = RefreshWatch(fmt)
+    
+    def events():
+        while True:
+            chunks, done = watch.poll()
+            yield from chunks
+            if done:
+                return
+            time.sleep(REFRESH_STREAM_POLL)
     
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    return Response(events(), headers=stream_headers(fmt))
+
+# How often a refresh progress stream checks the refresher, and how long it follows one refresh
+REFRESH_STREAM_POLL = 0.25
+REFRESH_STREAM_TIMEOUT = 1800
+REFRESH_STREAM_HEARTBEAT = 15
+
+class RefreshWatch:
+    """
+    Triggers a refresh and turns the refresher's status into stream events: 'start', 'progress'
+    whenever the number of fetched symbols changes, and 'end' (with the final status) when the
+    refresh is over.
+    """
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.initial = refresher.status()
+        self.started = refresher.trigger()
+        self.deadline = time.monotonic() + REFRESH_STREAM_TIMEOUT
+        self.last_sent = None
+        self.last_progress = None
+
+    def poll(self):
+        """Returns (chunks to send, whether the stream is finished)"""
+        status = refresher.status()
+        chunks = []
+        if self.last_sent is None:
+            chunks.append(encode_event(self.fmt, "start", {
+                "status": "accepted" if self.started else "running",
+                "refresh": status,
+            }))
+        
+        running = status.get("state") == "running"
+        progress = (status.get("completed"), status.get("total"))
+        if running and progress != self.last_progress:
+            self.last_progress = progress
+            chunks.append(encode_event(self.fmt, "progress", {"completed": progress[0], "total": progress[1]}))
+        
+        # Over once the refresh that was running (or that this request started) is no longer running
+        if self.initial.get("state") == "running" or not self.started:
+            finished = not running
+        else:
+            finished = not running and status.get("started_at") != self.initial.get("started_at")
+        timed_out = time.monotonic() > self.deadline
+        if finished or timed_out:
+            chunks.append(encode_event(self.fmt, "end", {
+                "status": "timeout" if not finished else "error" if status.get("last_error") else "success",
+                "refresh": status,
+            }))
+        elif not chunks and time.monotonic() - self.last_sent > REFRESH_STREAM_HEARTBEAT:
+            chunks.append(encode_heartbeat(self.fmt))
+        
+        if chunks:
+            self.last_sent = time.monotonic()
+        return chunks, finished or timed_out
+
+@app.route('/fetch-stock-data/status', methods=['GET'])
+def get_stock_data_status():
+    """Endpoint to check progress of the current refresh and the age of the served snapshot"""
+    return flask_response(refresh_status())
+
+@app.route('/recommend', methods=['POST'])
+def get_recommendations():
+    """Endpoint to get stock recommendations based on user input"""
+    return flask_response(recommendations_result(request.get_json))
+
+def validate_user_input(user_input):
+    """Returns an error message for an invalid recommendation request, or None"""
+    # Validate required fields
+    required_fields = [
+        "risk_appetite", "investment_horizon", "investment_goal",
+        "sector_preference", "market_cap_preference", 
+        "dividend_preference", "investment_amount"
+    ]
+    
+    for field in required_fields:
+        if field not in user_input:
+            return f"Missing required field: {field}"
+    
+    # Validate input values
+    if user_input["risk_appetite"] not in ["low", "medium", "high"]:
+        return "Invalid risk appetite value"
+    
+    if user_input["investment_goal"] not in ["growth", "dividends", "both"]:
+        return "Invalid investment goal value"
+    
+    investment_amount = user_input["investment_amount"]
+    if (isinstance(investment_amount, bool) or not isinstance(investment_amount, (int, float))
+            or not math.isfinite(investment_amount) or investment_amount < 0):
+        return "Invalid investment amount"
+    
+    if user_input.get("allocation_method", DEFAULT_ALLOCATION_METHOD) not in ALLOCATION_METHODS:
+        return "Invalid allocation method"
+    return None
+
+def recommend_for(user_input, published):
+    """
+    Recommendations with price guidance for a validated profile, formatted for the response,
+    and the allocation of its investment amount: (recommendations, allocation)
+    """
+    # Get recommendations - now returns symbols with price guidance
+    snapshot = published.snapshot
+    recommended_stocks_with_guidance = recommendation_cache.recommend(
+        user_input, snapshot, published.generation)
+    return allocate_recommendations(format_recommendations(recommended_stocks_with_guidance, snapshot),
+                                    user_input, snapshot)
+
+def allocate_recommendations(recommendations, user_input, snapshot):
+    """
+    Splits the profile's investment amount across formatted recommendations in whole shares,
+    weighted by the snapshot's returns covariance (see allocation.py). Adds each stock's
+    target_weight, shares and allocated_amount; returns (recommendations, allocation summary).
+    """
+    positions, allocation = allocate(
+        [recommendation["symbol"] for recommendation in recommendations],
+        [recommendation["price"] for recommendation in recommendations],
+        snapshot.risk, float(user_input["investment_amount"]),
+        user_input.get("allocation_method", DEFAULT_ALLOCATION_METHOD))
+    for recommendation in recommendations:
+        recommendation.update(positions[recommendation["symbol"]])
+    return recommendations, allocation
+
+def format_recommendations(recommended_stocks_with_guidance, snapshot, rows=None):
+    """
+    Response entries for (symbol, guidance) pairs. `rows` can carry snapshot rows
+    already read for earlier profiles of a batch.
+    """
+    if rows is None:
+        rows = {}
+    result = []
+    for symbol, guidance in recommended_stocks_with_guidance:
+        if symbol in snapshot:
+            # Snapshot rows are built on access, so read each one once
+            data = rows.get(symbol)
+            if data is None:
+                data = rows[symbol] = snapshot[symbol]
+            result.append({
+                "symbol": symbol,
+                "price": data["current_price"],
+                "sector": data.get("sector", "Unknown"),
+                "market_cap": data.get("market_cap", 0),
+                "beta": data.get("beta", 1.0),
+                "dividend_yield": data.get("dividend_yield", 0),
+                "change_percent": data.get("change_percent", 0),
+                # Add the new price guidance information
+                "buy_target": guidance["buy_target"],
+                "sell_target": guidance["sell_target"],
+                "stop_loss": guidance["stop_loss"],
+                "strategy": guidance["strategy"]
+            })
+    return result
+
+# Most profiles one /recommend/batch request may carry
+MAX_BATCH_PROFILES = 10000
+
+def parse_batch(body):
+    """
+    Returns (profiles, error) for a /recommend/batch body: {"profiles": [profile, ...]}.
+    Every profile must pass validate_user_input.
+    """
+    profiles = body.get("profiles") if isinstance(body, dict) else None
+    if not isinstance(profiles, list) or not profiles:
+        return None, "Expected a non-empty \"profiles\" list"
+    if len(profiles) > MAX_BATCH_PROFILES:
+        return None, f"At most {MAX_BATCH_PROFILES} profiles per batch"
+    for i, profile in enumerate(profiles):
+        error = validate_user_input(profile) if isinstance(profile, dict) else "Profile must be an object"
+        if error:
+            return None, f"Profile {i}: {error}"
+    return profiles, None
+
+def recommend_batch_for(profiles, published):
+    """Formatted recommendations for every profile of a batch, in order"""
+    snapshot = published.snapshot
+    batch = recommendation_cache.recommend_batch(profiles, snapshot, published.generation)
+    rows = {}
+    results = []
+    for profile, recommendations in zip(profiles, batch):
+        recommendations, allocation = allocate_recommendations(
+            format_recommendations(recommendations, snapshot, rows), profile, snapshot)
+        results.append({"recommendations": recommendations, "allocation": allocation})
+    return results
+
+@app.route('/recommend/batch', methods=['POST'])
+def get_batch_recommendations():
+    """
+    Endpoint to get recommendations for many profiles at once, e.g. a whole client book:
+    {"profiles": [...]} -> {"results": [{"recommendations": [...], "allocation": {...}}, ...]} in the same order
+    """
+    return flask_response(batch_recommendations_result(request.get_json))
+
+@app.route('/recommend/cache-stats', methods=['GET'])
+def get_recommendation_cache_stats():
+    """Endpoint to inspect recommendation cache hit/miss counters"""
+    return flask_response(cache_stats())
+
+# Asyncio serving mode (e.g. uvicorn app:asgi_app --port 5001). Scoring runs on a small
+# executor so a burst of uncached profiles can't stall the event loop serving everyone else
+SCORING_WORKERS = min(4, os.cpu_count() or 1)
+scoring_executor = ThreadPoolExecutor(max_workers=SCORING_WORKERS, thread_name_prefix="scoring")
+asgi_app = ASGIApp()
+asgi_app.on_startup(refresher.start)
+
+@asgi_app.route('/fetch-stock-data')
+async def get_stock_data_async(request):
+    return json_response(*refresh_started())
+
+@asgi_app.route('/fetch-stock-data/stream')
+async def stream_stock_data_refresh_async(request):
+    fmt = stream_format(request.headers.get('accept'), request.args.get('format'))
+    watch = RefreshWatch(fmt)
+    
+    async def events():
+        while True:
+            chunks, done = watch.poll()
+            for chunk in chunks:
+                yield chunk
+            if done:
+                return
+            await asyncio.sleep(REFRESH_STREAM_POLL)
+    
+    return StreamingResponse(events(), headers=stream_headers(fmt))
+
+@asgi_app.route('/fetch-stock-data/status')
+async def get_stock_data_status_async(request):
+    return json_response(*refresh_status())
+
+@asgi_app.route('/recommend', methods=['POST'])
+async def get_recommendations_async(request):
+    return json_response(*await asyncio.get_running_loop().run_in_executor(
+        scoring_executor, recommendations_result, request.json))
+
+@asgi_app.route('/recommend/batch', methods=['POST'])
+async def get_batch_recommendations_async(request):
+    return json_response(*await asyncio.get_running_loop().run_in_executor(
+        scoring_executor, batch_recommendations_result, request.json))
+
+@asgi_app.route('/recommend/cache-stats')
+async def get_recommendation_cache_stats_async(request):
+    return json_response(*cache_stats())
+
+def publish_snapshots():
+    """Runs the single refresher of production mode, publishing to TRADEFLOW_SNAPSHOT_FILE"""
+    if not SNAPSHOT_FILE:
+        sys.exit("Set TRADEFLOW_SNAPSHOT_FILE to the file the server workers read the snapshot from")
+    publisher = SharedSnapshotPublisher(SNAPSHOT_FILE)
+    publisher.serve(SnapshotRefresher(fetch_stock_data, INDIAN_STOCK_SYMBOLS,
+                                      interval=REFRESH_INTERVAL, on_publish=publisher.publish))
+
+if __name__ == "__main__":
+    if "--publish" in sys.argv:
+        publish_snapshots()
+    else:
+        # Start fetching stock data in the background; the server accepts requests right away
+        refresher.start()
+        
+        app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
@@ -0,0 +1,267 @@
+import asyncio
+import json
+import re
+import time
+import traceback
+from urllib.parse import parse_qs
+
+from metrics import CONTENT_TYPE, REGISTRY, REQUESTS, REQUEST_SECONDS
+from responses import dumps
+
+
+class Request:
+    """The parts of an HTTP request the handlers use"""
+
+    def __init__(self, scope, body, path_params):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        self.args = {name: values[-1] for name, values in query.items()}
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1")
+                        for name, value in scope.get("headers", [])}
+        self.body = body
+        self.path_params = path_params
+
+    def json(self):
+        """The request body parsed as JSON (None when empty)"""
+        return json.loads(self.body) if self.body else None
+
+
+class Response:
+    def __init__(self, body=b"", status=200, headers=None, content_type="application/json"):
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.status = status
+        self.headers = dict(headers or {})
+        if content_type is not None:
+            self.headers.setdefault("Content-Type", content_type)
+
+
+class StreamingResponse(Response):
+    """Response whose body is sent chunk by chunk as an async iterator of bytes produces it"""
+
+    def __init__(self, chunks, status=200, headers=None, content_type=None):
+        super().__init__(b"", status, headers, content_type)
+        self.chunks = chunks
+
+
+class WebSocket:
+    """Server side of an ASGI WebSocket connection exchanging JSON messages"""
+
+    def __init__(self, scope, receive, send, path_params):
+        self.path = scope["path"]
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        self.args = {name: values[-1] for name, values in query.items()}
+        self.path_params = path_params
+        self.closed = False
+        self._receive = receive
+        self._send = send
+
+    async def accept(self):
+        message = await self._receive()
+        if message["type"] != "websocket.connect":
+            raise ConnectionError("WebSocket closed before it was accepted")
+        await self._send({"type": "websocket.accept"})
+
+    async def receive_json(self):
+        """Next message parsed as JSON, or None once the client has disconnected"""
+        while True:
+            message = await self._receive()
+            if message["type"] == "websocket.disconnect":
+                self.closed = True
+                return None
+            if message["type"] == "websocket.receive":
+                text = message.get("text")
+                if text is None:
+                    text = (message.get("bytes") or b"").decode("utf-8")
+                return json.loads(text)
+
+    async def send_json(self, data):
+        await self._send({"type": "websocket.send", "text": json.dumps(data, sort_keys=True)})
+
+    async def close(self, code=1000):
+        if not self.closed:
+            self.closed = True
+            await self._send({"type": "websocket.close", "code": code})
+
+
+def json_response(data, status=200, headers=None):
+    """JSON response encoded the way Flask's jsonify does (sorted keys, trailing newline)"""
+    return Response(dumps(data), status, headers)
+
+
+class ASGIApp:
+    """
+    Minimal ASGI application: routes, startup hooks, CORS and the same request metrics
+    and /metrics endpoint as instrument_app. Handlers are coroutines taking a Request
+    and returning a Response, so any ASGI server can run it (e.g. uvicorn module:asgi_app).
+    """
+
+    def __init__(self, registry=REGISTRY):
+        self.routes = []
+        self.websocket_routes = []
+        self.startup = []
+        self.registry = registry
+        self.route("/metrics")(self._metrics)
+
+    def route(self, rule, methods=("GET",)):
+        """
+        Registers a handler; `<name>` segments of the rule become path parameters. Like
+        Flask, a GET route also answers HEAD (with the GET response minus its body).
+        """
+        pattern = _compile_rule(rule)
+        methods = tuple(methods)
+        if "GET" in methods and "HEAD" not in methods:
+            methods += ("HEAD",)
+
+        def decorator(handler):
+            self.routes.append((rule, pattern, methods, handler))
+            return handler
+        return decorator
+
+    def websocket(self, rule):
+        """Registers a WebSocket handler: a coroutine taking a WebSocket (which it must accept)"""
+        pattern = _compile_rule(rule)
+
+        def decorator(handler):
+            self.websocket_routes.append((rule, pattern, handler))
+            return handler
+        return decorator
+
+    def on_startup(self, hook):
+        """Runs `hook` (a function or coroutine function) when the server starts"""
+        self.startup.append(hook)
+        return hook
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    for hook in self.startup:
+                        result = hook()
+                        if asyncio.iscoroutine(result):
+                            await result
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        started = time.perf_counter()
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        rule, handler, path_params, allowed = "<unmatched>", None, {}, set()
+        for route_rule, pattern, methods, route_handler in self.routes:
+            match = pattern.match(scope["path"])
+            if match is None:
+                continue
+            allowed.update(methods)
+            if scope["method"] in methods:
+                rule, handler, path_params = route_rule, route_handler, match.groupdict()
+                break
+
+        if handler is not None:
+            try:
+                response = await handler(Request(scope, body, path_params))
+            except Exception as e:
+                traceback.print_exc()
+                response = json_response({"error": str(e)}, 500)
+        elif scope["method"] == "OPTIONS" and allowed:
+            # CORS preflight
+            response = Response(status=204, content_type=None, headers={
+                "Access-Control-Allow-Methods": ", ".join(sorted(allowed | {"OPTIONS"})),
+                "Access-Control-Allow-Headers": _header(scope, b"access-control-request-headers") or "*",
+            })
+        elif allowed:
+            response = json_response({"error": "Method not allowed"}, 405,
+                                     {"Allow": ", ".join(sorted(allowed))})
+        else:
+            response = json_response({"error": "Not found"}, 404)
+
+        # Same as CORS(app) on the Flask apps
+        response.headers.setdefault("Access-Control-Allow-Origin", "*")
+        await send_response(send, response, scope["method"] == "HEAD", receive)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=rule)
+        REQUESTS.inc(method=scope["method"], route=rule, status=response.status)
+
+    async def _websocket(self, scope, receive, send):
+        for rule, pattern, handler in self.websocket_routes:
+            match = pattern.match(scope["path"])
+            if match is not None:
+                websocket = WebSocket(scope, receive, send, match.groupdict())
+                try:
+                    await handler(websocket)
+                finally:
+                    await websocket.close()
+                return
+        # Closing before accepting rejects the handshake (HTTP 403)
+        await send({"type": "websocket.close", "code": 1000})
+
+    async def _metrics(self, request):
+        return Response(self.registry.render(), content_type=CONTENT_TYPE)
+
+
+async def send_response(send, response, head=False, receive=None):
+    headers = [(name.lower().encode("latin-1"), str(value).encode("latin-1"))
+               for name, value in response.headers.items()]
+    if isinstance(response, StreamingResponse):
+        await send({"type": "http.response.start", "status": response.status, "headers": headers})
+        # Stop producing a (possibly endless) stream once the client has gone away
+        disconnected = asyncio.ensure_future(_disconnected(receive)) if receive is not None else None
+        try:
+            if not head:
+                async for chunk in response.chunks:
+                    if disconnected is not None and disconnected.done():
+                        return
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        finally:
+            if disconnected is not None:
+                disconnected.cancel()
+            if hasattr(response.chunks, "aclose"):
+                await response.chunks.aclose()
+        await send({"type": "http.response.body", "body": b""})
+        return
+    headers.append((b"content-length", str(len(response.body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": response.status, "headers": headers})
+    await send({"type": "http.response.body", "body": b"" if head else response.body})
+
+
+async def _disconnected(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def _compile_rule(rule):
+    return re.compile("^" + re.sub(r"<(\w+)>", r"(?P<\1>[^/]+)", rule) + "$")
+
+
+def _header(scope, name):
+    for header, value in scope.get("headers", []):
+        if header.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def etag_matches(request, etag):
+    """Whether the request's If-None-Match header names `etag` (for 304 Not Modified)"""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = [tag.strip().removeprefix("W/").strip('"') for tag in header.split(",")]
+    return "*" in tags or etag in tags
@@ -0,0 +1,431 @@
+"""
+Backtests the recommendation rules (score_all_stocks / recommend_stocks) and the buy, sell
+and stop loss levels of generate_price_guidance on the daily bars in the local price store.
+
+At every rebalance date the snapshot the recommender would have seen is rebuilt from the
+bars up to that day, every profile combination gets its recommendations, and those are
+held (equal weight) until the next rebalance. Every recommendation is also traded by its
+price guidance: a buy order at buy_target, then out at sell_target or stop_loss.
+Scoring, selection and the trade simulation are vectorized across tickers and profiles,
+so a sweep over years of data and thousands of profiles takes minutes.
+
+    python backtest.py                                    # the stock universe, every profile
+    python backtest.py --download 10y                     # backfill the price store first
+    python backtest.py --start 2019-01-01 --rebalance 63 --output backtest.json
+    python backtest.py RELIANCE.NS TCS.NS INFY.NS
+"""
+import argparse
+import itertools
+import json
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicators import MIN_BARS
+from market_data import default_provider
+from price_panel import PricePanel
+from price_store import PRICE_STORE_DIR, PriceStore
+from risk_model import BENCHMARK_SYMBOL, BETA_WINDOWS, SCORING_BETA, daily_returns, window_betas
+from stock_recommender import MAX_RECOMMENDATIONS, guidance_horizon, price_guidance_levels, recommended_rows
+from universe import UniverseSnapshot
+
+# Bars between rebalances; recommendations are held until the next one
+REBALANCE_EVERY = 21
+
+# Bars a guidance buy order stays open, and a filled trade is held at most before it is closed
+ENTRY_BARS = 21
+TRADE_BARS = 252
+
+# Trailing bars the dividend yield is measured over
+DIVIDEND_WINDOW = 252
+
+TRADING_DAYS = 252
+
+# Profile combinations swept. Horizons stand in for every horizon: scoring distinguishes
+# <= 2, 3-5 and > 5 years and the guidance < 2, 2-5 and > 5, so these cover each combination
+RISK_APPETITES = ("low", "medium", "high")
+INVESTMENT_HORIZONS = (1, 2, 3, 6)
+INVESTMENT_GOALS = ("growth", "dividends", "both")
+MARKET_CAP_PREFERENCES = ("all", "large-cap", "mid-cap", "small-cap")
+DIVIDEND_PREFERENCES = ("yes", "no")
+
+# The price guidance only depends on the risk appetite and the horizon range; one
+# investment horizon stands in for each range
+GUIDANCE_HORIZONS = {"short": 1, "medium": 3, "long": 6}
+GUIDANCE_VARIANTS = tuple(itertools.product(RISK_APPETITES, GUIDANCE_HORIZONS.values()))
+
+# Variant x bar x ticker cells per vectorized trade simulation pass (bounds memory)
+GUIDANCE_CELLS = 20_000_000
+
+# Trade outcomes
+NOT_FILLED, TARGET, STOP, EXPIRED = 0, 1, 2, 3
+
+# Profile fields the report is broken down by
+PROFILE_FIELDS = ("risk_appetite", "investment_horizon", "investment_goal", "sector_preference",
+                  "market_cap_preference", "dividend_preference")
+
+
+def profile_grid(sectors):
+    """Every combination of the swept preferences, with "all" and each of `sectors`"""
+    sector_preferences = ["all"] + sorted({sector.lower() for sector in sectors})
+    return [dict(zip(PROFILE_FIELDS, values)) for values in itertools.product(
+        RISK_APPETITES, INVESTMENT_HORIZONS, INVESTMENT_GOALS, sector_preferences,
+        MARKET_CAP_PREFERENCES, DIVIDEND_PREFERENCES)]
+
+
+def load_panel(symbols, store, start=None, end=None):
+    """PricePanel of every stored bar of `symbols` (and the benchmark index) between start and end"""
+    panel = PricePanel(bars=None, fields=("Open", "High", "Low", "Close", "Dividends"))
+    histories = {}
+    for symbol in list(symbols) + [BENCHMARK_SYMBOL]:
+        history = store.read(symbol)
+        if history is not None:
+            histories[symbol] = history.loc[start:end]
+    panel.merge(histories)
+    return panel
+
+
+def backfill(store, symbols, period):
+    """Downloads `period` of history for `symbols` and the benchmark index into the price store"""
+    from stock_data import load_price_history
+
+    downloaded = load_price_history(list(symbols) + [BENCHMARK_SYMBOL], period=period)
+    for symbol, history in downloaded.items():
+        store.append(symbol, history)
+    return len(downloaded)
+
+
+class Backtest:
+    """
+    Replays the recommender over a PricePanel of daily bars. `fundamentals` are today's
+    {symbol: provider info}; they supply what the bars can't: sectors, and the share counts
+    that turn each day's close into a market cap (assumed constant). Betas, dividend yields
+    and daily changes come only from the bars up to each rebalance date; what is still
+    taken from today is listed by `caveats`, which the report carries.
+    """
+
+    def __init__(self, panel, fundamentals, rebalance_every=REBALANCE_EVERY, benchmark=BENCHMARK_SYMBOL):
+        dates, symbols, prices = panel.arrays()
+        tickers = [i for i, symbol in enumerate(symbols) if symbol != benchmark]
+        self.dates = dates
+        self.symbols = tuple(symbols[i] for i in tickers)
+        raw = prices["Close"]
+        closes = pd.DataFrame(raw).ffill().to_numpy()
+        returns, observed = daily_returns(pd.DataFrame(raw))
+
+        self.present = ~np.isnan(raw[:, tickers])
+        self.close = closes[:, tickers]  # Forward filled, so every ticker has a value once listed
+        self.open, self.high, self.low = (prices[field][:, tickers] for field in ("Open", "High", "Low"))
+        self.dividends = np.nan_to_num(prices["Dividends"][:, tickers])
+        self.bars = np.cumsum(self.present, axis=0)
+        self.returns, self.observed = returns[:, tickers], observed[:, tickers]
+        self.benchmark = benchmark if benchmark in symbols else None
+        if self.benchmark is not None:
+            column = symbols.index(benchmark)
+            self.benchmark_close = closes[:, column]
+            self.benchmark_returns = np.where(observed[:, column], returns[:, column], np.nan)
+
+        info = [fundamentals.get(symbol) or {} for symbol in self.symbols]
+        sectors = [row.get("sector", row.get("industry", "Unknown")) or "Unknown" for row in info]
+        self.sectors = tuple(sorted(set(sectors)))
+        self.sector_codes = np.array([self.sectors.index(sector) for sector in sectors], dtype=np.int16)
+        last_close = closes[-1, tickers] if len(dates) else np.empty(0)
+        market_cap = np.array([_number(row.get("marketCap", row.get("totalAssets")), 0.0) for row in info])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.shares = np.where(last_close > 0, market_cap / last_close, 0.0)
+
+        # A year of returns before the first rebalance, so the scoring beta has its full window
+        first = min(BETA_WINDOWS[SCORING_BETA], max(len(dates) - 2, 0))
+        self.rebalances = np.arange(first, len(dates) - 1, rebalance_every)
+
+    def snapshot(self, row):
+        """UniverseSnapshot as the recommender would have built it at the close of `row`"""
+        close = self.close[row]
+        beta = np.full_like(close, np.nan)
+        if self.benchmark is not None:
+            # The scoring window, then shorter ones for stocks listed too recently to fill it
+            scoring = BETA_WINDOWS[SCORING_BETA]
+            for window in sorted(BETA_WINDOWS.values(), key=lambda window: (window != scoring, -window)):
+                if not np.isnan(beta).any():
+                    break
+                beta = np.where(np.isnan(beta), window_betas(
+                    self.returns[:row], self.observed[:row], self.benchmark_returns[:row], window), beta)
+        # Stocks without enough bars for any window (or without index bars) count as market risk
+        beta = np.where(np.isnan(beta) | (beta == 0), 1.0, beta)
+        previous = self.close[row - 1] if row > 0 else np.full_like(close, np.nan)
+        dividends = self.dividends[max(row + 1 - DIVIDEND_WINDOW, 0):row + 1].sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change_percent = np.where(previous > 0, (close - previous) / previous * 100, 0.0)
+            dividend_yield = np.where(close > 0, dividends / close, 0.0)
+        columns = {
+            "current_price": close,
+            "beta": beta,
+            "market_cap": self.shares * close,
+            "dividend_yield": dividend_yield,
+            "change_percent": change_percent,
+        }
+        valid = self.present[row] & (self.bars[row] >= MIN_BARS)
+        return UniverseSnapshot(self.symbols, columns, self.sectors, self.sector_codes, valid,
+                                created_at=pd.Timestamp(self.dates[row]).timestamp())
+
+    @property
+    def caveats(self):
+        """Where the backtest still knows more than the recommender did on each rebalance date"""
+        caveats = [
+            "Lookahead: market caps are each day's close times today's share count (today's provider "
+            "market cap over the last stored close), so market-cap preferences sort stocks by today's size.",
+            "Lookahead: sectors are today's provider sectors.",
+            "Survivorship: the universe is today's ticker list, so stocks delisted or dropped from it "
+            "before today are missing and returns are likely overstated.",
+        ]
+        if self.benchmark is None:
+            caveats.append("No benchmark index bars: every beta is 1.0, so the risk rules don't separate stocks.")
+        if not self.dividends.any():
+            caveats.append("The stored bars hold no dividends: every dividend yield is 0.")
+        return caveats
+
+    @property
+    def exits(self):
+        """Row each rebalance's holdings are valued (and sold) at: the next rebalance, or the last bar"""
+        return np.append(self.rebalances[1:], len(self.dates) - 1)
+
+    def run(self, profiles, progress=None):
+        """
+        Backtests every profile. Returns (report, benchmark): a DataFrame with one row per
+        profile - its preferences, then the performance of its recommendations and of their
+        price guidance trades - and the same performance figures for the benchmark.
+        """
+        rebalances, exits = self.rebalances, self.exits
+        variants = np.array([GUIDANCE_VARIANTS.index((profile["risk_appetite"],
+                                                      GUIDANCE_HORIZONS[guidance_horizon(
+                                                          profile["investment_horizon"])]))
+                             for profile in profiles])
+        picks = np.full((len(rebalances), len(profiles), MAX_RECOMMENDATIONS), -1, dtype=np.intp)
+        forward = np.full((len(rebalances), len(self.symbols) + 1), np.nan)  # Last column: no pick
+        trades = {name: np.full((len(rebalances), len(GUIDANCE_VARIANTS), len(self.symbols) + 1), fill)
+                  for name, fill in (("outcome", NOT_FILLED), ("return", np.nan), ("bars", np.nan))}
+
+        for k, (row, exit_row) in enumerate(zip(rebalances, exits)):
+            snapshot = self.snapshot(row)
+            for p, picked in enumerate(recommended_rows(snapshot, profiles)):
+                picks[k, p, :len(picked)] = picked
+            with np.errstate(divide="ignore", invalid="ignore"):
+                forward[k, :-1] = np.where(snapshot.valid, self.close[exit_row] / self.close[row] - 1, np.nan)
+            held = np.unique(picks[k][picks[k] >= 0])
+            for name, values in self.trade(row, held, snapshot).items():
+                trades[name][k][:, held] = values
+            if progress is not None:
+                progress(k + 1, len(rebalances))
+
+        # Recommendations: equal weight until the next rebalance, uninvested without picks
+        # (unused pick slots index the last column, which holds no return or trade)
+        periods = np.arange(len(rebalances))[:, None, None]
+        picked = picks >= 0
+        pick_returns = forward[periods, picks]
+        with np.errstate(invalid="ignore"):
+            period = np.nan_to_num(np.nanmean(pick_returns, axis=2))
+        benchmark_period = self.benchmark_periods(forward)
+        benchmark = {name: float(values[0]) for name, values in self.performance(benchmark_period[:, None]).items()}
+        report = pd.DataFrame(profiles).join(pd.DataFrame(self.performance(period)))
+        report["excess_return"] = report["total_return"] - benchmark["total_return"]
+        report["beat_benchmark"] = (period > benchmark_period[:, None]).mean(axis=0)
+        report["pick_hit_rate"] = _ratio((pick_returns > 0) & picked, picked & ~np.isnan(pick_returns))
+
+        # Guidance: every pick traded by its profile's levels
+        cells = (periods, variants[None, :, None], picks)
+        outcome, trade_return, bars = (trades[name][cells] for name in ("outcome", "return", "bars"))
+        filled = picked & (outcome != NOT_FILLED)
+        report["guidance_trades"] = picked.sum(axis=(0, 2))
+        report["guidance_fill_rate"] = _ratio(filled, picked)
+        report["guidance_target_rate"] = _ratio(outcome == TARGET, filled)
+        report["guidance_stop_rate"] = _ratio(outcome == STOP, filled)
+        report["guidance_expired_rate"] = _ratio(outcome == EXPIRED, filled)
+        report["guidance_win_rate"] = _ratio(filled & (trade_return > 0), filled)
+        with np.errstate(invalid="ignore"):
+            report["guidance_average_return"] = np.nanmean(np.where(filled, trade_return, np.nan), axis=(0, 2))
+            report["guidance_average_bars"] = np.nanmean(np.where(filled, bars, np.nan), axis=(0, 2))
+        return report, benchmark
+
+    def benchmark_periods(self, forward):
+        """
+        Return of the benchmark index over each holding period, or of the equal weight universe
+        (from the `forward` returns of every ticker) without full index history
+        """
+        if self.benchmark is not None:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                returns = self.benchmark_close[self.exits] / self.benchmark_close[self.rebalances] - 1
+            if not np.isnan(returns).any():
+                return returns
+        with np.errstate(invalid="ignore"):
+            return np.nan_to_num(np.nanmean(forward[:, :-1], axis=1))
+
+    def performance(self, period):
+        """Return and risk of a (holding periods x portfolios) matrix of holding period returns"""
+        bars = max(self.exits[-1] - self.rebalances[0], 1)
+        equity = np.cumprod(1 + period, axis=0)
+        peak = np.maximum.accumulate(np.vstack([np.ones((1, period.shape[1])), equity]), axis=0)[1:]
+        total = equity[-1] - 1
+        return {
+            "total_return": total,
+            "annual_return": (1 + total) ** (TRADING_DAYS / bars) - 1,
+            "annual_volatility": (period.std(axis=0, ddof=1) * math.sqrt(TRADING_DAYS * len(period) / bars)
+                                  if len(period) > 1 else np.full(period.shape[1], np.nan)),
+            "max_drawdown": (1 - equity / peak).max(axis=0),
+        }
+
+    def trade(self, row, held, snapshot):
+        """
+        Simulates the price guidance of the stocks `held` (ticker indices) recommended at the
+        close of `row`, for every guidance variant at once: a buy order at buy_target open for
+        ENTRY_BARS (filled at the open if the price gaps below it), then out at sell_target or
+        stop_loss, whichever is reached first (the stop when both are on the same bar, gaps
+        filled at the open), or at the close TRADE_BARS later. The bars after the last one
+        stored close the trade too.
+        Returns {"outcome", "return", "bars"}, each a (variants, held) array.
+        """
+        window = slice(row + 1, min(row + 1 + TRADE_BARS, len(self.dates)))
+        bars = window.stop - window.start
+        results = {"outcome": np.full((len(GUIDANCE_VARIANTS), len(held)), NOT_FILLED),
+                   "return": np.full((len(GUIDANCE_VARIANTS), len(held)), np.nan),
+                   "bars": np.full((len(GUIDANCE_VARIANTS), len(held)), np.nan)}
+        if not bars or not len(held):
+            return results
+        risk = np.array([risk for risk, _ in GUIDANCE_VARIANTS])[:, None]
+        horizon = np.array([horizon for _, horizon in GUIDANCE_VARIANTS])[:, None]
+        chunk = max(1, GUIDANCE_CELLS // (len(GUIDANCE_VARIANTS) * bars))
+        for start in range(0, len(held), chunk):
+            columns = held[start:start + chunk]
+            buy, sell, stop = (np.round(level, 2) for level in price_guidance_levels(
+                snapshot.columns["current_price"][columns], snapshot.columns["beta"][columns],
+                snapshot.columns["change_percent"][columns], risk, horizon))
+            opens, highs, lows = (values[window][:, columns] for values in (self.open, self.high, self.low))
+            closes = self.close[window][:, columns]
+            steps = np.arange(bars)[None, :, None]
+
+            # Entry: the first bar within ENTRY_BARS whose low reaches the buy target
+            reached = lows[None, :ENTRY_BARS] <= buy[:, None, :]
+            filled = reached.any(axis=1)
+            entry = reached.argmax(axis=1)
+            entry_open = np.take_along_axis(np.broadcast_to(opens, (len(buy),) + opens.shape),
+                                            entry[:, None, :], axis=1)[:, 0]
+            fill_price = np.where(np.isnan(entry_open), buy, np.fmin(entry_open, buy))
+
+            # Exit: targets and stops are watched from the bar after the entry
+            after = steps > entry[:, None, :]
+            target = after & (highs[None] >= sell[:, None, :])
+            stopped = after & (lows[None] <= stop[:, None, :])
+            first_target = np.where(target.any(axis=1), target.argmax(axis=1), bars)
+            first_stop = np.where(stopped.any(axis=1), stopped.argmax(axis=1), bars)
+            outcome = np.select([(first_stop == bars) & (first_target == bars), first_stop <= first_target],
+                                [EXPIRED, STOP], TARGET)
+            exit_bar = np.minimum(np.minimum(first_target, first_stop), bars - 1)
+            exit_open = np.take_along_axis(np.broadcast_to(opens, (len(buy),) + opens.shape),
+                                           exit_bar[:, None, :], axis=1)[:, 0]
+            exit_price = np.select(
+                [outcome == TARGET, outcome == STOP],
+                [np.fmax(exit_open, sell), np.fmin(exit_open, stop)],
+                np.broadcast_to(closes[-1], buy.shape))
+
+            selected = slice(start, start + chunk)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                results["return"][:, selected] = np.where(filled, exit_price / fill_price - 1, np.nan)
+            results["outcome"][:, selected] = np.where(filled, outcome, NOT_FILLED)
+            results["bars"][:, selected] = np.where(filled, exit_bar - entry, np.nan)
+        return results
+
+
+def summarize(report, benchmark):
+    """JSON-ready summary: the overall averages and the averages by each profile preference"""
+    metrics = [column for column in report.columns if column not in PROFILE_FIELDS]
+    summary = {
+        "benchmark": benchmark,
+        "overall": _records(report[metrics].mean()),
+        "by": {field: {str(value): _records(row) for value, row in report.groupby(field)[metrics].mean().iterrows()}
+               for field in PROFILE_FIELDS},
+    }
+    return summary
+
+
+def _ratio(numerator, denominator):
+    """Per profile share of `denominator` cells (axes 0 and 2) that are also `numerator` cells"""
+    count = denominator.sum(axis=(0, 2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(count > 0, (numerator & denominator).sum(axis=(0, 2)) / count, np.nan)
+
+
+def _records(values):
+    return {name: (None if value is None or (isinstance(value, float) and math.isnan(value))
+                   else round(float(value), 6)) for name, value in values.items()}
+
+
+def _number(value, default):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return default if math.isnan(value) else value
+
+
+def main(argv=None):
+    from stock_symbols import INDIAN_STOCK_SYMBOLS
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("symbols", nargs="*", help="Tickers to backtest (default: the stock universe)")
+    parser.add_argument("--start", help="First date of bars used (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last date of bars used (YYYY-MM-DD)")
+    parser.add_argument("--rebalance", type=int, default=REBALANCE_EVERY, help="Bars between rebalances")
+    parser.add_argument("--store", default=PRICE_STORE_DIR, help="Price store directory")
+    parser.add_argument("--download", metavar="PERIOD", help="Backfill the store with PERIOD (e.g. 10y) first")
+    parser.add_argument("--output", default="backtest.json", help="Where to write the JSON report")
+    args = parser.parse_args(argv)
+
+    symbols = args.symbols or list(dict.fromkeys(INDIAN_STOCK_SYMBOLS))
+    store = PriceStore(args.store)
+    if args.download:
+        print(f"Downloaded {backfill(store, symbols, args.download)} histories")
+
+    started = time.perf_counter()
+    provider = default_provider()
+    fundamentals = {}
+    for symbol in symbols:
+        try:
+            fundamentals[symbol] = provider.fundamentals(symbol)
+        except Exception as e:
+            print(f"No fundamentals for {symbol} ({str(e)}).")
+    backtest = Backtest(load_panel(symbols, store, args.start, args.end), fundamentals, args.rebalance)
+    if not len(backtest.rebalances):
+        parser.error("not enough stored history to backtest - try --download 10y")
+    profiles = profile_grid(backtest.sectors)
+    print(f"Backtesting {len(profiles)} profiles on {len(backtest.symbols)} tickers, "
+          f"{len(backtest.rebalances)} rebalances from {pd.Timestamp(backtest.dates[backtest.rebalances[0]]).date()}"
+          f" to {pd.Timestamp(backtest.dates[-1]).date()}")
+    report, benchmark = backtest.run(profiles, progress=lambda done, total: print(f"  {done}/{total}", end="\r"))
+    benchmark = _records(benchmark)
+    results = {
+        "start": str(pd.Timestamp(backtest.dates[backtest.rebalances[0]]).date()),
+        "end": str(pd.Timestamp(backtest.dates[-1]).date()),
+        "rebalance_every": args.rebalance,
+        "rebalances": len(backtest.rebalances),
+        "tickers": len(backtest.symbols),
+        "benchmark_symbol": backtest.benchmark or "equal weight universe",
+        "seconds": round(time.perf_counter() - started, 2),
+        "caveats": backtest.caveats,
+        "summary": summarize(report, benchmark),
+        "profiles": json.loads(report.to_json(orient="records")),
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+
+    columns = ["total_return", "annual_return", "max_drawdown", "beat_benchmark", "guidance_fill_rate",
+               "guidance_target_rate", "guidance_stop_rate", "guidance_average_return"]
+    print(f"\nBenchmark ({results['benchmark_symbol']}): {benchmark}")
+    print(report.groupby("risk_appetite")[columns].mean().round(4).to_string())
+    print(f"\n{len(report)} profiles in {results['seconds']}s, report written to {args.output}")
+    print("\n".join(["\nCaveats:"] + [f"  - {caveat}" for caveat in results["caveats"]]))
+
+
+if __name__ == "__main__":
+    main()
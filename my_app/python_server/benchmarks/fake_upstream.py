@@ -0,0 +1,114 @@
+import json
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from market_data import ReplayProvider
+from risk_model import BENCHMARK_SYMBOL
+from universe import UniverseSnapshot
+
+# Synthetic universe shape
+SECTORS = ("Technology", "Financial Services", "Energy", "Healthcare", "Consumer Defensive",
+           "Industrials", "Basic Materials", "Utilities")
+HISTORY_BARS = 500          # Daily bars recorded per symbol (enough for MA200 and a 1y window)
+HISTORY_END = "2026-10-16"  # Last recorded trading day
+
+
+def synthetic_symbols(count):
+    """Stable, made-up NSE-style symbols"""
+    return [f"SYN{i:05d}.NS" for i in range(count)]
+
+
+def _rng(symbol, seed):
+    return np.random.default_rng([zlib.crc32(symbol.encode()), seed])
+
+
+def synthetic_market(bars=HISTORY_BARS, seed=0):
+    """Daily returns of the synthetic market every history loads on (the benchmark index's returns)"""
+    return np.random.default_rng([zlib.crc32(BENCHMARK_SYMBOL.encode()), seed]).normal(0.0003, 0.01, bars)
+
+
+def synthetic_history(symbol, bars=HISTORY_BARS, end=HISTORY_END, seed=0):
+    """
+    Geometric random-walk OHLCV history with occasional dividends. Returns load on the
+    synthetic market with a per-symbol beta (the benchmark index itself has beta 1)
+    """
+    rng = _rng(symbol, seed)
+    index = pd.bdate_range(end=end, periods=bars, name="Date")
+    beta = 1.0 if symbol == BENCHMARK_SYMBOL else rng.uniform(0.3, 2.0)
+    noise = 0.0 if symbol == BENCHMARK_SYMBOL else rng.uniform(0.005, 0.025)
+    returns = beta * synthetic_market(bars, seed) + rng.normal(0, noise, bars)
+    close = rng.uniform(50, 3000) * np.exp(np.cumsum(returns))
+    spread = np.abs(rng.normal(0, 0.01, bars))
+    dividends = np.where(rng.random(bars) < 0.01, close * rng.uniform(0.002, 0.01), 0.0)
+    return pd.DataFrame({
+        "Open": close * (1 + rng.normal(0, 0.003, bars)),
+        "High": close * (1 + spread),
+        "Low": close * (1 - spread),
+        "Close": close,
+        "Volume": rng.integers(10_000, 5_000_000, bars).astype(float),
+        "Dividends": dividends,
+    }, index=index)
+
+
+def synthetic_info(symbol, seed=0):
+    """yfinance-style fundamentals; a few symbols leave out beta/dividendYield to exercise the fallbacks"""
+    rng = _rng(symbol, seed + 1)
+    info = {
+        "marketCap": float(10 ** rng.uniform(9, 12.5)),
+        "sector": SECTORS[zlib.crc32(symbol.encode()) % len(SECTORS)],
+        "beta": float(rng.uniform(0.3, 2.2)),
+        "dividendYield": float(rng.uniform(0, 0.05)),
+    }
+    if rng.random() < 0.1:
+        del info["beta"]
+    if rng.random() < 0.1:
+        del info["dividendYield"]
+    return info
+
+
+def build_fixtures(root, symbols, bars=HISTORY_BARS, seed=0):
+    """Writes synthetic fixtures for `symbols` (and the benchmark index) that a ReplayProvider(root) can serve"""
+    fixtures = ReplayProvider(root)
+    os.makedirs(fixtures.info_dir, exist_ok=True)
+    if fixtures.histories.last_date(BENCHMARK_SYMBOL) is None:
+        fixtures.histories.append(BENCHMARK_SYMBOL, synthetic_history(BENCHMARK_SYMBOL, bars, seed=seed))
+    for symbol in symbols:
+        if fixtures.histories.last_date(symbol) is None:
+            fixtures.histories.append(symbol, synthetic_history(symbol, bars, seed=seed))
+        path = fixtures.info_path(symbol)
+        if not os.path.exists(path):
+            with open(path, "w") as f:
+                json.dump(synthetic_info(symbol, seed), f)
+    return fixtures
+
+
+def synthetic_universe(count, seed=0):
+    """A UniverseSnapshot of `count` stocks with plausible attribute distributions"""
+    rng = np.random.default_rng(seed)
+    records = {}
+    for symbol in synthetic_symbols(count):
+        price = float(rng.uniform(50, 3000))
+        moving_avg_50 = price * float(rng.uniform(0.85, 1.15))
+        moving_avg_200 = price * float(rng.uniform(0.75, 1.25))
+        records[symbol] = {
+            "current_price": price,
+            "day_high": price * 1.01,
+            "day_low": price * 0.99,
+            "volume": float(rng.integers(10_000, 5_000_000)),
+            "market_cap": float(10 ** rng.uniform(9, 12.5)),
+            "sector": SECTORS[int(rng.integers(len(SECTORS)))],
+            "beta": float(rng.uniform(0.3, 2.2)),
+            "dividend_yield": float(rng.uniform(0, 0.05)),
+            "change_percent": float(rng.normal(0, 2)),
+            "rsi": float(rng.uniform(10, 90)),
+            "moving_avg_50": moving_avg_50,
+            "moving_avg_200": moving_avg_200,
+            "price_to_ma_ratio": price / moving_avg_50,
+            "volatility": float(rng.uniform(0.5, 4)),
+            "above_ma50": price > moving_avg_50,
+            "above_ma200": price > moving_avg_200,
+        }
+    return UniverseSnapshot.from_records(records)
@@ -0,0 +1,502 @@
+"""
+Benchmark suite for the recommender service (app.py), the stock API (stock_api.py)
+and the data refresh pipeline. Everything runs against a local fake upstream:
+synthetic fixtures served by a ReplayProvider with injected latency.
+
+    python benchmarks/run.py                        # all suites
+    python benchmarks/run.py micro refresh          # selected suites
+    python benchmarks/run.py http --duration 20 --concurrency 32
+    python benchmarks/run.py http --app-url http://127.0.0.1:5001 --api-url http://127.0.0.1:5000
+    python benchmarks/run.py micro --compare benchmarks/results/<earlier>.json
+
+Results are written as JSON to benchmarks/results/<timestamp>-<commit>.json so runs
+from different commits can be compared with --compare.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+# The services pick their price store and provider up at import time, so point them
+# at a scratch directory and the replay provider before importing anything
+WORKDIR = tempfile.mkdtemp(prefix="tradeflow-bench-")
+os.environ.setdefault("TRADEFLOW_PRICE_STORE", os.path.join(WORKDIR, "price_store"))
+os.environ.setdefault("TRADEFLOW_FIXTURES", os.path.join(WORKDIR, "fixtures"))
+os.environ["TRADEFLOW_PROVIDER"] = "replay"
+os.environ.pop("TRADEFLOW_RECORD", None)
+
+import numpy as np
+
+from fake_upstream import build_fixtures, synthetic_history, synthetic_symbols, synthetic_universe
+from market_data import FIXTURES_DIR, ReplayProvider
+from price_store import PriceStore
+
+RESULTS_DIR = os.path.join(HERE, "results")
+SUITES = ("micro", "refresh", "http")
+
+# Defaults (can be overridden on the command line)
+UNIVERSE_SIZES = (140, 1000, 5000)
+REFRESH_SIZES = (140,)
+UPSTREAM_LATENCY = 0.2      # Seconds per simulated upstream call
+CHART_SAMPLES = 20
+BATCH_PROFILES = 1000       # Profiles per recommend_stocks_batch call
+HTTP_DURATION = 10          # Seconds per HTTP scenario
+HTTP_CONCURRENCY = 16
+
+BENCH_PROFILE = {
+    "risk_appetite": "medium",
+    "investment_horizon": 3,
+    "investment_goal": "both",
+    "sector_preference": "all",
+    "market_cap_preference": "all",
+    "dividend_preference": "no",
+    "investment_amount": 100000,
+}
+
+
+def bench_profiles(count, seed=0):
+    """Varied, valid user profiles (a client book) for the batch benchmark"""
+    rng = np.random.default_rng(seed)
+    sectors = ["all", "all", "technology", "energy", "healthcare", "financial services"]
+    return [{
+        "risk_appetite": str(rng.choice(["low", "medium", "high"])),
+        "investment_horizon": int(rng.integers(1, 11)),
+        "investment_goal": str(rng.choice(["growth", "dividends", "both"])),
+        "sector_preference": str(rng.choice(sectors)),
+        "market_cap_preference": str(rng.choice(["all", "large-cap", "mid-cap", "small-cap"])),
+        "dividend_preference": str(rng.choice(["yes", "no"])),
+        "investment_amount": int(rng.integers(10, 1000)) * 1000,
+    } for _ in range(count)]
+
+
+def measure(fn, repeat=5, number=1):
+    """Times fn() `number` times per round for `repeat` rounds; reports per-call milliseconds"""
+    fn()  # Warm-up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - started) / number * 1000)
+    return {
+        "repeat": repeat,
+        "number": number,
+        "min_ms": round(min(timings), 4),
+        "median_ms": round(float(np.median(timings)), 4),
+        "mean_ms": round(float(np.mean(timings)), 4),
+    }
+
+
+def latency_summary(latencies, errors, elapsed):
+    latencies = np.asarray(latencies) * 1000
+    summary = {"requests": int(len(latencies)), "errors": errors, "seconds": round(elapsed, 3),
+               "rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else None}
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary.update({"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+                        "p99_ms": round(float(p99), 3), "mean_ms": round(float(latencies.mean()), 3),
+                        "max_ms": round(float(latencies.max()), 3)})
+    return summary
+
+
+# Microbenchmarks
+
+def calculate_rsi(data, window=14):
+    """
+    RSI of one ticker's history the way the service computed it before indicators.py
+    (simple rolling means, one pandas pass per ticker); the baseline of indicator_panel
+    """
+    if len(data) < window + 1:
+        return 50
+    delta = data['Close'].diff()
+    gain = delta.where(delta > 0, 0).rolling(window=window).mean()
+    loss = -delta.where(delta < 0, 0).rolling(window=window).mean()
+    if loss.iloc[-1] == 0:
+        return 100
+    rs = gain.iloc[-1] / loss.iloc[-1]
+    return 100 - (100 / (1 + rs))
+
+
+def run_micro(args):
+    import stock_api
+    from allocation import allocate
+    from indicators import IndicatorState, compute_indicators
+    from price_panel import PricePanel
+    from risk_model import BENCHMARK_SYMBOL, RISK_WINDOW, CovarianceEngine
+    from stock_recommender import (generate_price_guidance, recommend_stocks, recommend_stocks_batch,
+                                   score_all_stocks)
+
+    profile = BENCH_PROFILE
+    scoring_args = (profile["risk_appetite"], profile["investment_horizon"], profile["investment_goal"],
+                    profile["sector_preference"], profile["market_cap_preference"],
+                    profile["dividend_preference"])
+    # RSI cost doesn't depend on the prices, so a few histories are cycled through
+    histories = [synthetic_history(symbol, bars=250) for symbol in synthetic_symbols(50)]
+    profiles = bench_profiles(args.batch_profiles)
+
+    results = {}
+    for size in args.sizes:
+        print(f"micro: {size} stocks")
+        snapshot = synthetic_universe(size)
+        rows = [(symbol, snapshot[symbol]) for symbol in snapshot.symbols]
+
+        def guidance_pass():
+            for symbol, row in rows:
+                generate_price_guidance(symbol, row, profile["risk_appetite"], profile["investment_horizon"])
+
+        def rsi_pass():
+            for i in range(size):
+                calculate_rsi(histories[i % len(histories)])
+
+        results[str(size)] = {
+            "score_all_stocks": measure(lambda: score_all_stocks(snapshot, *scoring_args), repeat=7, number=5),
+            "recommend_stocks": measure(lambda: recommend_stocks(profile, snapshot), repeat=7, number=5),
+            "generate_price_guidance": measure(guidance_pass, repeat=3),
+            "calculate_rsi": measure(rsi_pass, repeat=3),
+        }
+        batch = measure(lambda: recommend_stocks_batch(profiles, snapshot), repeat=3)
+        results[str(size)]["recommend_stocks_batch"] = dict(
+            batch, profiles=len(profiles), per_profile_ms=round(batch["median_ms"] / len(profiles), 4))
+
+        # Every technical indicator of the universe from one price panel (compare calculate_rsi,
+        # a single indicator computed ticker by ticker)
+        market = {symbol: synthetic_history(symbol, bars=RISK_WINDOW + 1)
+                  for symbol in snapshot.symbols + (BENCHMARK_SYMBOL,)}
+        panel = PricePanel()
+        panel.merge(market)
+        results[str(size)]["indicator_panel"] = measure(lambda: compute_indicators(panel.arrays()[2]), repeat=3)
+        # The same carried on by an IndicatorState, as a refresh that only revises the latest bar does
+        indicator_state = IndicatorState()
+        indicator_state.update(*panel.arrays())
+        results[str(size)]["indicator_incremental"] = measure(lambda: indicator_state.update(*panel.arrays()),
+                                                              repeat=3)
+
+        # Returns covariance: a full build, a refresh that revises the latest day, betas to the
+        # benchmark index over every window, and one allocation
+        closes = {symbol: history[["Close"]] for symbol, history in market.items()}
+        revisions = [{symbol: history.iloc[-1:] * factor for symbol, history in closes.items()}
+                     for factor in (1.001, 1.0)]
+        results[str(size)]["covariance_full"] = measure(lambda: CovarianceEngine().update(closes), repeat=3)
+        engine = CovarianceEngine()
+        engine.update(closes)
+        revision = itertools.cycle(revisions)
+        results[str(size)]["covariance_incremental"] = measure(lambda: engine.update(next(revision)), repeat=3)
+        results[str(size)]["regression_betas"] = measure(engine.betas, repeat=7)
+        risk = engine.model()
+        picks = [symbol for symbol, _ in recommend_stocks(profile, snapshot)]
+        prices = [snapshot[symbol]["current_price"] for symbol in picks]
+        results[str(size)]["allocate"] = measure(
+            lambda: allocate(picks, prices, risk, profile["investment_amount"]), repeat=7, number=20)
+
+    # Chart cost doesn't depend on the universe size, so it is measured once over a sample of tickers
+    print(f"micro: {args.chart_samples} charts")
+    samples = [(symbol, synthetic_history(symbol, bars=22)) for symbol in synthetic_symbols(args.chart_samples)]
+
+    def render_serial():
+        stock_api.cache["charts"].clear()
+        for symbol, history in samples:
+            stock_api.generate_stock_chart(symbol, history=history)
+
+    def render_pool():
+        stock_api.cache["charts"].clear()
+        futures = [stock_api.generate_stock_chart_async(symbol, history=history) for symbol, history in samples]
+        for future in futures:
+            future.result()
+
+    try:
+        serial = measure(render_serial, repeat=3)
+        pooled = measure(render_pool, repeat=3)
+    finally:
+        stock_api.chart_renderer.shutdown()
+    results["charts"] = {
+        "samples": len(samples),
+        "generate_stock_chart": dict(serial, per_chart_ms=round(serial["median_ms"] / len(samples), 3)),
+        "generate_stock_chart_async": dict(pooled, per_chart_ms=round(pooled["median_ms"] / len(samples), 3)),
+    }
+    return results
+
+
+# Refresh pipeline
+
+def run_refresh(args):
+    import stock_data
+    from indicators import IndicatorState
+    from price_panel import PricePanel
+    from risk_model import CovarianceEngine
+
+    original_provider, original_store, original_panel, original_engine, original_indicators = (
+        stock_data.provider, stock_data.price_store, stock_data.price_panel, stock_data.risk_engine,
+        stock_data.indicator_state)
+
+    def forget_prices():
+        stock_data.price_panel = PricePanel()
+        stock_data.risk_engine = CovarianceEngine(stock_data.price_panel)
+        stock_data.indicator_state = IndicatorState()
+
+    results = {}
+    try:
+        for size in args.refresh_sizes:
+            symbols = synthetic_symbols(size)
+            root = os.path.join(WORKDIR, f"refresh-{size}")
+            build_fixtures(os.path.join(root, "fixtures"), symbols)
+            provider = ReplayProvider(os.path.join(root, "fixtures"), latency=args.latency,
+                                      jitter=args.latency / 2, error_rate=args.error_rate, seed=size)
+            stock_data.provider = provider
+            stock_data.price_store = PriceStore(os.path.join(root, "price_store"))
+            forget_prices()
+
+            runs = {}
+            # cold: nothing stored; incremental: price panel kept in memory; restart: panel rebuilt from the store
+            for name in ("cold", "incremental", "restart"):
+                if name == "restart":
+                    forget_prices()
+                print(f"refresh: {size} symbols, {name}")
+                calls = provider.calls
+                started = time.perf_counter()
+                snapshot = stock_data.fetch_stock_data(symbols, rate_limit=args.rate_limit)
+                runs[name] = {
+                    "seconds": round(time.perf_counter() - started, 3),
+                    "fetched": len(snapshot),
+                    "skipped": size - len(snapshot),
+                    "upstream_calls": provider.calls - calls,
+                }
+            results[str(size)] = dict(runs, latency=args.latency, error_rate=args.error_rate,
+                                      rate_limit=args.rate_limit)
+    finally:
+        stock_data.provider, stock_data.price_store = original_provider, original_store
+        stock_data.price_panel, stock_data.risk_engine = original_panel, original_engine
+        stock_data.indicator_state = original_indicators
+    return results
+
+
+# HTTP load
+
+def load_test(make_request, concurrency, duration):
+    """
+    Runs make_request(session, i) from `concurrency` threads for `duration` seconds.
+    A request counts as an error if it raises or returns a status code >= 400.
+    """
+    import requests
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        session = requests.Session()
+        mine, failed = [], 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = make_request(session, next(counter))
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            if ok:
+                mine.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latency_summary(latencies, errors[0], time.perf_counter() - started)
+
+
+def serve_in_background(flask_app):
+    """Serves a Flask app on a free local port with the threaded development server"""
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def start_recommender():
+    import app
+    import stock_data
+    from stock_symbols import INDIAN_STOCK_SYMBOLS
+
+    build_fixtures(FIXTURES_DIR, INDIAN_STOCK_SYMBOLS)
+    stock_data.provider = ReplayProvider(FIXTURES_DIR)
+    app.refresher.start()
+    while not app.refresher.current.snapshot or app.refresher.status()["state"] != "idle":
+        time.sleep(0.2)
+    return serve_in_background(app.app)
+
+
+def start_stock_api():
+    import stock_api
+
+    build_fixtures(FIXTURES_DIR, sorted(stock_api.KNOWN_TICKERS))
+    stock_api.provider = ReplayProvider(FIXTURES_DIR)
+    stock_api.preload_cache()
+    return serve_in_background(stock_api.app)
+
+
+def random_profiles(count, seed=0):
+    """Profiles with sector/market cap preferences and odd horizons, which mostly miss the cache"""
+    rng = random.Random(seed)
+    sectors = ["all", "Technology", "Energy", "Financial Services", "Healthcare"]
+    return [{
+        "risk_appetite": rng.choice(["low", "medium", "high"]),
+        "investment_horizon": rng.randint(1, 15),
+        "investment_goal": rng.choice(["growth", "dividends", "both"]),
+        "sector_preference": rng.choice(sectors),
+        "market_cap_preference": rng.choice(["all", "large-cap", "mid-cap", "small-cap"]),
+        "dividend_preference": rng.choice(["yes", "no"]),
+        "investment_amount": rng.randint(1, 100) * 10000,
+    } for _ in range(count)]
+
+
+def run_http(args):
+    from recommendation_cache import COMMON_PROFILES
+
+    servers = []
+    results = {}
+    try:
+        app_url = args.app_url
+        if app_url is None:
+            server, app_url = start_recommender()
+            servers.append(server)
+        api_url = args.api_url
+        if api_url is None:
+            server, api_url = start_stock_api()
+            servers.append(server)
+
+        import requests
+        from stock_api import STOCK_CATEGORIES
+        categories = list(STOCK_CATEGORIES)
+        chart_urls = [f"{api_url}{stock['chart_url']}"
+                      for category in categories
+                      for stock in requests.get(f"{api_url}/stocks/{category}", timeout=60).json()
+                      if stock.get("chart_url")]
+        mixed = random_profiles(500)
+
+        scenarios = {
+            "recommend_common": lambda s, i: s.post(f"{app_url}/recommend",
+                                                     json=COMMON_PROFILES[i % len(COMMON_PROFILES)]),
+            "recommend_mixed": lambda s, i: s.post(f"{app_url}/recommend", json=mixed[i % len(mixed)]),
+            "stocks": lambda s, i: s.get(f"{api_url}/stocks/{categories[i % len(categories)]}",
+                                         params={"order": "A" if i % 2 else "D"}),
+        }
+        if chart_urls:
+            scenarios["charts"] = lambda s, i: s.get(chart_urls[i % len(chart_urls)])
+
+        for name, make_request in scenarios.items():
+            print(f"http: {name} ({args.concurrency} clients, {args.duration}s)")
+            results[name] = dict(load_test(make_request, args.concurrency, args.duration),
+                                 concurrency=args.concurrency)
+    finally:
+        for server in servers:
+            server.shutdown()
+    return results
+
+
+# Results
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", ".."], cwd=HERE,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=""):
+    """{"a": {"b": 1}} -> {"a.b": 1} for the numeric leaves"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(base, current):
+    """Prints the timing and throughput metrics both runs have, with the relative change"""
+    metrics = ("median_ms", "per_chart_ms", "p50_ms", "p95_ms", "p99_ms", "rps", "seconds")
+    base_flat, current_flat = flatten(base["results"]), flatten(current["results"])
+    print(f"\n{'metric':<70} {base.get('commit') or 'base':>14} {current.get('commit') or 'current':>14}  change")
+    for name, value in current_flat.items():
+        if name not in base_flat or not name.endswith(metrics):
+            continue
+        old = base_flat[name]
+        change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"{name:<70} {old:>14} {value:>14}  {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TradeFlow benchmark suite")
+    parser.add_argument("suites", nargs="*", metavar="suite", help=f"Any of {', '.join(SUITES)} (default: all)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(UNIVERSE_SIZES))
+    parser.add_argument("--chart-samples", type=int, default=CHART_SAMPLES)
+    parser.add_argument("--batch-profiles", type=int, default=BATCH_PROFILES)
+    parser.add_argument("--refresh-sizes", type=int, nargs="+", default=list(REFRESH_SIZES))
+    parser.add_argument("--latency", type=float, default=UPSTREAM_LATENCY)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    parser.add_argument("--duration", type=float, default=HTTP_DURATION)
+    parser.add_argument("--concurrency", type=int, default=HTTP_CONCURRENCY)
+    parser.add_argument("--app-url", help="Benchmark a running recommender instead of starting one")
+    parser.add_argument("--api-url", help="Benchmark a running stock API instead of starting one")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier results file to compare this run against")
+    args = parser.parse_args()
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(sorted(unknown))}")
+    args.suites = args.suites or list(SUITES)
+
+    if args.rate_limit is None:
+        import stock_data
+        args.rate_limit = stock_data.FETCH_RATE_LIMIT
+
+    runners = {"micro": run_micro, "refresh": run_refresh, "http": run_http}
+    results = {suite: runners[suite](args) for suite in SUITES if suite in args.suites}
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "options": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import matplotlib
+# Set matplotlib to use 'Agg' backend (non-interactive, thread-safe)
+matplotlib.use('Agg')
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import matplotlib.ticker as mtick
+
+# Worker processes used for rendering (can be adjusted)
+CHART_PROCESSES = max(1, min(4, os.cpu_count() or 1))
+
+# Visual styles a chart can be rendered in
+CHART_STYLES = {
+    'default': {
+        'line': '#FF5722', 'fill': '#FF7043', 'up': '#4CAF50', 'down': '#F44336',
+        'grid': '#E0E0E0', 'ticks': '#757575', 'title': '#5D4037',
+    },
+    'dark': {
+        'line': '#FF8A65', 'fill': '#FFAB91', 'up': '#81C784', 'down': '#E57373',
+        'grid': '#424242', 'ticks': '#BDBDBD', 'title': '#EFEBE9',
+    },
+}
+
+# Per-process figure template, created on first use and reused for every chart
+_template = None
+
+
+def _get_template():
+    global _template
+    if _template is None:
+        fig = Figure(figsize=(8, 4.5))
+        FigureCanvasAgg(fig)
+        ax1, ax2 = fig.subplots(2, 1, gridspec_kw={'height_ratios': [3, 1]}, sharex=True)
+        fig.patch.set_alpha(0.0)  # Make figure background transparent
+        _template = (fig, ax1, ax2)
+    return _template
+
+
+def volume_formatter(x, pos):
+    """Format volume axis with K/M suffix for thousands/millions"""
+    if x >= 1e6:
+        return f'{x*1e-6:.1f}M'
+    elif x >= 1e3:
+        return f'{x*1e-3:.1f}K'
+    else:
+        return f'{x:.0f}'
+
+
+def render_chart_png(ticker, dates, close, volume, style='default'):
+    """
+    Render a price/volume chart and return the PNG bytes.
+    Runs inside the chart worker processes, so it only takes plain arrays.
+    """
+    colors = CHART_STYLES.get(style, CHART_STYLES['default'])
+    fig, ax1, ax2 = _get_template()
+    ax1.clear()
+    ax2.clear()
+
+    close = np.asarray(close, dtype=float)
+    volume = np.asarray(volume, dtype=float)
+
+    # Calculate daily returns for volume coloring
+    daily_return = np.empty_like(close)
+    daily_return[0] = np.nan
+    daily_return[1:] = np.diff(close) / close[:-1]
+
+    # Plot price chart on top subplot
+    ax1.patch.set_alpha(0.0)  # Make plot background transparent
+    ax1.plot(dates, close, color=colors['line'], linewidth=2, label='Price')
+
+    # Fill between price and bottom
+    ax1.fill_between(dates, close, close.min()*0.95, alpha=0.1, color=colors['fill'])
+
+    # Plot volume on bottom subplot
+    ax2.patch.set_alpha(0.0)  # Make volume plot background transparent
+    bar_colors = [colors['up'] if r >= 0 else colors['down'] for r in daily_return]
+    ax2.bar(dates, volume, color=bar_colors, alpha=0.7, width=0.8)
+
+    # Style the plots
+    for ax in [ax1, ax2]:
+        ax.grid(color=colors['grid'], linestyle='--', linewidth=0.5, alpha=0.7)
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        ax.spines['bottom'].set_color(colors['grid'])
+        ax.spines['left'].set_color(colors['grid'])
+        ax.tick_params(colors=colors['ticks'], labelsize=8)
+
+    # Reduce number of x-axis labels to avoid crowding
+    if len(close) > 20:
+        ax2.xaxis.set_major_locator(mtick.MaxNLocator(7))
+
+    ax1.set_title(f"{ticker} Stock Price", color=colors['title'], fontsize=10, pad=5)
+    ax1.legend(loc='upper left', frameon=False, fontsize=8)
+
+    # Format y-axis with currency
+    ax1.yaxis.set_major_formatter(mtick.StrMethodFormatter('₹{x:,.2f}'))
+    ax2.yaxis.set_major_formatter(mtick.FuncFormatter(volume_formatter))
+
+    # Set y-axis limits slightly above/below the data range for better appearance
+    ax1.set_ylim(close.min() * 0.95, close.max() * 1.05)
+
+    # Adjust layout
+    fig.tight_layout()
+    fig.subplots_adjust(hspace=0.1)  # Reduce space between subplots
+
+    # Save plot to a bytes buffer with transparency
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', transparent=True, dpi=120)
+    return buffer.getvalue()
+
+
+def price_fingerprint(history):
+    """Identifies the price data a chart was drawn from, so charts can be invalidated when it changes"""
+    if history is None or history.empty:
+        return None
+    last = history.iloc[-1]
+    return (len(history), str(history.index[0]), str(history.index[-1]),
+            float(last['Close']), float(last.get('Volume', 0)))
+
+
+class ChartRenderer:
+    """
+    Renders charts on a pool of worker processes.
+    Falls back to rendering in-process if the pool can't be used.
+    """
+
+    def __init__(self, processes=CHART_PROCESSES):
+        self.processes = processes
+        self._pool = None
+        self._lock = threading.Lock()
+        self._inprocess_lock = threading.Lock()  # The figure template isn't shareable between threads
+
+    def submit(self, ticker, history, style='default'):
+        """Schedules a chart for `history` (a DataFrame with Close/Volume); returns a Future of PNG bytes"""
+        args = (ticker, history.index.values, history['Close'].to_numpy(dtype=float),
+                history['Volume'].to_numpy(dtype=float), style)
+        try:
+            return self._get_pool().submit(render_chart_png, *args)
+        except (BrokenProcessPool, RuntimeError, OSError):
+            # Pool died (or can't start in this environment) - start over next time
+            with self._lock:
+                self._pool = None
+            future = Future()
+            try:
+                with self._inprocess_lock:
+                    future.set_result(render_chart_png(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # Charts are submitted from many threads at once; forking a process while another
+                # thread holds a lock can deadlock the child, so start workers from a clean server
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+            return self._pool
@@ -0,0 +1,349 @@
+import threading
+
+import numpy as np
+
+# Indicator windows (in bars)
+RSI_WINDOW = 14
+SHORT_MA_WINDOW = 50
+LONG_MA_WINDOW = 200
+VOLATILITY_WINDOW = 20      # Daily returns used for volatility (about one month)
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+BOLLINGER_WINDOW = 20
+BOLLINGER_WIDTH = 2         # Standard deviations either side of the middle band
+ATR_WINDOW = 14
+FALLBACK_WINDOW = 126       # Bars in ~6 months, used by the beta/dividend fallbacks
+MIN_BARS = 5                # Tickers with fewer bars get no indicators
+STATE_BARS = LONG_MA_WINDOW  # Latest bars an IndicatorState keeps per ticker, for the windowed indicators
+
+# Indicator functions by registration order. Each takes a Bars and returns
+# {output column: one value per ticker}; see indicator() to add one.
+INDICATORS = []
+
+
+def indicator(function):
+    """Registers an indicator function with compute_indicators()"""
+    INDICATORS.append(function)
+    return function
+
+
+class Bars:
+    """
+    Daily bars of a universe as (bars x tickers) arrays, right-aligned per ticker: the last
+    row holds every ticker's newest bar, the one above its previous bar, and so on, with NaN
+    above a ticker's first bar. Dates a ticker has no bar for are dropped, so each column is
+    that ticker's own bar sequence and every indicator is one pass over all columns.
+    Intermediate series shared by several indicators (EMAs, returns) are computed once.
+
+    The smoothers (EMAs, Wilder averages) only step over each ticker's `new` last bars
+    (default: all of them), carrying on from the `smoothed` values of an IndicatorState;
+    windowed indicators use every bar given.
+    """
+
+    def __init__(self, prices, new=None, smoothed=None):
+        present = ~np.isnan(prices["Close"])
+        # A stable sort of the presence flags moves missing bars to the top, keeping date order below
+        order = np.argsort(present, axis=0, kind="stable")
+        self.fields = {field: np.take_along_axis(values, order, axis=0) for field, values in prices.items()}
+        self.count = present.sum(axis=0)
+        self.close = self.fields["Close"]
+        self.high = self.fields.get("High", self.close)
+        self.low = self.fields.get("Low", self.close)
+        self.volume = self.fields.get("Volume", np.full_like(self.close, np.nan))
+        self.new = self.count if new is None else new
+        self.smoothed = smoothed or {}
+        self.resume = {}  # Smoothed values as of each ticker's second newest bar, by key
+        self._series = {}
+
+    def __len__(self):
+        return self.close.shape[1]
+
+    def latest(self, values, back=0):
+        """Each ticker's value `back` bars before its newest (NaN where it has fewer bars)"""
+        if back >= len(values):
+            return np.full(values.shape[1], np.nan)
+        return values[-1 - back]
+
+    def mean(self, values, window):
+        """Mean over each ticker's last `window` bars (or all it has, when fewer)"""
+        return _nanmean(values[-window:])
+
+    def ema(self, span):
+        """Exponential moving average series of the closes (seeded with each ticker's first close)"""
+        return self.smooth(("ema", span), self.close, 2 / (span + 1))
+
+    def wilder(self, name, values, window):
+        """Wilder smoothing of a series, seeded with the simple average of its first `window` values"""
+        return self.smooth(("wilder", name, window), values, 1 / window, seed=window)
+
+    def smooth(self, key, values, alpha, seed=1):
+        """
+        smooth() of a right-aligned series over each ticker's new bars, carrying on from the
+        smoothed values held under `key`. Covers the last max(new) rows.
+        """
+        def compute():
+            rows = int(self.new.max(initial=0))
+            tail = _last_rows(values, rows)
+            # Bars already folded into the smoothed values are skipped
+            tail[np.arange(rows)[:, None] < rows - self.new] = np.nan
+            head, self.resume[key] = smooth(tail[:-1], alpha, seed, self.smoothed.get(key))
+            newest, _ = smooth(tail[-1:], alpha, seed, self.resume[key])
+            return np.vstack([head, newest])
+        return self._cached(key, compute)
+
+    @property
+    def changes(self):
+        """Close-to-close changes, one row shorter than the closes"""
+        return self._cached("changes", lambda: np.diff(self.close, axis=0))
+
+    @property
+    def returns(self):
+        """Daily returns (0 after a non-positive close), one row shorter than the closes"""
+        def returns():
+            previous = self.close[:-1]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = self.changes / previous
+            return np.where(previous > 0, values, np.where(np.isnan(previous), np.nan, 0.0))
+        return self._cached("returns", returns)
+
+    def _cached(self, key, compute):
+        if key not in self._series:
+            self._series[key] = compute()
+        return self._series[key]
+
+
+def smooth(values, alpha, seed=1, state=None):
+    """
+    Exponential smoothing down every column of a right-aligned series: starts at the average
+    of each column's first `seed` values, then moves `alpha` of the way to each new value.
+    NaN until a column has `seed` values. One vector step per row, for all columns at once.
+    Returns (smoothed series, state); smoothing more rows from that state carries on after
+    the last one.
+    """
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    output = np.full(values.shape, np.nan)
+    if state is None:
+        state = (np.full(values.shape[1:], np.nan), np.zeros(values.shape[1:]),
+                 np.zeros(values.shape[1:], dtype=np.intp))
+    current, total, seen = (array.copy() for array in state)  # seen: values so far in each column
+    for row in range(len(values)):
+        seen += present[row]
+        if seed > 1:
+            total += np.where(seen <= seed, filled[row], 0.0)
+        current = np.where(present[row] & (seen == seed), total / seed if seed > 1 else filled[row],
+                           np.where(present[row] & (seen > seed), current + alpha * (filled[row] - current),
+                                    current))
+        output[row] = current
+    return output, (current, total, seen)
+
+
+def compute_indicators(prices):
+    """
+    Every registered indicator for a universe at once, from {field: (dates x tickers) array}
+    with NaN where a ticker has no bar (see PricePanel.arrays). Returns ({column: values per
+    ticker}, bars per ticker); tickers with fewer than MIN_BARS bars should be skipped.
+    """
+    bars = Bars(prices)
+    return _indicator_columns(bars), bars.count
+
+
+class IndicatorState:
+    """
+    Indicators of a universe kept up to date between refreshes. update() only steps the
+    smoothers (EMAs, Wilder averages) over the bars added since the last call, so their
+    values don't depend on how many bars the price panel still holds. Per ticker it keeps
+    its last STATE_BARS bars for the windowed indicators and the smoothed values, both as of
+    its second newest bar: an intraday refresh can still replace the newest one, so that
+    bar is stepped again every time.
+    """
+
+    def __init__(self):
+        self.symbols = ()
+        self.count = np.zeros(0, dtype=np.intp)  # Bars folded in, per ticker
+        self.recent = {}    # {field: (STATE_BARS x tickers)} right-aligned bars, "Date" as day numbers
+        self.smoothed = {}  # {Bars.smooth key: (current, total, seen) per ticker}
+        self._lock = threading.Lock()
+
+    def update(self, dates, symbols, prices):
+        """
+        Indicators of `symbols` from panel arrays (see PricePanel.arrays), returned like
+        compute_indicators(). Tickers new to the state, or whose last folded-in bar has
+        changed (revised history), start over from their first bar in the panel.
+        """
+        with self._lock:
+            self._select(symbols)
+            days = dates.astype("datetime64[D]").astype(float)
+            fields = {field: prices[field] for field in ("Close", "High", "Low", "Volume") if field in prices}
+            for field in list(fields) + ["Date"]:
+                self.recent.setdefault(field, np.full((STATE_BARS, len(symbols)), np.nan))
+
+            # Each ticker's bars after its last folded-in one are new
+            last_day, last_close = self.recent["Date"][-1], self.recent["Close"][-1]
+            row = np.searchsorted(days, last_day)
+            kept = ~np.isnan(last_day) & (row < len(days))
+            columns = np.flatnonzero(kept)
+            kept[columns] = (days[row[columns]] == last_day[columns]) & (
+                fields["Close"][row[columns], columns] == last_close[columns])
+            self._reset(~kept)
+            start = np.where(kept, row + 1, 0)
+            first = int(start.min(initial=len(days)))
+            block = {field: values[first:].copy() for field, values in fields.items()}
+            block["Date"] = np.repeat(days[first:, None], len(symbols), axis=1)
+            missing = (np.arange(first, len(days))[:, None] < start) | np.isnan(block["Close"])
+            for values in block.values():
+                values[missing] = np.nan
+            new = (~missing).sum(axis=0)
+
+            bars = Bars({field: np.vstack([self.recent[field], values]) for field, values in block.items()},
+                        new=new, smoothed=self.smoothed)
+            columns = _indicator_columns(bars)
+            count = self.count + new
+
+            # Fold in everything but each ticker's newest bar
+            folded = new > 0
+            for field, values in bars.fields.items():
+                self.recent[field] = np.where(folded, _last_rows(values[:-1], STATE_BARS),
+                                              _last_rows(values, STATE_BARS))
+            self.smoothed.update(bars.resume)
+            self.count = count - folded
+            return columns, count
+
+    def _select(self, symbols):
+        """Lines the state up with `symbols`; tickers it didn't hold start empty"""
+        symbols = tuple(symbols)
+        if symbols == self.symbols:
+            return
+        positions = {symbol: i for i, symbol in enumerate(self.symbols)}
+        source = np.array([positions.get(symbol, -1) for symbol in symbols], dtype=np.intp)
+        held = source >= 0
+
+        def pick(values, fill):
+            picked = np.full(values.shape[:-1] + (len(symbols),), fill, dtype=values.dtype)
+            picked[..., held] = values[..., source[held]]
+            return picked
+
+        self.count = pick(self.count, 0)
+        self.recent = {field: pick(values, np.nan) for field, values in self.recent.items()}
+        self.smoothed = {key: tuple(pick(values, fill) for values, fill in zip(state, (np.nan, 0, 0)))
+                         for key, state in self.smoothed.items()}
+        self.symbols = symbols
+
+    def _reset(self, tickers):
+        """Forgets the bars and smoothed values of the `tickers` (a boolean mask)"""
+        if not tickers.any():
+            return
+        self.count[tickers] = 0
+        for values in self.recent.values():
+            values[:, tickers] = np.nan
+        for current, total, seen in self.smoothed.values():
+            current[tickers] = np.nan
+            total[tickers] = 0
+            seen[tickers] = 0
+
+
+def _indicator_columns(bars):
+    columns = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for function in INDICATORS:
+            columns.update(function(bars))
+    return columns
+
+
+@indicator
+def price(bars):
+    close, previous = bars.latest(bars.close), bars.latest(bars.close, 1)
+    return {
+        "current_price": close,
+        "day_high": bars.latest(bars.high),
+        "day_low": bars.latest(bars.low),
+        "volume": bars.latest(bars.volume),
+        "change_percent": np.where(previous > 0, (close - previous) / previous * 100, 0.0),
+    }
+
+
+@indicator
+def moving_averages(bars):
+    # Fall back to the mean of what a ticker has when the window isn't full
+    close = bars.latest(bars.close)
+    moving_avg_50 = bars.mean(bars.close, SHORT_MA_WINDOW)
+    moving_avg_200 = bars.mean(bars.close, LONG_MA_WINDOW)
+    return {
+        "moving_avg_50": moving_avg_50,
+        "moving_avg_200": moving_avg_200,
+        "price_to_ma_ratio": np.where(moving_avg_50 > 0, close / moving_avg_50, 1.0),
+        "above_ma50": close > moving_avg_50,
+        "above_ma200": close > moving_avg_200,
+        "ema_50": bars.latest(bars.ema(SHORT_MA_WINDOW)),
+        "ema_200": bars.latest(bars.ema(LONG_MA_WINDOW)),
+    }
+
+
+@indicator
+def rsi(bars):
+    # Wilder-smoothed average gains and losses; 50 until a full window of changes
+    changes = bars.changes
+    gains = bars.wilder("gains", np.where(changes > 0, changes, np.where(np.isnan(changes), np.nan, 0.0)),
+                        RSI_WINDOW)
+    losses = bars.wilder("losses", np.where(changes < 0, -changes, np.where(np.isnan(changes), np.nan, 0.0)),
+                         RSI_WINDOW)
+    average_gain, average_loss = bars.latest(gains), bars.latest(losses)
+    values = np.where(average_loss == 0, 100.0, 100 - 100 / (1 + average_gain / average_loss))
+    return {"rsi": np.where(np.isnan(average_gain), 50.0, values)}
+
+
+@indicator
+def volatility(bars):
+    # Sample standard deviation of the last VOLATILITY_WINDOW daily returns, in percent
+    returns = bars.returns[-VOLATILITY_WINDOW:]
+    n = (~np.isnan(returns)).sum(axis=0)
+    deviation = np.sqrt(_nanvariance(returns, ddof=1)) * 100
+    return {"volatility": np.where(n > 1, deviation, 0.0)}
+
+
+@indicator
+def macd(bars):
+    line = bars.ema(MACD_FAST) - bars.ema(MACD_SLOW)
+    signal = bars.smooth("macd_signal", line, 2 / (MACD_SIGNAL + 1))
+    line, signal = bars.latest(line), bars.latest(signal)
+    return {"macd": line, "macd_signal": signal, "macd_histogram": line - signal}
+
+
+@indicator
+def bollinger_bands(bars):
+    window = bars.close[-BOLLINGER_WINDOW:]
+    middle = _nanmean(window)
+    width = BOLLINGER_WIDTH * np.sqrt(_nanvariance(window))
+    return {"bollinger_upper": middle + width, "bollinger_lower": middle - width}
+
+
+@indicator
+def average_true_range(bars):
+    # Wilder-smoothed true range; a ticker's first bar has no previous close to gap from
+    previous = np.vstack([np.full((1, len(bars)), np.nan), bars.close[:-1]])
+    true_range = np.fmax(bars.high - bars.low,
+                         np.fmax(np.abs(bars.high - previous), np.abs(bars.low - previous)))
+    return {"atr": bars.latest(bars.wilder("true_range", true_range, ATR_WINDOW))}
+
+
+def _last_rows(values, rows):
+    """Copy of the last `rows` rows of `values`, NaN-padded at the top when it has fewer"""
+    tail = np.full((rows,) + values.shape[1:], np.nan)
+    available = min(rows, len(values))
+    if available:
+        tail[rows - available:] = values[len(values) - available:]
+    return tail
+
+
+def _nanmean(values):
+    """Column means ignoring NaN (NaN for all-NaN columns, without warnings)"""
+    n = (~np.isnan(values)).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.nansum(values, axis=0) / np.where(n > 0, n, np.nan)
+
+
+def _nanvariance(values, ddof=0):
+    """Column variances ignoring NaN (NaN without more than `ddof` values)"""
+    n = (~np.isnan(values)).sum(axis=0)
+    deviations = values - _nanmean(values)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.nansum(deviations * deviations, axis=0) / np.where(n > ddof, n - ddof, np.nan)
@@ -0,0 +1,242 @@
+import asyncio
+import re
+import threading
+import time
+import traceback
+
+from metrics import Counter
+
+# How often subscribed tickers are re-quoted (in seconds)
+LIVE_PRICE_INTERVAL = 5
+
+# Tickers per upstream batch quote request
+LIVE_PRICE_BATCH = 50
+
+# Limits per subscription
+MAX_SUBSCRIBED_TICKERS = 50
+TICKER_PATTERN = re.compile(r"^[A-Za-z0-9.^=&-]{1,20}$")
+
+
+def parse_tickers(value):
+    """Validated, upper-cased tickers from a comma-separated string or a list; raises ValueError"""
+    if value is None:
+        return []
+    items = value.split(",") if isinstance(value, str) else value
+    if not isinstance(items, (list, tuple)):
+        raise ValueError("Tickers must be a list or a comma-separated string")
+    tickers = []
+    for item in items:
+        ticker = str(item).strip().upper()
+        if not ticker:
+            continue
+        if not TICKER_PATTERN.match(ticker):
+            raise ValueError(f"Invalid ticker: {item}")
+        if ticker not in tickers:
+            tickers.append(ticker)
+    if len(tickers) > MAX_SUBSCRIBED_TICKERS:
+        raise ValueError(f"At most {MAX_SUBSCRIBED_TICKERS} tickers per subscription")
+    return tickers
+
+
+class PriceSubscription:
+    """
+    One client's view of the live prices of the tickers it subscribed to.
+    Updates are coalesced per ticker, so a slow client only ever gets the latest price
+    and never builds up a backlog.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.tickers = set()
+        self.closed = False
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._waiter = None  # (loop, asyncio.Event) of an async reader
+
+    def subscribe(self, tickers):
+        self.change(subscribe=tickers)
+
+    def unsubscribe(self, tickers):
+        self.change(unsubscribe=tickers)
+
+    def change(self, subscribe=(), unsubscribe=()):
+        """
+        Drops the `unsubscribe` tickers and adds the `subscribe` ones, as one change: raises
+        ValueError (changing nothing) if the result would exceed MAX_SUBSCRIBED_TICKERS
+        """
+        self.hub._change(self, subscribe, unsubscribe)
+
+    def close(self):
+        self.hub._change(self, (), list(self.tickers))
+        with self._condition:
+            self.closed = True
+            self._notify()
+
+    def get(self, timeout=None):
+        """Waits for price changes and returns them as {ticker: price} ({} on timeout or close)"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending or self.closed, timeout)
+            return self._take()
+
+    async def get_async(self, timeout=None):
+        """get() for async readers"""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        with self._condition:
+            if self._pending or self.closed:
+                return self._take()
+            self._waiter = (loop, ready)
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._condition:
+                self._waiter = None
+        with self._condition:
+            return self._take()
+
+    def _push(self, prices):
+        with self._condition:
+            prices = {ticker: price for ticker, price in prices.items() if ticker in self.tickers}
+            if prices and not self.closed:
+                self._pending.update(prices)
+                self._notify()
+
+    def _take(self):
+        prices, self._pending = self._pending, {}
+        return prices
+
+    def _notify(self):
+        self._condition.notify_all()
+        if self._waiter is not None:
+            loop, ready = self._waiter
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:  # The reader's event loop has closed
+                pass
+
+
+class PriceHub:
+    """
+    Polls the quotes of every subscribed ticker on one background thread and fans out
+    the prices that changed to the subscribers of those tickers. Upstream traffic grows
+    with the number of distinct tickers (one batch request per LIVE_PRICE_BATCH of them
+    per interval), not with the number of clients.
+    """
+
+    def __init__(self, provider, interval=LIVE_PRICE_INTERVAL, batch_size=LIVE_PRICE_BATCH):
+        self.provider = provider
+        self.interval = interval
+        self.batch_size = batch_size
+        self.subscribers = {}  # ticker -> set of PriceSubscription
+        self.prices = {}       # ticker -> last price sent
+        self.polls = 0         # Upstream batch requests made
+        self._new = set()      # Subscribed tickers without a price yet
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def subscribe(self, tickers=()):
+        """Returns a new PriceSubscription (call close() when the client goes away)"""
+        subscription = PriceSubscription(self)
+        if tickers:
+            subscription.subscribe(tickers)
+        return subscription
+
+    def stats(self):
+        with self._lock:
+            subscriptions = set().union(*self.subscribers.values()) if self.subscribers else set()
+            return {"tickers": len(self.subscribers), "subscriptions": len(subscriptions), "polls": self.polls}
+
+    def poll(self, tickers=None):
+        """Quotes `tickers` (default: every subscribed ticker) and sends out the prices that changed"""
+        if tickers is None:
+            with self._lock:
+                tickers = list(self.subscribers)
+        tickers = sorted(tickers)
+        for start in range(0, len(tickers), self.batch_size):
+            batch = tickers[start:start + self.batch_size]
+            try:
+                quotes = self.provider.quote_batch(batch)
+            except Exception as e:
+                print(f"Error polling live prices ({str(e)}).")
+                traceback.print_exc()
+                continue
+            finally:
+                with self._lock:
+                    self.polls += 1
+            self._publish(quotes)
+
+    def _publish(self, quotes):
+        with self._lock:
+            quotes = {ticker: float(price) for ticker, price in quotes.items()
+                      if price is not None and price == price}  # Skips missing and NaN quotes
+            changed = {ticker: price for ticker, price in quotes.items()
+                       if ticker in self.subscribers and self.prices.get(ticker) != price}
+            self.prices.update(changed)
+            subscriptions = set()
+            for ticker in changed:
+                subscriptions.update(self.subscribers[ticker])
+        for subscription in subscriptions:
+            subscription._push(changed)
+        LIVE_PRICE_UPDATES.inc(len(changed))
+
+    def _change(self, subscription, add, remove):
+        known = {}
+        with self._lock:
+            if len((subscription.tickers - set(remove)) | set(add)) > MAX_SUBSCRIBED_TICKERS:
+                raise ValueError(f"At most {MAX_SUBSCRIBED_TICKERS} tickers per subscription")
+            for ticker in remove:
+                subscribers = self.subscribers.get(ticker)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    # Nobody is watching it any more - stop polling it
+                    del self.subscribers[ticker]
+                    self.prices.pop(ticker, None)
+                    self._new.discard(ticker)
+            subscription.tickers.difference_update(remove)
+            for ticker in add:
+                if ticker not in self.subscribers:
+                    self.subscribers[ticker] = set()
+                    self._new.add(ticker)
+                self.subscribers[ticker].add(subscription)
+                if ticker in self.prices:
+                    known[ticker] = self.prices[ticker]
+            subscription.tickers.update(add)
+            new = bool(self._new)
+        # New subscribers get the last known prices straight away
+        if known:
+            subscription._push(known)
+        if new:
+            self._start()
+            self._wakeup.set()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="live-prices", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        next_poll = time.monotonic()
+        while True:
+            woken = self._wakeup.wait(max(0.0, next_poll - time.monotonic()))
+            self._wakeup.clear()
+            with self._lock:
+                new, self._new = self._new, set()
+            if woken and time.monotonic() < next_poll:
+                # Only fetch the newly subscribed tickers; the rest keep their schedule
+                if new:
+                    self.poll(new)
+                continue
+            self.poll()
+            next_poll = time.monotonic() + self.interval
+
+
+# Instrumentation (exposed on /metrics)
+LIVE_PRICE_UPDATES = Counter("tradeflow_live_price_updates_total", "Changed prices fanned out to subscribers")
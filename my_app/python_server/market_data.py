@@ -0,0 +1,437 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+import pandas as pd
+
+try:
+    import yfinance as yf
+except ImportError:  # Only the replay provider is available
+    yf = None
+
+from metrics import UPSTREAM_ERRORS, UPSTREAM_SECONDS
+from price_store import PriceStore, normalize_history, slice_period
+
+logger = logging.getLogger(__name__)
+
+# Which provider default_provider() builds: "yfinance" or "replay" (can be overridden with TRADEFLOW_PROVIDER)
+PROVIDER = os.environ.get("TRADEFLOW_PROVIDER", "yfinance")
+
+# Where recorded responses are kept for the replay provider (TRADEFLOW_FIXTURES)
+FIXTURES_DIR = os.environ.get(
+    "TRADEFLOW_FIXTURES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+
+# Injected behaviour of the replay provider, per call (TRADEFLOW_REPLAY_LATENCY / _JITTER / _ERROR_RATE)
+REPLAY_LATENCY = float(os.environ.get("TRADEFLOW_REPLAY_LATENCY", 0.0))       # Seconds
+REPLAY_JITTER = float(os.environ.get("TRADEFLOW_REPLAY_JITTER", 0.0))         # Extra random seconds, up to
+REPLAY_ERROR_RATE = float(os.environ.get("TRADEFLOW_REPLAY_ERROR_RATE", 0.0))  # Fraction of calls that fail
+
+# Blocking provider calls made from async code (the ASGI servers) run on a bounded pool of this size
+ASYNC_IO_WORKERS = int(os.environ.get("TRADEFLOW_ASYNC_IO_WORKERS", 16))
+
+# When set, live responses are also recorded into this fixtures directory (TRADEFLOW_RECORD)
+RECORD_DIR = os.environ.get("TRADEFLOW_RECORD")
+
+
+class ProviderError(Exception):
+    """Raised by a provider when an upstream call fails"""
+
+
+class MarketDataProvider(ABC):
+    """
+    Source of market data for the recommender and the stock API.
+    Providers implement quote, history and fundamentals; the batch variants
+    fall back to one call per symbol unless a provider has a bulk request.
+
+    History frames have Open/High/Low/Close/Volume/Dividends columns, a tz-naive
+    daily index and no rows without a Close.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def quote(self, symbol):
+        """Latest price for a symbol (None if unavailable)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def history(self, symbol, period="1mo", start=None, timeout=None):
+        """Daily OHLCV history covering `period`, or everything from `start` (inclusive) when given"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def fundamentals(self, symbol):
+        """Dictionary of company fundamentals in yfinance `info` form (marketCap, sector, beta, ...)"""
+        raise NotImplementedError
+
+    def quote_batch(self, symbols):
+        """Dictionary of symbol -> latest price; symbols without a price are left out"""
+        quotes = {}
+        for symbol in symbols:
+            try:
+                price = self.quote(symbol)
+            except Exception as e:
+                logger.warning(f"Quote failed for {symbol}: {str(e)}")
+                continue
+            if price is not None:
+                quotes[symbol] = price
+        return quotes
+
+    def history_batch(self, symbols, period="1mo", start=None, timeout=None):
+        """Dictionary of symbol -> history; symbols without history are left out"""
+        histories = {}
+        for symbol in symbols:
+            history = self.history(symbol, period=period, start=start, timeout=timeout)
+            if history is not None and not history.empty:
+                histories[symbol] = history
+        return histories
+
+    def fundamentals_batch(self, symbols):
+        return {symbol: self.fundamentals(symbol) for symbol in symbols}
+
+    # Async variants for the ASGI servers. By default the blocking call runs on a small shared
+    # pool, so any number of waiting requests costs at most ASYNC_IO_WORKERS threads;
+    # providers with a non-blocking client override these.
+
+    async def quote_async(self, symbol):
+        return await _run_blocking(self.quote, symbol)
+
+    async def history_async(self, symbol, period="1mo", start=None, timeout=None):
+        return await _run_blocking(self.history, symbol, period=period, start=start, timeout=timeout)
+
+    async def fundamentals_async(self, symbol):
+        return await _run_blocking(self.fundamentals, symbol)
+
+    @contextmanager
+    def _upstream(self, call):
+        """Records the latency (and failure) of one upstream call of the given type"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            UPSTREAM_ERRORS.inc(provider=self.name, call=call)
+            raise
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, provider=self.name, call=call)
+
+
+_io_executor = None
+_io_executor_lock = threading.Lock()
+
+
+def _run_blocking(fn, *args, **kwargs):
+    """Awaitable result of a blocking provider call, run on the shared async I/O pool"""
+    global _io_executor
+    with _io_executor_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(max_workers=ASYNC_IO_WORKERS, thread_name_prefix="async-upstream")
+    return asyncio.get_running_loop().run_in_executor(_io_executor, partial(fn, *args, **kwargs))
+
+
+def _clean_history(history):
+    if history is None or history.empty or "Close" not in history.columns:
+        return pd.DataFrame()
+    return normalize_history(history.dropna(subset=["Close"]))
+
+
+class YFinanceProvider(MarketDataProvider):
+    """
+    Live data from Yahoo Finance through yfinance.
+    yfinance keeps one HTTP session (and its connection pool) for every Ticker, but has
+    no async API, so the async variants use the shared blocking-call pool.
+    """
+
+    name = "yfinance"
+
+    def __init__(self):
+        if yf is None:
+            raise ProviderError("yfinance is not installed")
+
+    def quote(self, symbol):
+        stock = yf.Ticker(symbol)
+
+        # Use fast_info for better performance
+        try:
+            with self._upstream("fast_info"):
+                price = getattr(stock.fast_info, "last_price", None)
+            if price is not None:
+                return price
+        except Exception as e:
+            logger.warning(f"Fast info retrieval failed for {symbol}: {str(e)}")
+
+        # Fall back to the full info, then to the last close
+        try:
+            with self._upstream("info"):
+                info = stock.info
+        except Exception as e:
+            logger.warning(f"Full info retrieval failed for {symbol}: {str(e)}")
+            info = {}
+        for field in ("regularMarketPrice", "currentPrice", "previousClose"):
+            if info.get(field) is not None:
+                return info[field]
+
+        with self._upstream("history"):
+            history = stock.history(period="1d")
+        if not history.empty and "Close" in history.columns:
+            return history["Close"].iloc[-1]
+        return None
+
+    def history(self, symbol, period="1mo", start=None, timeout=None):
+        window = {"start": start} if start is not None else {"period": period}
+        if timeout is not None:
+            window["timeout"] = timeout
+        with self._upstream("history"):
+            history = yf.Ticker(symbol).history(**window)
+        return _clean_history(history)
+
+    def fundamentals(self, symbol):
+        with self._upstream("info"):
+            return yf.Ticker(symbol).info
+
+    def quote_batch(self, symbols):
+        """Last traded prices from one bulk intraday download; symbols it misses are quoted one by one"""
+        symbols = list(symbols)
+        with self._upstream("download"):
+            panel = yf.download(symbols, period="1d", interval="1m", group_by="ticker",
+                                threads=True, progress=False)
+        quotes = {}
+        available = set(panel.columns.get_level_values(0)) if panel is not None and not panel.empty else set()
+        for symbol in symbols:
+            if symbol in available:
+                closes = panel[symbol]["Close"].dropna()
+                if not closes.empty:
+                    quotes[symbol] = float(closes.iloc[-1])
+        quotes.update(super().quote_batch([symbol for symbol in symbols if symbol not in quotes]))
+        return quotes
+
+    def history_batch(self, symbols, period="1mo", start=None, timeout=None):
+        """One bulk multi-ticker download for all symbols"""
+        symbols = list(symbols)
+        window = {"start": start} if start is not None else {"period": period}
+        with self._upstream("download"):
+            panel = yf.download(symbols, group_by="ticker", actions=True, threads=True,
+                                progress=False, timeout=timeout, **window)
+        if panel is None or panel.empty:
+            return {}
+
+        histories = {}
+        available = set(panel.columns.get_level_values(0))
+        for symbol in symbols:
+            if symbol in available:
+                history = _clean_history(panel[symbol])
+                if not history.empty:
+                    histories[symbol] = history
+        return histories
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Serves recorded responses from a fixtures directory, for benchmarks and offline runs.
+    Histories are kept in a PriceStore under `history/`, fundamentals as JSON under `info/`.
+    Every call (a whole batch counts as one) waits `latency` plus up to `jitter` seconds
+    and fails with ProviderError at `error_rate`, to imitate the live upstream.
+    """
+
+    name = "replay"
+
+    def __init__(self, root=FIXTURES_DIR, latency=REPLAY_LATENCY, jitter=REPLAY_JITTER,
+                 error_rate=REPLAY_ERROR_RATE, seed=None):
+        self.root = root
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.histories = PriceStore(os.path.join(root, "history"))
+        self.info_dir = os.path.join(root, "info")
+        self.calls = 0  # Upstream calls served (a batch counts as one)
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def quote(self, symbol):
+        self._upstream_call("quote", symbol)
+        return self._quote(symbol)
+
+    def history(self, symbol, period="1mo", start=None, timeout=None):
+        self._upstream_call("history", symbol)
+        return self._history(symbol, period, start)
+
+    def fundamentals(self, symbol):
+        self._upstream_call("info", symbol)
+        return self._fundamentals(symbol)
+
+    async def quote_async(self, symbol):
+        await self._upstream_call_async("quote", symbol)
+        return self._quote(symbol)
+
+    async def history_async(self, symbol, period="1mo", start=None, timeout=None):
+        await self._upstream_call_async("history", symbol)
+        return self._history(symbol, period, start)
+
+    async def fundamentals_async(self, symbol):
+        await self._upstream_call_async("info", symbol)
+        return self._fundamentals(symbol)
+
+    def quote_batch(self, symbols):
+        self._upstream_call("quote_batch", f"{len(symbols)} symbols")
+        quotes = {symbol: self._quote(symbol) for symbol in symbols}
+        return {symbol: price for symbol, price in quotes.items() if price is not None}
+
+    def history_batch(self, symbols, period="1mo", start=None, timeout=None):
+        self._upstream_call("download", f"{len(symbols)} symbols")
+        histories = {symbol: self._history(symbol, period, start) for symbol in symbols}
+        return {symbol: history for symbol, history in histories.items() if not history.empty}
+
+    def fundamentals_batch(self, symbols):
+        self._upstream_call("info_batch", f"{len(symbols)} symbols")
+        return {symbol: self._fundamentals(symbol) for symbol in symbols}
+
+    def info_path(self, symbol):
+        safe = re.sub(r"[^A-Za-z0-9._-]", "_", symbol)
+        return os.path.join(self.info_dir, f"{safe}.json")
+
+    def _upstream_call(self, call, what):
+        delay, failed = self._next_call()
+        with self._upstream(call):
+            if delay > 0:
+                time.sleep(delay)
+            if failed:
+                raise ProviderError(f"Injected failure: {call} {what}")
+
+    async def _upstream_call_async(self, call, what):
+        # Waits without holding a thread, like a non-blocking HTTP client would
+        delay, failed = self._next_call()
+        with self._upstream(call):
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if failed:
+                raise ProviderError(f"Injected failure: {call} {what}")
+
+    def _next_call(self):
+        """Counts a call and draws its injected delay and failure"""
+        with self._random_lock:
+            self.calls += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+        return delay, failed
+
+    def _quote(self, symbol):
+        info = self._fundamentals(symbol)
+        for field in ("regularMarketPrice", "currentPrice", "previousClose"):
+            if info.get(field) is not None:
+                return info[field]
+        history = self.histories.read(symbol, bars=1)
+        return float(history["Close"].iloc[-1]) if history is not None else None
+
+    def _history(self, symbol, period, start):
+        history = self.histories.read(symbol)
+        if history is None:
+            return pd.DataFrame()
+        if start is not None:
+            return history[history.index >= pd.Timestamp(start)]
+        return slice_period(history, period)
+
+    def _fundamentals(self, symbol):
+        try:
+            with open(self.info_path(symbol)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+
+class RecordingProvider(MarketDataProvider):
+    """
+    Passes calls through to another provider and records the responses as
+    fixtures a ReplayProvider can serve later.
+    """
+
+    def __init__(self, upstream, root=FIXTURES_DIR):
+        self.upstream = upstream
+        self.fixtures = ReplayProvider(root)
+        self.name = f"{upstream.name}+record"
+        os.makedirs(self.fixtures.info_dir, exist_ok=True)
+
+    def quote(self, symbol):
+        return self.upstream.quote(symbol)
+
+    def quote_batch(self, symbols):
+        return self.upstream.quote_batch(symbols)
+
+    def history(self, symbol, period="1mo", start=None, timeout=None):
+        history = self.upstream.history(symbol, period=period, start=start, timeout=timeout)
+        self.fixtures.histories.append(symbol, history)
+        return history
+
+    def history_batch(self, symbols, period="1mo", start=None, timeout=None):
+        histories = self.upstream.history_batch(symbols, period=period, start=start, timeout=timeout)
+        for symbol, history in histories.items():
+            self.fixtures.histories.append(symbol, history)
+        return histories
+
+    def fundamentals(self, symbol):
+        info = self.upstream.fundamentals(symbol)
+        self._record_info(symbol, info)
+        return info
+
+    def fundamentals_batch(self, symbols):
+        infos = self.upstream.fundamentals_batch(symbols)
+        for symbol, info in infos.items():
+            self._record_info(symbol, info)
+        return infos
+
+    def _record_info(self, symbol, info):
+        path = self.fixtures.info_path(symbol)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(dict(info), f, default=str)
+        os.replace(tmp_path, path)
+
+
+_default_provider = None
+_default_provider_lock = threading.Lock()
+
+
+def default_provider():
+    """The process-wide provider selected by TRADEFLOW_PROVIDER (and TRADEFLOW_RECORD)"""
+    global _default_provider
+    with _default_provider_lock:
+        if _default_provider is None:
+            if PROVIDER == "replay":
+                _default_provider = ReplayProvider()
+            elif PROVIDER == "yfinance":
+                _default_provider = YFinanceProvider()
+            else:
+                raise ValueError(f"Unknown market data provider: {PROVIDER}")
+            if RECORD_DIR:
+                _default_provider = RecordingProvider(_default_provider, RECORD_DIR)
+        return _default_provider
+
+
+if __name__ == "__main__":
+    # Records fixtures for the given symbols (default: every symbol both services use)
+    #   python market_data.py [--period 2y] [SYMBOL ...]
+    args = sys.argv[1:]
+    period = "2y"
+    if args[:1] == ["--period"]:
+        period, args = args[1], args[2:]
+    if not args:
+        from stock_symbols import INDIAN_STOCK_SYMBOLS
+        from stock_api import KNOWN_TICKERS
+        args = sorted(set(INDIAN_STOCK_SYMBOLS) | KNOWN_TICKERS)
+
+    recorder = RecordingProvider(YFinanceProvider(), RECORD_DIR or FIXTURES_DIR)
+    for symbol in args:
+        try:
+            recorder.history(symbol, period=period)
+            recorder.fundamentals(symbol)
+            print(f"Recorded {symbol}")
+        except Exception as e:
+            print(f"Could not record {symbol} ({str(e)}).")
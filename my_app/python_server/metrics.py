@@ -0,0 +1,251 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram buckets in seconds (upstream calls and renders can take several seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Registry:
+    """Collection of metrics rendered together by a /metrics endpoint"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        # Re-registering a name (e.g. a module imported twice) replaces the old metric
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Returns every metric in Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry both services expose
+REGISTRY = Registry()
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count.
+    With `callback`, values are read at scrape time instead: callback() returns
+    a number, or a dictionary of label-value tuples -> number.
+    """
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, callback=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.callback = callback
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        values = _callback_values(self) if self.callback is not None else self._snapshot()
+        return [f"{self.name}{self._labels(key)} {_format(value)}" for key, value in sorted(values.items())]
+
+    def _snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(Counter):
+    """Value that can go up and down (supports `callback` like Counter)"""
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Distribution of observed values (usually durations in seconds) over fixed buckets"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes how long the `with` block took, whether or not it raised"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        if not series and not self.labelnames:
+            series[()] = [0] * (len(self.buckets) + 2)
+
+        lines = []
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._labels(key, ('le', _format(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._labels(key, ('le', '+Inf'))} {values[-1]}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format(values[-2])}")
+            lines.append(f"{self.name}_count{self._labels(key)} {values[-1]}")
+        return lines
+
+
+def instrument_app(app, registry=REGISTRY):
+    """
+    Adds a /metrics endpoint to a Flask app and records the latency of every request
+    by route (the URL rule, so /stocks/<category> is one series).
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route)
+            REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+        return response
+
+    def metrics():
+        return Response(registry.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+    app.add_url_rule("/metrics", "metrics", metrics, methods=["GET"])
+    return app
+
+
+def register_cache(name, cache):
+    """
+    Exposes a cache's hit/miss/eviction counters and size on /metrics, read at scrape time.
+    `cache` is a BoundedCache (or anything with a stats() method returning the same fields),
+    or a function returning those stats.
+    """
+    with _caches_lock:
+        _caches[name] = cache
+
+
+def _cache_stats(field):
+    def collect():
+        with _caches_lock:
+            caches = list(_caches.items())
+        return {(name,): (cache.stats() if hasattr(cache, "stats") else cache())[field] for name, cache in caches}
+    return collect
+
+
+def _callback_values(metric):
+    value = metric.callback()
+    values = value if isinstance(value, dict) else {(): value}
+    return {key: value for key, value in values.items() if value is not None}
+
+
+def _format(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if math.isnan(value):
+            return "NaN"
+        return repr(value)
+    return str(value)
+
+
+def _escape_help(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# Shared by both services
+REQUEST_SECONDS = Histogram("tradeflow_http_request_duration_seconds",
+                            "HTTP request latency by route", ["method", "route"])
+REQUESTS = Counter("tradeflow_http_requests_total", "HTTP requests by route and status",
+                   ["method", "route", "status"])
+UPSTREAM_SECONDS = Histogram("tradeflow_upstream_request_duration_seconds",
+                             "Market data provider call latency by call type", ["provider", "call"])
+UPSTREAM_ERRORS = Counter("tradeflow_upstream_errors_total",
+                          "Market data provider calls that raised, by call type", ["provider", "call"])
+
+# Caches registered with register_cache()
+_caches = {}
+_caches_lock = threading.Lock()
+CACHE_HITS = Counter("tradeflow_cache_hits_total", "Cache lookups that found an entry",
+                     ["cache"], callback=_cache_stats("hits"))
+CACHE_MISSES = Counter("tradeflow_cache_misses_total", "Cache lookups that found nothing usable",
+                       ["cache"], callback=_cache_stats("misses"))
+CACHE_EVICTIONS = Counter("tradeflow_cache_evictions_total", "Cache entries dropped for size or age",
+                          ["cache"], callback=_cache_stats("evictions"))
+CACHE_ENTRIES = Gauge("tradeflow_cache_entries", "Entries currently cached",
+                      ["cache"], callback=_cache_stats("size"))
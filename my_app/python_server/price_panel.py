@@ -0,0 +1,126 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from price_store import normalize_history
+
+# Daily bars kept per ticker: MA200 plus time for the slow EMAs to settle, and a full
+# covariance window (see risk_model.RISK_WINDOW)
+PANEL_BARS = 300
+
+# Price fields held for every ticker (a bar exists where its Close does)
+PANEL_FIELDS = ("Open", "High", "Low", "Close", "Volume", "Dividends")
+
+
+class PricePanel:
+    """
+    Wide (dates x tickers) daily price arrays of a whole universe over the last `bars`
+    trading days (every date with bars=None), one array per field, so indicators and the
+    returns covariance are computed across all tickers in single array passes. Tickers
+    without a bar on a given date have NaN there.
+    Merges build new arrays and swap them in, so readers always see a consistent panel.
+    """
+
+    def __init__(self, bars=PANEL_BARS, fields=PANEL_FIELDS):
+        self.bars = bars
+        self.fields = tuple(fields)
+        self._state = (np.empty(0, dtype="datetime64[ns]"), (), {},
+                       {field: np.empty((0, 0)) for field in self.fields})
+        self._lock = threading.Lock()
+
+    def __contains__(self, symbol):
+        return symbol in self._state[2]
+
+    def __len__(self):
+        return len(self._state[1])
+
+    @property
+    def symbols(self):
+        return self._state[1]
+
+    @property
+    def dates(self):
+        return self._state[0]
+
+    def merge(self, price_history):
+        """Adds the bars of {symbol: history DataFrame}; bars for dates already held replace them"""
+        bars = {}
+        close = self.fields.index("Close")
+        for symbol, history in price_history.items():
+            if history is None or history.empty or "Close" not in history.columns:
+                continue
+            history = normalize_history(history)
+            if not history.index.is_unique:
+                history = history[~history.index.duplicated(keep="last")]
+            values = np.full((len(history), len(self.fields)), np.nan)
+            for i, field in enumerate(self.fields):
+                if field in history.columns:
+                    values[:, i] = history[field].to_numpy(dtype=float)
+            present = ~np.isnan(values[:, close])
+            bars[symbol] = (history.index.values.astype("datetime64[ns]")[present], values[present])
+        if not bars:
+            return
+
+        with self._lock:
+            dates, symbols, positions, values = self._state
+            new_symbols = tuple(sorted(set(symbols).union(bars)))
+            new_dates = np.unique(np.concatenate([dates] + [bar_dates for bar_dates, _ in bars.values()]))
+            new_positions = {symbol: i for i, symbol in enumerate(new_symbols)}
+
+            # Held values move to their new rows and columns, then every new bar is scattered into place
+            rows = np.searchsorted(new_dates, dates)
+            columns = np.array([new_positions[symbol] for symbol in symbols], dtype=np.intp)
+            merged = {}
+            for field in self.fields:
+                merged[field] = np.full((len(new_dates), len(new_symbols)), np.nan)
+                if len(rows) and len(columns):
+                    merged[field][np.ix_(rows, columns)] = values[field]
+            for symbol, (bar_dates, bar_values) in bars.items():
+                bar_rows = np.searchsorted(new_dates, bar_dates)
+                column = new_positions[symbol]
+                for i, field in enumerate(self.fields):
+                    merged[field][bar_rows, column] = bar_values[:, i]
+
+            keep = slice(-self.bars, None) if self.bars is not None else slice(None)
+            self._state = (new_dates[keep], new_symbols, new_positions,
+                           {field: values[keep] for field, values in merged.items()})
+
+    def arrays(self, symbols=None, bars=None):
+        """
+        (dates, symbols, {field: (dates x symbols) array}) for the held `symbols` (default: all),
+        over the last `bars` dates. Without `symbols` these are views of the panel - don't modify them.
+        """
+        dates, held, positions, values = self._state
+        rows = slice(-bars, None) if bars is not None else slice(None)
+        if symbols is None:
+            return dates[rows], held, {field: array[rows] for field, array in values.items()}
+        symbols = tuple(symbol for symbol in symbols if symbol in positions)
+        columns = np.array([positions[symbol] for symbol in symbols], dtype=np.intp)
+        return dates[rows], symbols, {field: array[rows][:, columns] for field, array in values.items()}
+
+    def frame(self, field, bars=None):
+        """One field as a DataFrame of dates x symbols"""
+        dates, symbols, values = self.arrays(bars=bars)
+        return pd.DataFrame(values[field], index=pd.DatetimeIndex(dates), columns=list(symbols))
+
+    def history(self, symbol, bars=None):
+        """A ticker's bars (dates it has no bar for left out) as a history DataFrame, or None"""
+        dates, symbols, values = self.arrays([symbol])
+        if not symbols:
+            return None
+        present = ~np.isnan(values["Close"][:, 0])
+        history = pd.DataFrame({field: values[field][present, 0] for field in self.fields},
+                               index=pd.DatetimeIndex(dates[present], name="Date"))
+        return history.iloc[-bars:] if bars is not None else history
+
+    def last_dates(self):
+        """{symbol: Timestamp of its newest bar} for every ticker with a bar in the panel"""
+        dates, symbols, _, values = self._state
+        present = ~np.isnan(values["Close"])
+        if not present.size:
+            return {}
+        # Index of the last present row in each column
+        last = len(dates) - 1 - np.argmax(present[::-1], axis=0)
+        return {symbol: pd.Timestamp(dates[row]) for symbol, row, any_bar
+                in zip(symbols, last, present.any(axis=0)) if any_bar}
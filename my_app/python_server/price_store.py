@@ -0,0 +1,183 @@
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows - only in-process locking
+    fcntl = None
+
+# Where price history is kept between restarts (can be overridden with TRADEFLOW_PRICE_STORE)
+PRICE_STORE_DIR = os.environ.get(
+    "TRADEFLOW_PRICE_STORE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "price_store"))
+
+# One fixed-size record per daily bar; dates are stored as naive datetime64[ns]
+BAR_DTYPE = np.dtype([
+    ("date", "<i8"), ("Open", "<f8"), ("High", "<f8"), ("Low", "<f8"),
+    ("Close", "<f8"), ("Volume", "<f8"), ("Dividends", "<f8"),
+])
+PRICE_COLUMNS = BAR_DTYPE.names[1:]
+
+# yfinance-style period strings -> how far back they reach
+PERIOD_OFFSETS = {
+    "1d": pd.DateOffset(days=1), "5d": pd.DateOffset(days=5),
+    "1mo": pd.DateOffset(months=1), "3mo": pd.DateOffset(months=3),
+    "6mo": pd.DateOffset(months=6), "1y": pd.DateOffset(years=1),
+    "2y": pd.DateOffset(years=2), "5y": pd.DateOffset(years=5),
+}
+
+
+def slice_period(history, period):
+    """Returns the trailing `period` (e.g. "1mo") of a history frame"""
+    if history is None or history.empty or period not in PERIOD_OFFSETS:
+        return history
+    start = history.index[-1] - PERIOD_OFFSETS[period]
+    return history[history.index > start]
+
+
+def covers_period(history, period):
+    """Whether a history frame reaches back far enough to serve `period`"""
+    if history is None or history.empty or period not in PERIOD_OFFSETS:
+        return False
+    return history.index[0] <= history.index[-1] - PERIOD_OFFSETS[period]
+
+
+def normalize_history(history):
+    """Drops the timezone from a daily history index so stored and downloaded bars compare equal"""
+    if getattr(history.index, "tz", None) is not None:
+        history = history.copy()
+        history.index = history.index.tz_localize(None)
+    return history
+
+
+class PriceStore:
+    """
+    Persistent, append-only daily OHLCV store with one file per ticker.
+    Each file is a flat array of BAR_DTYPE records. Appends only ever add whole records
+    after the last good one, so a crash or failed fetch can at worst leave a torn tail
+    record, which is ignored on read and cut off by the next append.
+    Processes sharing the store lock a separate `.lock` file per ticker - exclusively to
+    write, shared to read - so readers never see a file being truncated or rewritten, and
+    writers always open the data file that is current once they hold the lock.
+    """
+
+    def __init__(self, root=PRICE_STORE_DIR):
+        self.root = root
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, symbol):
+        safe = re.sub(r"[^A-Za-z0-9._-]", "_", symbol)
+        return os.path.join(self.root, f"{safe}.bars")
+
+    def read(self, symbol, bars=None):
+        """
+        Returns the stored history for a symbol as a DataFrame (None if nothing is stored).
+        With `bars`, only the most recent `bars` records are read.
+        """
+        records = self._records(symbol, bars)
+        if records is None:
+            return None
+        index = pd.DatetimeIndex(records["date"].astype("datetime64[ns]"), name="Date")
+        return pd.DataFrame({column: np.array(records[column]) for column in PRICE_COLUMNS}, index=index)
+
+    def last_date(self, symbol):
+        records = self._records(symbol, bars=1)
+        if records is None:
+            return None
+        return pd.Timestamp(records["date"][-1])
+
+    def append(self, symbol, history):
+        """
+        Stores the bars of `history` that are at or after the last stored date.
+        A bar with the same date as the last stored one replaces it (intraday updates).
+        History reaching back before the first stored bar is merged in by rewriting the file.
+        Returns the number of records written.
+        """
+        if history is None or history.empty:
+            return 0
+        history = normalize_history(history)
+        records = np.zeros(len(history), dtype=BAR_DTYPE)
+        records["date"] = history.index.values.astype("datetime64[ns]").astype(np.int64)
+        for column in PRICE_COLUMNS:
+            if column in history.columns:
+                records[column] = history[column].to_numpy(dtype=float)
+        path = self.path(symbol)
+
+        # The data file is opened only once the lock is held: a rewrite replaces it
+        with self._lock(symbol), self._file_lock(path, exclusive=True), open(path, "a+b") as f:
+            size = os.fstat(f.fileno()).st_size
+            good_size = size - size % BAR_DTYPE.itemsize
+            first = last = None
+            if good_size:
+                f.seek(0)
+                first = np.frombuffer(f.read(BAR_DTYPE.itemsize), dtype=BAR_DTYPE)[0]["date"]
+                f.seek(good_size - BAR_DTYPE.itemsize)
+                last = np.frombuffer(f.read(BAR_DTYPE.itemsize), dtype=BAR_DTYPE)[0]["date"]
+
+            if first is not None and records["date"][0] < first:
+                return self._rewrite(path, f, good_size, records)
+
+            if last is not None:
+                records = records[records["date"] >= last]
+            if len(records) == 0:
+                return 0
+
+            # Cut off a torn tail record and the bar being replaced before appending
+            if last is not None and records["date"][0] == last:
+                good_size -= BAR_DTYPE.itemsize
+            if good_size != size:
+                f.truncate(good_size)
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+            return len(records)
+
+    def _rewrite(self, path, f, good_size, records):
+        """Merges new records with the stored ones (new bars win) and atomically replaces the file"""
+        f.seek(0)
+        stored = np.frombuffer(f.read(good_size), dtype=BAR_DTYPE)
+        stored = stored[~np.isin(stored["date"], records["date"])]
+        merged = np.concatenate([stored, records])
+        merged = merged[np.argsort(merged["date"], kind="stable")]
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as tmp:
+            tmp.write(merged.tobytes())
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, path)
+        return len(records)
+
+    def _records(self, symbol, bars=None):
+        """The last `bars` (default: all) whole records of a symbol, or None if nothing is stored"""
+        path = self.path(symbol)
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return None
+        with f, self._file_lock(path, exclusive=False):
+            # Read only whole records so a torn tail is ignored
+            stored = os.fstat(f.fileno()).st_size // BAR_DTYPE.itemsize
+            count = min(stored, bars) if bars is not None else stored
+            if count == 0:
+                return None
+            f.seek((stored - count) * BAR_DTYPE.itemsize)
+            return np.frombuffer(f.read(count * BAR_DTYPE.itemsize), dtype=BAR_DTYPE)
+
+    @contextmanager
+    def _file_lock(self, path, exclusive):
+        """Holds the lock file of a data file - it is never replaced, unlike the data file"""
+        with open(f"{path}.lock", "a+b") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def _lock(self, symbol):
+        with self._locks_lock:
+            return self._locks.setdefault(symbol, threading.Lock())
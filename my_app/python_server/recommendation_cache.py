@@ -0,0 +1,140 @@
+import itertools
+import threading
+
+from bounded_cache import BoundedCache, MISSING
+from stock_recommender import recommend_stocks, recommend_stocks_batch
+
+# Cache tuning (can be adjusted)
+RECOMMENDATION_CACHE_SIZE = 2048
+
+# Representative horizons for each horizon bucket (see horizon_bucket)
+HORIZON_BUCKETS = {"short": 1, "two-year": 2, "medium": 5, "long": 10}
+
+# Profiles pre-computed right after a refresh: every risk/goal/horizon/dividend
+# combination with no sector or market cap restriction
+COMMON_PROFILES = [
+    {
+        "risk_appetite": risk,
+        "investment_goal": goal,
+        "investment_horizon": horizon,
+        "sector_preference": "all",
+        "market_cap_preference": "all",
+        "dividend_preference": dividend,
+        "investment_amount": 0,
+    }
+    for risk, goal, horizon, dividend in itertools.product(
+        ["low", "medium", "high"], ["growth", "dividends", "both"],
+        HORIZON_BUCKETS.values(), ["yes", "no"])
+]
+
+
+def horizon_bucket(investment_horizon):
+    """
+    Maps an investment horizon onto the ranges the scoring and guidance rules distinguish
+    (scoring splits at <=2 and <=5 years, guidance at <2 and >5 years).
+    """
+    if investment_horizon < 2:
+        return "short"
+    if investment_horizon <= 2:
+        return "two-year"
+    if investment_horizon <= 5:
+        return "medium"
+    return "long"
+
+
+def normalize_profile(user_input):
+    """
+    Reduces a user profile to the fields that affect recommendations.
+    Two profiles with the same key always get the same recommendations for the same data.
+    """
+    sector_preference = user_input["sector_preference"]
+    return (
+        user_input["risk_appetite"],
+        user_input["investment_goal"],
+        horizon_bucket(user_input["investment_horizon"]),
+        # "all" is matched exactly, other sectors case-insensitively
+        sector_preference == "all",
+        str(sector_preference).lower(),
+        user_input["market_cap_preference"],
+        user_input["dividend_preference"],
+    )
+
+
+class RecommendationCache:
+    """
+    Memoizes recommend_stocks results by normalized profile and data generation.
+    The generation is bumped by invalidate() whenever the stock data is refreshed.
+    """
+
+    def __init__(self, maxsize=RECOMMENDATION_CACHE_SIZE):
+        self.cache = BoundedCache(maxsize)
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def invalidate(self, generation=None):
+        """
+        Drops every cached result and moves to a new data generation
+        (the next one, unless the publisher supplies its own).
+        Call this after the new stock data has been published.
+        """
+        with self.lock:
+            self.generation = self.generation + 1 if generation is None else generation
+            self.cache.clear()
+            return self.generation
+
+    def recommend(self, user_input, stock_data, generation=None):
+        """
+        Returns recommend_stocks(user_input, stock_data), computing it only on a cache miss.
+        `generation` must identify `stock_data` (read both from one published snapshot).
+        """
+        if generation is None:
+            generation = self.generation
+        key = (generation, normalize_profile(user_input))
+        recommendations = self.cache.get(key)
+        if recommendations is MISSING:
+            recommendations = recommend_stocks(user_input, stock_data)
+            self.cache.set(key, recommendations)
+        return recommendations
+
+    def recommend_batch(self, user_inputs, stock_data, generation=None):
+        """
+        recommend() for many profiles: cached profiles are reused, and every distinct uncached
+        profile is scored in one recommend_stocks_batch call. Returns one list per profile.
+        A large batch is not cached, so it can't evict the entries interactive requests rely on.
+        """
+        if generation is None:
+            generation = self.generation
+        keys = [(generation, normalize_profile(user_input)) for user_input in user_inputs]
+        results = {}
+        missing = {}
+        for key, user_input in zip(keys, user_inputs):
+            if key in results or key in missing:
+                continue
+            recommendations = self.cache.get(key)
+            if recommendations is MISSING:
+                missing[key] = user_input
+            else:
+                results[key] = recommendations
+        
+        if missing:
+            computed = recommend_stocks_batch(list(missing.values()), stock_data)
+            cache_results = len(missing) <= self.cache.maxsize // 4
+            for key, recommendations in zip(missing, computed):
+                results[key] = recommendations
+                if cache_results:
+                    self.cache.set(key, recommendations)
+        return [results[key] for key in keys]
+
+    def prewarm(self, stock_data, profiles=COMMON_PROFILES, generation=None):
+        """Computes and caches recommendations for the given profiles"""
+        if generation is None:
+            generation = self.generation
+        for profile in profiles:
+            key = (generation, normalize_profile(profile))
+            if key not in self.cache:
+                self.cache.set(key, recommend_stocks(profile, stock_data))
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats["generation"] = self.generation
+        return stats
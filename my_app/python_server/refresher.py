@@ -0,0 +1,251 @@
+import json
+import os
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+from metrics import Counter, Histogram
+from shared_file import POLL_INTERVAL, SharedFileWatcher
+from universe import UniverseSnapshot
+
+# Default time between automatic refreshes (in seconds)
+REFRESH_INTERVAL = 900  # 15 minutes
+
+# What readers get from SnapshotRefresher.current - always replaced as a whole
+PublishedSnapshot = namedtuple("PublishedSnapshot", ["snapshot", "generation", "published_at"])
+
+# Instrumentation (exposed on /metrics)
+REFRESH_SECONDS = Histogram("tradeflow_refresh_duration_seconds", "Time to build a new snapshot",
+                            buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200))
+REFRESH_FAILURES = Counter("tradeflow_refresh_failures_total",
+                           "Refreshes that failed or fetched nothing and kept the previous snapshot")
+
+
+class SnapshotRefresher:
+    """
+    Rebuilds the stock universe on a background thread and publishes it atomically.
+    The next snapshot is built off to the side; readers keep using the current one
+    until a single reference swap makes the new one visible, so they never wait on
+    upstream I/O or see a half-built snapshot.
+    """
+
+    def __init__(self, fetch, symbols, interval=REFRESH_INTERVAL, on_publish=None):
+        self.fetch = fetch            # fetch(symbols, progress=callback) -> snapshot
+        self.symbols = symbols
+        self.interval = interval
+        self.on_publish = on_publish  # Called with the PublishedSnapshot after each swap
+        self.current = PublishedSnapshot({}, 0, None)
+
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._running = threading.Lock()  # Held while a refresh is in progress
+        self._status_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._status = {
+            "state": "idle",
+            "completed": 0,
+            "total": len(symbols),
+            "started_at": None,
+            "last_success": None,
+            "last_duration": None,
+            "last_error": None,
+            "refreshes": 0,
+        }
+
+    def start(self):
+        """Starts the background loop (once); the first refresh runs immediately"""
+        if self._thread is not None:
+            return self
+        with self._thread_lock:
+            if self._thread is None:
+                self._wakeup.set()
+                self._thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def trigger(self):
+        """
+        Asks the background loop to refresh now.
+        Returns False if a refresh is already in progress.
+        """
+        if self._running.locked():
+            return False
+        self._wakeup.set()
+        return True
+
+    def refresh(self):
+        """Runs one refresh on the calling thread and publishes the result"""
+        with self._running:
+            self._update_status(state="running", completed=0, total=len(self.symbols),
+                                started_at=time.time(), last_error=None)
+            started = time.monotonic()
+            try:
+                snapshot = self.fetch(self.symbols, progress=self._on_progress)
+            except Exception as e:
+                print(f"Error refreshing stock data: {str(e)}")
+                traceback.print_exc()
+                REFRESH_FAILURES.inc()
+                self._update_status(state="idle", last_error=str(e))
+                return None
+            REFRESH_SECONDS.observe(time.monotonic() - started)
+
+            # A refresh that fetched nothing (e.g. upstream outage) shouldn't replace good data
+            if not snapshot and self.current.snapshot:
+                REFRESH_FAILURES.inc()
+                self._update_status(state="idle", last_error="No stock data fetched; keeping previous snapshot")
+                return None
+
+            published = PublishedSnapshot(snapshot, self.current.generation + 1, time.time())
+            self.current = published  # Atomic reference swap
+            self._update_status(state="idle", last_success=published.published_at,
+                                last_duration=round(time.monotonic() - started, 3),
+                                refreshes=self._status["refreshes"] + 1)
+
+        if self.on_publish is not None:
+            try:
+                self.on_publish(published)
+            except Exception as e:
+                print(f"Error in post-refresh hook: {str(e)}")
+        return published
+
+    def status(self):
+        """Returns a copy of the refresh status, including progress of a running refresh"""
+        with self._status_lock:
+            status = dict(self._status)
+        current = self.current
+        status["generation"] = current.generation
+        status["symbols"] = len(current.snapshot)
+        status["snapshot_age"] = (round(time.time() - current.published_at, 3)
+                                  if current.published_at is not None else None)
+        status["interval"] = self.interval
+        return status
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            self.refresh()
+
+    def _on_progress(self, completed, total):
+        self._update_status(completed=completed, total=total)
+
+    def _update_status(self, **changes):
+        with self._status_lock:
+            self._status.update(changes)
+
+
+class SharedSnapshotPublisher:
+    """
+    Publishes snapshots to a shared file for SharedSnapshotSource readers in other processes.
+    Alongside the snapshot it keeps `<path>.status` (the refresher's status) up to date and
+    turns `<path>.trigger` requests from the readers into refreshes.
+    """
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.status_path = f"{path}.status"
+        self.trigger_path = f"{path}.trigger"
+        self._refresher = None
+
+    def publish(self, published):
+        """on_publish hook for SnapshotRefresher"""
+        published.snapshot.write_shared(self.path, generation=published.generation,
+                                        published_at=published.published_at)
+        if self._refresher is not None:
+            self._write_status(self._refresher.status())
+
+    def serve(self, refresher):
+        """Runs the refresher and relays status and triggers until stopped (blocks)"""
+        self._refresher = refresher
+        refresher.start()
+        try:
+            while True:
+                if os.path.exists(self.trigger_path):
+                    try:
+                        os.remove(self.trigger_path)
+                    except FileNotFoundError:
+                        pass
+                    refresher.trigger()
+                self._write_status(refresher.status())
+                time.sleep(self.poll_interval)
+        finally:
+            refresher.stop()
+
+    def _write_status(self, status):
+        tmp_path = f"{self.status_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(status, f)
+        os.replace(tmp_path, self.status_path)
+
+
+class SharedSnapshotSource:
+    """
+    Read-only stand-in for SnapshotRefresher in worker processes.
+    `current` maps the snapshot a SharedSnapshotPublisher wrote (without copying it), so
+    any number of workers share one refresher and one copy of the data.
+    """
+
+    def __init__(self, path, on_publish=None, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.on_publish = on_publish  # Called with the PublishedSnapshot when a new one is mapped
+        self.status_path = f"{path}.status"
+        self.trigger_path = f"{path}.trigger"
+        self._watcher = SharedFileWatcher(path, poll_interval)
+        self._shared = None
+        self._published = PublishedSnapshot({}, 0, None)
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        shared = self._watcher.get()
+        if shared is self._shared:
+            return self._published
+        with self._lock:
+            if shared is not self._shared:
+                published = PublishedSnapshot(UniverseSnapshot.from_shared(shared),
+                                              shared.meta["generation"], shared.meta["published_at"])
+                if self.on_publish is not None:
+                    try:
+                        self.on_publish(published)
+                    except Exception as e:
+                        print(f"Error in post-refresh hook: {str(e)}")
+                self._published = published
+                self._shared = shared
+        return self._published
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def trigger(self):
+        """
+        Asks the publishing process to refresh now.
+        Returns False if a refresh is already in progress (the request is then a no-op).
+        """
+        with open(self.trigger_path, "a"):
+            pass
+        return self.status().get("state") != "running"
+
+    def status(self):
+        try:
+            with open(self.status_path) as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            status = {"state": "unknown"}
+        current = self.current
+        status["generation"] = current.generation
+        status["symbols"] = len(current.snapshot)
+        status["snapshot_age"] = (round(time.time() - current.published_at, 3)
+                                  if current.published_at is not None else None)
+        return status
@@ -0,0 +1,163 @@
+import gzip
+import hashlib
+import json
+import math
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # Encoded with the standard json module instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Only gzip variants are precomputed
+    brotli = None
+
+# Bodies smaller than this are only kept uncompressed (headers would eat most of the saving)
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Content codings in order of preference when a client accepts several equally
+CODINGS = ("br", "gzip")
+
+if orjson is not None:
+    _OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+                | orjson.OPT_APPEND_NEWLINE)
+
+
+def dumps(data, default=None):
+    """
+    Compact JSON bytes of `data` with sorted keys and a trailing newline. NumPy scalars and
+    arrays are encoded directly and NaN/infinity as null. `default` converts any other type
+    or raises TypeError.
+
+    orjson and the json fallback give the same bytes, except for floats in exponent notation
+    (1e16 and 1e+16 are the same number) and the order of non-string dictionary keys.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=default, option=_OPTIONS)
+    convert = lambda value: _finite(_plain(value, default))
+    try:
+        text = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, allow_nan=False,
+                          default=convert)
+    except ValueError:
+        # NaN or infinity somewhere in the data: replace them with None, as orjson does
+        text = json.dumps(_finite(data), sort_keys=True, separators=(",", ":"), ensure_ascii=False, allow_nan=False,
+                          default=convert)
+    return (text + "\n").encode("utf-8")
+
+
+def _plain(value, default):
+    if isinstance(value, (np.generic, np.ndarray)):
+        if value.dtype.kind == "f" and value.dtype.itemsize < 8:
+            # Shortest repr of the narrow float (0.1, not 0.10000000149011612), like orjson
+            value = value.astype(str).astype(float)
+        return value.tolist()
+    if default is not None:
+        return default(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _finite(value):
+    """`value` with NaN and infinite floats in it (at any depth) replaced by None"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def compress(body):
+    """{content coding: compressed body} for every available coding that makes `body` smaller"""
+    if len(body) < MIN_COMPRESS_BYTES:
+        return {}
+    variants = {"gzip": gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return {coding: variant for coding, variant in variants.items() if len(variant) < len(body)}
+
+
+def accepted_codings(header):
+    """{content coding: q-value} of an Accept-Encoding header"""
+    codings = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+class EncodedResponse:
+    """
+    A JSON response body encoded once, with its gzip (and brotli, when installed) variants,
+    so serving it is a copy of bytes chosen by the request's Accept-Encoding. Bodies can be
+    bytes or read-only buffers (e.g. blobs of a shared file).
+    """
+
+    def __init__(self, bodies, etag):
+        self.bodies = bodies  # {content coding or "identity": body}
+        self.etag = etag
+
+    @classmethod
+    def encode(cls, data):
+        body = dumps(data)
+        return cls(dict(compress(body), identity=body), hashlib.sha1(body).hexdigest())
+
+    def negotiate(self, accept_encoding):
+        """(content coding or None, body) for a request's Accept-Encoding header"""
+        accepted = accepted_codings(accept_encoding)
+        fallback = accepted.get("*", 0.0)
+        best, best_q = None, 0.0
+        for coding in CODINGS:
+            q = accepted.get(coding, fallback)
+            if coding in self.bodies and q > best_q:
+                best, best_q = coding, q
+        if best is not None:
+            return best, self.bodies[best]
+        return None, self.bodies["identity"]
+
+    def headers(self, coding):
+        """Headers for the `coding` variant; each variant has its own ETag"""
+        headers = {"Vary": "Accept-Encoding", "ETag": f'"{self.variant_etag(coding)}"'}
+        if coding is not None:
+            headers["Content-Encoding"] = coding
+        return headers
+
+    def variant_etag(self, coding):
+        return f"{self.etag}-{coding}" if coding is not None else self.etag
+
+
+def use_fast_json(app):
+    """
+    Makes a Flask app's jsonify encode with dumps() (NumPy-aware, orjson when installed).
+    Responses stay compact in debug mode too, where Flask's own provider would pretty-print.
+    """
+    from flask.json.provider import DefaultJSONProvider
+
+    class FastJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            return dumps(obj, default=self.default).decode("utf-8").rstrip("\n")
+
+        def response(self, *args, **kwargs):
+            data = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(dumps(data, default=self.default), mimetype=self.mimetype)
+
+    app.json = FastJSONProvider(app)
+    return app
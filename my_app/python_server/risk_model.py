@@ -0,0 +1,312 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from allocation import allocation_weights
+from bounded_cache import BoundedCache, MISSING
+from metrics import Histogram
+from price_panel import PricePanel
+
+# Daily returns in the covariance window (about one trading year)
+RISK_WINDOW = 252
+
+# Returns a stock needs inside the window before it gets a risk estimate
+MIN_RISK_OBSERVATIONS = 60
+
+# Index every ticker's beta is regressed against (can be overridden with TRADEFLOW_BENCHMARK)
+BENCHMARK_SYMBOL = os.environ.get("TRADEFLOW_BENCHMARK", "^NSEI")
+
+# Trailing windows (in trading days) betas are estimated over; scoring uses SCORING_BETA
+BETA_WINDOWS = {"beta_3m": 63, "beta_6m": 126, "beta_1y": 252}
+SCORING_BETA = "beta_1y"
+
+# Incremental updates between full recomputations of the cross products (stops float drift)
+RISK_RESYNC_EVERY = 50
+
+# Allocations memoized per risk model (one per refresh), by stock set and method
+PORTFOLIO_CACHE_SIZE = 4096
+
+# Instrumentation (exposed on /metrics)
+RISK_UPDATE_SECONDS = Histogram("tradeflow_risk_update_duration_seconds",
+                                "Time to bring the returns covariance up to date with new bars")
+BETA_SECONDS = Histogram("tradeflow_beta_duration_seconds",
+                         "Time to regress every ticker's returns on the benchmark index")
+
+
+class CovarianceEngine:
+    """
+    Rolling covariance of the daily returns of every ticker it has been fed, over the last
+    `window` trading days. Reads the aligned closes from a PricePanel and keeps the returns
+    cross products (RᵀR, and the sums and counts of returns over the days each pair of tickers
+    both has one), so a refresh that only adds or revises a few days costs a rank-k update
+    instead of recomputing the whole (tickers x tickers) products.
+    Each covariance only uses the days both tickers have a return, so days before a listing or
+    around a halt are left out rather than counted as flat days.
+    """
+
+    def __init__(self, panel=None, window=RISK_WINDOW):
+        self.window = window
+        # Closes are read from a PricePanel, shared with the indicators when given one
+        self.panel = panel if panel is not None else PricePanel(window + 1, fields=("Close",))
+        self._dates = None            # Dates, symbols and returns matrix the sums were built from
+        self._symbols = None
+        self._returns = None
+        self._observed = None         # Which returns were actually observed (not filled in)
+        self._observations = None     # Non-missing returns per symbol
+        self._cross = None            # Σ rᵢrⱼ
+        self._sums = None             # Σ rᵢ over the days j has a return too
+        self._pairs = None            # Days both i and j have a return
+        self._updates = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, symbol):
+        return symbol in self.panel
+
+    @property
+    def closes(self):
+        """Dates x symbols, the last window + 1 closes"""
+        return self.panel.frame("Close", bars=self.window + 1)
+
+    def merge(self, price_history):
+        """Adds the bars of {symbol: history DataFrame} to the panel; bars for dates already held replace them"""
+        self.panel.merge(price_history)
+
+    def update(self, price_history=None):
+        """merge() new bars, then bring the cross products up to date"""
+        if price_history:
+            self.merge(price_history)
+        with self._lock, RISK_UPDATE_SECONDS.time():
+            self._refresh()
+
+    def model(self, symbols=None):
+        """RiskModel of `symbols` (default: every ticker held) as of the last update, or None"""
+        with self._lock:
+            if self._returns is None or len(self._dates) < 2:
+                return None
+            positions = {symbol: i for i, symbol in enumerate(self._symbols)}
+            if symbols is None:
+                symbols = self._symbols
+            symbols = [symbol for symbol in symbols if symbol in positions]
+            rows = np.array([positions[symbol] for symbol in symbols], dtype=np.intp)
+            index = np.ix_(rows, rows)
+            cross, sums, pairs = self._cross[index], self._sums[index], self._pairs[index]
+            observations = self._observations[rows]
+            as_of = pd.Timestamp(self._dates[-1]).isoformat()
+        # Pairwise sample covariance; pairs without two common returns carry no information
+        with np.errstate(divide="ignore", invalid="ignore"):
+            covariance = (cross - sums * sums.T / pairs) / (pairs - 1)
+        covariance = np.where(pairs >= 2, covariance, 0.0)
+        return RiskModel(symbols, covariance, correlation_matrix(covariance), observations, as_of)
+
+    def betas(self, benchmark=BENCHMARK_SYMBOL, windows=BETA_WINDOWS):
+        """
+        Every ticker's beta to `benchmark` over each trailing window as of the last update:
+        {window name: {symbol: beta}}, with NaN for tickers that have too few returns in it.
+        All tickers are regressed at once; a window longer than the history held uses all of it.
+        """
+        with BETA_SECONDS.time():
+            panel = self._panel(benchmark)
+            if panel is None:
+                return {name: {} for name in windows}
+            returns, observed, benchmark_returns, _, symbols = panel
+            # Daily terms once over the longest window; shorter windows sum their tail of it
+            longest = min(max(windows.values()), len(returns))
+            terms = _regression_sums(returns[-longest:], observed[-longest:], benchmark_returns[-longest:])
+            betas = {}
+            for name, window in windows.items():
+                window = min(window, longest)
+                values = _betas(*(term[-window:].sum(axis=0) for term in terms), window)
+                betas[name] = dict(zip(symbols, values.tolist()))
+            return betas
+
+    def rolling_betas(self, window, benchmark=BENCHMARK_SYMBOL):
+        """
+        Betas to `benchmark` over every `window`-day span of the history held: a DataFrame
+        of dates (the last day of each span) x symbols, or None without benchmark history.
+        """
+        with BETA_SECONDS.time():
+            panel = self._panel(benchmark)
+            if panel is None or window > len(panel[0]):
+                return None
+            returns, observed, benchmark_returns, dates, symbols = panel
+            trailing = []
+            for values in _regression_sums(returns, observed, benchmark_returns):
+                totals = np.cumsum(values, axis=0)
+                totals[window:] = totals[window:] - totals[:-window].copy()
+                trailing.append(totals[window - 1:])
+            return pd.DataFrame(_betas(*trailing, window), index=pd.DatetimeIndex(dates[window - 1:]),
+                                columns=list(symbols))
+
+    def _panel(self, benchmark):
+        """(returns, observed, benchmark returns, dates, symbols) as of the last update, or None"""
+        with self._lock:
+            if self._returns is None or benchmark not in self._symbols:
+                return None
+            returns, observed, dates, symbols = self._returns, self._observed, self._dates, self._symbols
+        column = symbols.index(benchmark)
+        # Days the benchmark has no bar for can't be used for anyone
+        benchmark_returns = np.where(observed[:, column], returns[:, column], np.nan)
+        return returns, observed, benchmark_returns, dates, symbols
+
+    def _refresh(self):
+        closes = self.closes
+        dates = closes.index.values[1:]
+        symbols = tuple(closes.columns)
+        returns, observed = daily_returns(closes)
+        self._observations = observed.sum(axis=0)
+
+        if self._returns is not None and symbols == self._symbols and self._updates < RISK_RESYNC_EVERY:
+            # Rows (days) that left the window or changed come out, new and revised ones go in
+            _, old_rows, new_rows = np.intersect1d(self._dates, dates, return_indices=True)
+            same = ((self._returns[old_rows] == returns[new_rows]).all(axis=1)
+                    & (self._observed[old_rows] == observed[new_rows]).all(axis=1))
+            removed = np.setdiff1d(np.arange(len(self._dates)), old_rows[same])
+            added = np.setdiff1d(np.arange(len(dates)), new_rows[same])
+            if len(removed) + len(added) <= max(len(dates) // 4, 1):
+                changed = _cross_products(np.vstack([returns[added], self._returns[removed]]),
+                                          np.vstack([observed[added], self._observed[removed]]),
+                                          np.r_[np.ones(len(added)), -np.ones(len(removed))])
+                for total, change in zip((self._cross, self._sums, self._pairs), changed):
+                    total += change
+                self._updates += 1
+                self._dates, self._returns, self._observed = dates, returns, observed
+                return
+
+        self._cross, self._sums, self._pairs = _cross_products(returns, observed)
+        self._updates = 0
+        self._dates, self._symbols, self._returns, self._observed = dates, symbols, returns, observed
+
+
+def daily_returns(closes):
+    """
+    (returns, observed) of a dates x symbols close DataFrame, one row shorter: daily returns
+    and which were observed. A ticker has no return on a day it or the day before has no bar
+    for (before its listing, during a halt and the day it resumes); those are 0 in `returns`
+    only so sums can skip them - mask them with `observed`.
+    """
+    raw = closes.pct_change(fill_method=None).iloc[1:]
+    observed = raw.notna().to_numpy()
+    return np.where(observed, raw.to_numpy(dtype=float), 0.0), observed
+
+
+def _cross_products(returns, observed, weights=None):
+    """
+    (RᵀR, RᵀO, OᵀO) of zero-filled returns R and their observed mask O: for every pair of
+    tickers, Σ rᵢrⱼ, Σ rᵢ over the days j has a return too, and the number of days both have one.
+    With `weights`, each day's terms are multiplied by its weight (-1 takes a day back out).
+    """
+    # Day counts are exact in float32, at half the memory of the other two
+    mask = observed.astype(np.float32)
+    weighted, weighted_mask = (returns, mask) if weights is None else (returns * weights[:, None],
+                                                                         mask * weights[:, None].astype(np.float32))
+    return weighted.T @ returns, weighted.T @ mask, weighted_mask.T @ mask
+
+
+def window_betas(returns, observed, benchmark_returns, window):
+    """
+    Betas of every column of `returns` to the benchmark over their last `window` rows, with
+    NaN for columns that have too few returns there (see CovarianceEngine.betas)
+    """
+    terms = _regression_sums(returns[-window:], observed[-window:], benchmark_returns[-window:])
+    return _betas(*(term.sum(axis=0) for term in terms), window)
+
+
+def _regression_sums(returns, observed, benchmark_returns):
+    """
+    Per-day terms of the least-squares sums for regressing every column of `returns` on the
+    benchmark, counting only days where both the ticker and the benchmark were observed:
+    (pairs, x, y, x², xy) with x the benchmark's returns and y the ticker's
+    """
+    used = observed & ~np.isnan(benchmark_returns)[:, None]
+    x = np.where(used, np.nan_to_num(benchmark_returns)[:, None], 0.0)
+    y = np.where(used, returns, 0.0)
+    return used.astype(float), x, y, x * x, x * y
+
+
+def _betas(n, sum_x, sum_y, sum_xx, sum_xy, window):
+    """Least-squares slopes from regression sums; NaN with too few pairs or a flat benchmark"""
+    required = min(MIN_RISK_OBSERVATIONS, int(window * 0.8))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = sum_xy - sum_x * sum_y / n
+        variance = sum_xx - sum_x * sum_x / n
+        betas = covariance / variance
+    return np.where((n >= required) & (variance > 0), betas, np.nan)
+
+
+def correlation_matrix(covariance):
+    """Correlations from a covariance matrix (0 for stocks without variance)"""
+    deviation = np.sqrt(np.clip(np.diag(covariance), 0, None))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = covariance / np.outer(deviation, deviation)
+    correlation[~np.isfinite(correlation)] = 0.0
+    np.fill_diagonal(correlation, np.where(deviation > 0, 1.0, 0.0))
+    return np.clip(correlation, -1.0, 1.0)
+
+
+class RiskModel:
+    """
+    Daily returns covariance and correlation of a stock universe as of one refresh.
+    Published with the snapshot; requests only ever read a small slice of it.
+    """
+
+    def __init__(self, symbols, covariance, correlation, observations, as_of=None):
+        self.symbols = tuple(symbols)
+        self.covariance = _frozen(np.asarray(covariance, dtype=float))
+        self.correlation = _frozen(np.asarray(correlation, dtype=float))
+        self.observations = _frozen(np.asarray(observations, dtype=np.int32))
+        self.as_of = as_of
+        self._positions = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._portfolios = BoundedCache(PORTFOLIO_CACHE_SIZE)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __repr__(self):
+        return f"<RiskModel {len(self)} symbols as of {self.as_of}>"
+
+    def covered(self, symbol):
+        """Whether the stock has enough history (and any variance) for a risk estimate"""
+        i = self._positions.get(symbol)
+        return (i is not None and self.observations[i] >= MIN_RISK_OBSERVATIONS
+                and self.covariance[i, i] > 0)
+
+    def slice(self, symbols):
+        """(covariance, correlation) sub-matrices for `symbols`, which must all be covered"""
+        rows = np.array([self._positions[symbol] for symbol in symbols], dtype=np.intp)
+        index = np.ix_(rows, rows)
+        return self.covariance[index], self.correlation[index]
+
+    def portfolio(self, symbols, method):
+        """
+        (weights, covariance, average pairwise correlation) of an allocation of `symbols`
+        (all covered) by `method`, memoized for the life of the model
+        """
+        key = (tuple(symbols), method)
+        portfolio = self._portfolios.get(key)
+        if portfolio is MISSING:
+            covariance, correlation = self.slice(symbols)
+            average_correlation = (float(correlation[np.triu_indices(len(symbols), 1)].mean())
+                                   if len(symbols) > 1 else None)
+            portfolio = (_frozen(allocation_weights(covariance, method)), covariance, average_correlation)
+            self._portfolios.set(key, portfolio)
+        return portfolio
+
+    def buffers(self):
+        """Buffers and metadata that store the model in a shared file (see UniverseSnapshot.write_shared)"""
+        buffers = {"risk:covariance": self.covariance, "risk:correlation": self.correlation,
+                   "risk:observations": self.observations}
+        return buffers, {"symbols": list(self.symbols), "as_of": self.as_of}
+
+    @classmethod
+    def from_shared(cls, shared, meta):
+        """Model whose matrices are views into a mapped SharedFile"""
+        return cls(meta["symbols"], shared.array("risk:covariance"), shared.array("risk:correlation"),
+                   shared.array("risk:observations"), meta["as_of"])
+
+
+def _frozen(values):
+    if values.flags.writeable:
+        values.flags.writeable = False
+    return values
@@ -0,0 +1,156 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+# File layout: MAGIC, header length (u64), JSON header, then the buffers, each 64-byte aligned.
+# The header holds caller metadata plus the offset, size, dtype and shape of every buffer.
+MAGIC = b"TFSHARE1"
+ALIGNMENT = 64
+
+# How often readers check whether a newer file has been published (in seconds)
+POLL_INTERVAL = 1.0
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_shared_file(path, meta, buffers):
+    """
+    Atomically publishes `meta` (JSON-serializable) and named buffers (NumPy arrays or bytes).
+    The file is written next to `path` and renamed over it, so readers see either the old
+    or the new file, and readers that still have the old one mapped keep a consistent view.
+    """
+    entries = {}
+    chunks = []
+    offset = 0
+    for name, buffer in buffers.items():
+        if isinstance(buffer, np.ndarray):
+            array = np.ascontiguousarray(buffer)
+            data = memoryview(array).cast("B")
+            entries[name] = {"offset": offset, "nbytes": array.nbytes,
+                             "dtype": array.dtype.str, "shape": list(array.shape)}
+        else:
+            data = memoryview(buffer).cast("B")
+            entries[name] = {"offset": offset, "nbytes": data.nbytes, "dtype": None, "shape": None}
+        chunks.append((offset, data))
+        offset = _align(offset + data.nbytes)
+
+    header = json.dumps({"meta": meta, "buffers": entries}).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for chunk_offset, data in chunks:
+            f.seek(data_start + chunk_offset)
+            f.write(data)
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SharedFile:
+    """
+    Read-only memory map of a file written by write_shared_file.
+    Arrays and blobs are views into the mapping - nothing is copied, and every process
+    mapping the same file shares the same physical pages.
+    """
+
+    def __init__(self, path, fd=None):
+        self.path = path
+        own_fd = fd is None
+        if own_fd:
+            fd = os.open(path, os.O_RDONLY)
+        try:
+            self.stat = os.fstat(fd)
+            self._map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            if own_fd:
+                os.close(fd)
+
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a shared data file")
+        (header_length,) = struct.unpack_from("<Q", self._map, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(self._map[header_start:header_start + header_length].decode("utf-8"))
+        self.meta = header["meta"]
+        self.entries = header["buffers"]
+        self._data_start = _align(header_start + header_length)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def array(self, name):
+        """Read-only NumPy view of a stored array"""
+        entry = self.entries[name]
+        dtype = np.dtype(entry["dtype"])
+        count = entry["nbytes"] // dtype.itemsize
+        if count == 0:
+            return _frozen_empty(entry["shape"], dtype)
+        values = np.frombuffer(self._map, dtype=dtype, count=count, offset=self._data_start + entry["offset"])
+        return values.reshape(entry["shape"])
+
+    def blob(self, name):
+        """Read-only memoryview of stored bytes"""
+        entry = self.entries[name]
+        start = self._data_start + entry["offset"]
+        return memoryview(self._map)[start:start + entry["nbytes"]]
+
+
+def _frozen_empty(shape, dtype):
+    values = np.empty(shape, dtype=dtype)
+    values.flags.writeable = False
+    return values
+
+
+class SharedFileWatcher:
+    """
+    Keeps the most recently published version of a shared file mapped.
+    get() checks for a newer file at most every `poll_interval` seconds and costs
+    a single stat call when it does.
+    """
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._current = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the current SharedFile, or None if nothing has been published yet"""
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.poll_interval:
+            return self._current
+        with self._lock:
+            if self._checked is None or now - self._checked >= self.poll_interval:
+                self._reload()
+                self._checked = now
+        return self._current
+
+    def _reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        current = self._current
+        if current is not None and (stat.st_ino, stat.st_mtime_ns) == (current.stat.st_ino,
+                                                                       current.stat.st_mtime_ns):
+            return
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            self._current = SharedFile(self.path, fd)
+        except (ValueError, OSError) as e:
+            print(f"Ignoring unreadable shared file {self.path} ({str(e)}).")
+        finally:
+            os.close(fd)
@@ -1,19 +1,26 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-import yfinance as yf
-import pandas as pd
-import matplotlib
-# Set matplotlib to use 'Agg' backend (non-interactive, thread-safe)
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import io
+import asyncio
 import base64
+import hashlib
+import os
+import sys
 import time
 import logging
 import threading
-import requests
-from requests.exceptions import RequestException
 import traceback
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from urllib.parse import quote
+from asgi import ASGIApp, Response as ASGIResponse, StreamingResponse, etag_matches, json_response
+from live_prices import PriceHub, parse_tickers
+from bounded_cache import BoundedCache, MISSING
+from charts import CHART_STYLES, ChartRenderer, price_fingerprint
+from market_data import default_provider
+from metrics import Gauge, Histogram, instrument_app, register_cache
+from responses import EncodedResponse, use_fast_json
+from streaming import ProgressFeed, encode_event, encode_heartbeat, stream_format, stream_headers
+from shared_file import SharedFileWatcher, write_shared_file
+from price_store import PERIOD_OFFSETS, PriceStore, covers_period, slice_period
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -44,17 +51,76 @@ STOCK_CATEGORIES = {
     ],
 }
 
+# Chart cache limits - charts are keyed by (ticker, period, style)
+CHART_CACHE_SIZE = 256
+CHART_CACHE_TTL = 3600  # 1 hour
+CHART_TIMEOUT = 30      # Seconds to wait for a chart to render
+
+# Every ticker the API serves
+KNOWN_TICKERS = {stock['ticker'] for stocks in STOCK_CATEGORIES.values() for stock in stocks}
+
 # Cache mechanism to store data and reduce API calls
 cache = {
     'data': {},
-    'charts': {},
+    'charts': BoundedCache(CHART_CACHE_SIZE, ttl=CHART_CACHE_TTL),
     'timestamp': {},
+    'responses': {},  # category -> {sort order: EncodedResponse of its sorted stocks}
+    'refreshes': {},  # category -> Future of the in-flight refresh
+    'progress': {},   # category -> ProgressFeed of the stocks the in-flight refresh has finished
+    'stats': {'hits': 0, 'stale_hits': 0, 'misses': 0, 'evictions': 0},  # Lookups of cache['data']
     'lock': threading.RLock()  # Use RLock for thread safety
 }
 
+# Orders the /stocks/<category> responses are encoded in when a category is stored
+SORT_ORDERS = ('A', 'D')
+
 # Cache expiration time (in seconds)
 CACHE_EXPIRY = 300  # 5 minutes
 
+# How long past expiry cached data may still be served while it is refreshed in the background
+MAX_STALENESS = 1800  # 30 minutes
+
+# How long clients may reuse a chart before revalidating it (versioned URLs never change)
+CHART_MAX_AGE = 300
+CHART_IMMUTABLE_MAX_AGE = 86400
+
+# Where quotes and history come from (swap for a ReplayProvider to run offline)
+provider = default_provider()
+
+# Local price history store shared with the recommender, so restarts only download new bars
+price_store = PriceStore()
+
+# Charts are rendered on a pool of worker processes
+chart_renderer = ChartRenderer()
+
+# Live price subscriptions: one poller quotes every subscribed ticker and fans out changes
+price_hub = PriceHub(provider)
+LIVE_PRICE_HEARTBEAT = 15  # Seconds between keep-alives on a quiet price stream
+
+# Production mode: with TRADEFLOW_CATEGORIES_FILE set, one process loads the categories and
+# renders their charts (python stock_api.py --publish) and every server worker
+# (e.g. gunicorn -w 8 stock_api:app) serves them from the published file
+CATEGORIES_FILE = os.environ.get("TRADEFLOW_CATEGORIES_FILE")
+shared_categories = SharedFileWatcher(CATEGORIES_FILE) if CATEGORIES_FILE else None
+
+# Instrumentation (exposed on /metrics)
+CHART_RENDER_SECONDS = Histogram("tradeflow_chart_render_duration_seconds",
+                                 "Time from submitting a chart to the render pool until its PNG is ready",
+                                 ["style"])
+RESPONSE_ENCODE_SECONDS = Histogram("tradeflow_category_response_encode_seconds",
+                                    "Time to encode and compress every response variant of a stored category")
+
+# Category refreshes run here, at most one per category at a time
+refresh_executor = ThreadPoolExecutor(max_workers=len(STOCK_CATEGORIES), thread_name_prefix="category-refresh")
+
+# Upstream price/history requests for every category share one bounded pool
+UPSTREAM_WORKERS = 16
+TICKER_TIMEOUT = 30  # Seconds to wait for one ticker's price and history
+upstream_executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix="upstream")
+
+# Refreshes started by the ASGI server: category -> asyncio Task (the event loop's single-flight map)
+async_refreshes = {}
+
 def is_cache_valid(category):
     """Check if cache for a category is still valid"""
     with cache['lock']:
@@ -62,150 +128,169 @@ def is_cache_valid(category):
             return (time.time() - cache['timestamp'][category]) < CACHE_EXPIRY
         return False
 
-def generate_stock_chart(ticker, period='1mo'):
+def generate_stock_chart(ticker, period='1mo', style='default', history=None):
     """Generate a price chart for a given stock ticker and return as base64 encoded string"""
-    # Check if chart is in cache
-    with cache['lock']:
-        if ticker in cache['charts']:
-            logger.info(f"Using cached chart for {ticker}")
-            return cache['charts'][ticker]
+    try:
+        chart = generate_stock_chart_async(ticker, period, style, history).result(timeout=CHART_TIMEOUT)
+    except Exception as e:
+        logger.error(f"Error generating chart for {ticker}: {str(e)}")
+        return None
+    return base64.b64encode(chart['png']).decode('utf-8') if chart else None
+
+def generate_stock_chart_async(ticker, period='1mo', style='default', history=None):
+    """
+    Start generating a chart on the render process pool.
+    Returns a Future that resolves to a chart entry - {'png': bytes, 'etag': content hash,
+    'fingerprint': price data fingerprint} - or None if there is no data.
+    A cached chart is only reused if it was drawn from the same data as `history` or, without
+    it, up to the newest stored bar.
+    """
+    key = (ticker, period, style)
+    cached = current_chart(key, history)
+    if cached is not MISSING:
+        logger.info(f"Using cached chart for {ticker}")
+        return completed_future(cached)
     
     try:
-        # Get historical data
-        stock = yf.Ticker(ticker)
-        history = stock.history(period=period)
-        
-        # If we have data, create the chart
-        if not history.empty:
-            # Calculate daily returns for volume coloring
-            history['DailyReturn'] = history['Close'].pct_change()
-            
-            # Create figure with transparent background
-            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(8, 4.5), 
-                                          gridspec_kw={'height_ratios': [3, 1]},
-                                          sharex=True)
-            fig.patch.set_alpha(0.0)  # Make figure background transparent
-            
-            # Plot price chart on top subplot
-            ax1.patch.set_alpha(0.0)  # Make plot background transparent
-            ax1.plot(history.index, history['Close'], color='#FF5722', linewidth=2, label='Price')
-            
-            # Fill between price and bottom
-            ax1.fill_between(history.index, history['Close'], history['Close'].min()*0.95, 
-                            alpha=0.1, color='#FF7043')
-            
-            # Plot volume on bottom subplot
-            ax2.patch.set_alpha(0.0)  # Make volume plot background transparent
-            colors = ['#4CAF50' if r >= 0 else '#F44336' for r in history['DailyReturn']]
-            ax2.bar(history.index, history['Volume'], color=colors, alpha=0.7, width=0.8)
-            
-            # Style the plots
-            for ax in [ax1, ax2]:
-                ax.grid(color='#E0E0E0', linestyle='--', linewidth=0.5, alpha=0.7)
-                ax.spines['top'].set_visible(False)
-                ax.spines['right'].set_visible(False)
-                ax.spines['bottom'].set_color('#E0E0E0')
-                ax.spines['left'].set_color('#E0E0E0')
-                ax.tick_params(colors='#757575', labelsize=8)
-            
-            # Reduce number of x-axis labels to avoid crowding
-            if len(history) > 20:
-                num_ticks = 7
-                ax2.xaxis.set_major_locator(plt.MaxNLocator(num_ticks))
-            
-            ax1.set_title(f"{ticker} Stock Price", color='#5D4037', fontsize=10, pad=5)
-            ax1.legend(loc='upper left', frameon=False, fontsize=8)
-            
-            # Format y-axis with currency
-            import matplotlib.ticker as mtick
-            ax1.yaxis.set_major_formatter(mtick.StrMethodFormatter('₹{x:,.2f}'))
-            
-            # Format volume axis with K/M suffix for thousands/millions
-            def volume_formatter(x, pos):
-                if x >= 1e6:
-                    return f'{x*1e-6:.1f}M'
-                elif x >= 1e3:
-                    return f'{x*1e-3:.1f}K'
-                else:
-                    return f'{x:.0f}'
-            
-            ax2.yaxis.set_major_formatter(mtick.FuncFormatter(volume_formatter))
-            
-            # Set y-axis limits slightly above/below the data range for better appearance
-            ax1_ymin = history['Close'].min() * 0.95
-            ax1_ymax = history['Close'].max() * 1.05
-            ax1.set_ylim(ax1_ymin, ax1_ymax)
-            
-            # Adjust layout
-            plt.tight_layout()
-            fig.subplots_adjust(hspace=0.1)  # Reduce space between subplots
-            
-            # Save plot to a bytes buffer with transparency
-            buffer = io.BytesIO()
-            plt.savefig(buffer, format='png', transparent=True, dpi=120)
-            plt.close(fig)  # Close the figure to prevent memory leaks
-            buffer.seek(0)
-            
-            # Encode the image to base64
-            image_png = buffer.getvalue()
-            buffer.close()
-            
-            encoded_string = base64.b64encode(image_png).decode('utf-8')
-            
-            # Cache the chart
-            with cache['lock']:
-                cache['charts'][ticker] = encoded_string
-                
-            return encoded_string
-        else:
+        if history is None:
+            history = get_price_history(ticker, period)
+        if history.empty:
             logger.warning(f"No historical data available for {ticker}")
-            return None
+            return completed_future(None)
+        
+        fingerprint = price_fingerprint(history)
+        submitted = time.perf_counter()
+        render = chart_renderer.submit(ticker, history, style)
     except Exception as e:
         logger.error(f"Error generating chart for {ticker}: {str(e)}")
         logger.error(traceback.format_exc())
+        return completed_future(None)
+    
+    result = Future()
+    
+    def on_rendered(future):
+        # False when the waiter gave up (e.g. a cancelled asyncio wrapper) - the chart is still cached
+        waited_for = result.set_running_or_notify_cancel()
+        try:
+            image_png = future.result()
+        except Exception as e:
+            logger.error(f"Error rendering chart for {ticker}: {str(e)}")
+            if waited_for:
+                result.set_result(None)
+            return
+        CHART_RENDER_SECONDS.observe(time.perf_counter() - submitted, style=style)
+        # Cache the chart along with the data it was drawn from
+        chart = {
+            'fingerprint': fingerprint,
+            'png': image_png,
+            'etag': hashlib.sha1(image_png).hexdigest(),
+        }
+        cache['charts'].set(key, chart)
+        if waited_for:
+            result.set_result(chart)
+    
+    render.add_done_callback(on_rendered)
+    return result
+
+def current_chart(key, history=None):
+    """
+    The cached chart for `key` if it was drawn from `history` (compared by fingerprint) or, without
+    it, if its last bar is the newest one in the price store; MISSING otherwise
+    """
+    cached = cache['charts'].get(key)
+    if cached is MISSING:
+        return MISSING
+    if history is not None:
+        return cached if cached['fingerprint'] == price_fingerprint(history) else MISSING
+    # The last stored bar changes with every download (new bars or an intraday revision)
+    latest = read_stored_history(key[0], bars=1)
+    if latest is not None and not latest.empty and cached['fingerprint'][2:] != price_fingerprint(latest)[2:]:
+        return MISSING
+    return cached
+
+async def generate_stock_chart_aio(ticker, period='1mo', style='default'):
+    """Chart entry (or None) for the ASGI server, downloading any missing history without blocking"""
+    cached = current_chart((ticker, period, style))
+    if cached is not MISSING:
+        return cached
+    history = await get_price_history_async(ticker, period)
+    return await asyncio.wrap_future(generate_stock_chart_async(ticker, period, style, history))
+
+def chart_url(ticker, chart, period='1mo'):
+    """Relative URL of a chart image; the content hash makes it safe for clients to cache"""
+    return f"/charts/{quote(ticker)}?period={quote(period)}&v={chart['etag']}"
+
+def completed_future(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+def get_price_history(ticker, period='1mo'):
+    """
+    Get daily price history for a ticker, reading the local price store first and
+    downloading only the bars since the last stored date.
+    """
+    stored = read_stored_history(ticker)
+    history = provider.history(ticker, **history_window(stored, period))
+    return merge_price_history(ticker, stored, history, period)
+
+async def get_price_history_async(ticker, period='1mo'):
+    """get_price_history for the ASGI server: the download doesn't hold a thread while it waits"""
+    stored = read_stored_history(ticker)
+    history = await provider.history_async(ticker, **history_window(stored, period))
+    # Appending to the store syncs the file, so keep it off the event loop
+    return await asyncio.get_running_loop().run_in_executor(
+        upstream_executor, merge_price_history, ticker, stored, history, period)
+
+def read_stored_history(ticker, bars=None):
+    try:
+        return price_store.read(ticker, bars=bars)
+    except Exception as e:
+        logger.warning(f"Ignoring stored history for {ticker}: {str(e)}")
         return None
 
+def history_window(stored, period):
+    """Provider arguments that download only what the stored history is missing"""
+    if covers_period(stored, period):
+        return {'start': stored.index[-1].date()}
+    return {'period': period}
+
+def merge_price_history(ticker, stored, history, period):
+    """Stores newly downloaded bars and returns the history covering `period`"""
+    if history.empty:
+        return slice_period(stored, period) if stored is not None else history
+    
+    try:
+        price_store.append(ticker, history)
+    except Exception as e:
+        logger.warning(f"Could not store history for {ticker}: {str(e)}")
+    
+    if covers_period(stored, period):
+        stored = price_store.read(ticker)
+        return slice_period(stored, period)
+    return history
+
 def get_stock_data(ticker):
     """Get current stock data for a given ticker with better error handling"""
     try:
-        stock = yf.Ticker(ticker)
-        
-        # Try to get some basic info first to check if the ticker is valid
-        info = {}
-        try:
-            # Use fast_info for better performance
-            info = stock.fast_info
-            if hasattr(info, 'last_price') and info.last_price is not None:
-                return info.last_price
-        except Exception as e:
-            logger.warning(f"Fast info retrieval failed for {ticker}: {str(e)}")
-            
-        # Fall back to the full info if fast_info doesn't work
-        try:
-            info = stock.info
-        except Exception as e:
-            logger.warning(f"Full info retrieval failed for {ticker}: {str(e)}")
-            # If we can't get info, try to get the last closing price from history
-            history = stock.history(period="1d")
-            if not history.empty and 'Close' in history.columns:
-                return history['Close'].iloc[-1]
+        price = provider.quote(ticker)
+        if price is None:
+            logger.warning(f"No price data available for {ticker}")
             return 0.0
-        
-        # Check if we have price data in various fields
-        if 'regularMarketPrice' in info and info['regularMarketPrice'] is not None:
-            return info['regularMarketPrice']
-        elif 'currentPrice' in info and info['currentPrice'] is not None:
-            return info['currentPrice']
-        elif 'previousClose' in info and info['previousClose'] is not None:
-            return info['previousClose']
-        else:
-            # Last resort: try to get the price from history
-            history = stock.history(period="1d")
-            if not history.empty and 'Close' in history.columns:
-                return history['Close'].iloc[-1]
-            
+        return price
+    except Exception as e:
+        logger.error(f"Error fetching data for {ticker}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return 0.0
+
+async def get_stock_data_async(ticker):
+    """get_stock_data for the ASGI server"""
+    try:
+        price = await provider.quote_async(ticker)
+        if price is None:
             logger.warning(f"No price data available for {ticker}")
             return 0.0
+        return price
     except Exception as e:
         logger.error(f"Error fetching data for {ticker}: {str(e)}")
         logger.error(traceback.format_exc())
@@ -221,7 +306,8 @@ def get_fallback_data(ticker_info):
             'price': 0.0,  # Placeholder price
             'sector': ticker_info['sector'],
             'industry': ticker_info['industry'],
-            'chart': None,  # No chart available
+            'chart_url': None,  # No chart available
+            'chart_hash': None,
             'error': 'Data unavailable'
         }
     except Exception as e:
@@ -229,64 +315,525 @@ def get_fallback_data(ticker_info):
         return None
 
 def fetch_stocks_data(category, sort_order='A'):
-    """Fetch and process stock data for a category"""
+    """Stocks of a category sorted by price (see cached_stocks), or None while none are published"""
+    stocks = cached_stocks(category)
+    return sort_stocks(stocks, sort_order) if stocks is not None else None
+
+def fetch_category_response(category, sort_order='A'):
+    """
+    The category's stocks as the EncodedResponse built when they were stored, so serving
+    them encodes nothing. None while a production worker has nothing published yet.
+    """
+    if shared_categories is not None:
+        return get_shared_response(category, sort_order)
+    if cached_stocks(category) is None:
+        return None
+    return stored_response(category, sort_order)
+
+async def fetch_category_response_async(category, sort_order='A'):
+    """fetch_category_response for the ASGI server: waiting for a refresh doesn't hold a thread"""
+    if shared_categories is not None:
+        return get_shared_response(category, sort_order)
+    if await cached_stocks_async(category) is None:
+        return None
+    return stored_response(category, sort_order)
+
+def stored_response(category, sort_order):
+    # Stored together with the stocks (see store_category), so this is the same or a newer version
+    with cache['lock']:
+        return cache['responses'][category][response_order(sort_order)]
+
+def response_order(sort_order):
+    return 'D' if sort_order == 'D' else 'A'
+
+def cached_stocks(category):
+    """
+    The stocks of a category, unsorted.
+    Serves fresh cached data directly; serves expired data (up to MAX_STALENESS past expiry)
+    immediately while a background refresh runs; otherwise waits for the one in-flight refresh.
+    """
     if category not in STOCK_CATEGORIES:
         return []
     
+    # Production workers only serve what the publishing process loaded (None until it has)
+    if shared_categories is not None:
+        shared = shared_categories.get()
+        return shared.meta['data'].get(category) if shared is not None else None
+    
+    stocks, state = lookup_category(category)
+    
     # Check if we have valid cached data
-    if is_cache_valid(category):
+    if state == 'fresh':
+        logger.info(f"Using cached data for {category}")
+        return stocks
+    
+    # Stale but still usable - serve it and revalidate in the background
+    if state == 'stale':
+        logger.info(f"Serving stale data for {category} while refreshing")
+        refresh_category_async(category)
+        return stocks
+    
+    # Nothing usable cached - join the single refresh for this category
+    return refresh_category_async(category).result()
+
+async def cached_stocks_async(category):
+    """cached_stocks for the ASGI server"""
+    if category not in STOCK_CATEGORIES:
+        return []
+    
+    if shared_categories is not None:
+        return cached_stocks(category)
+    
+    stocks, state = lookup_category(category)
+    if state == 'fresh':
+        return stocks
+    
+    refresh = refresh_category_aio(category)
+    if state == 'stale':
+        logger.info(f"Serving stale data for {category} while refreshing")
+        return stocks
+    
+    # shield: a client disconnecting must not cancel the refresh other clients are waiting on
+    return await asyncio.shield(refresh)
+
+def open_category_stream(category, sort_order='A'):
+    """
+    Where a streamed /stocks request gets its stocks from: returns (stocks, progress) with
+    either the cached stocks (sorted) or the ProgressFeed of the refresh now loading them.
+    Both are None when a production worker has nothing published yet.
+    """
+    if shared_categories is not None:
+        return fetch_stocks_data(category, sort_order), None
+    
+    stocks, state = lookup_category(category)
+    if state == 'stale':
+        refresh_category_async(category)
+    if state != 'miss':
+        return sort_stocks(stocks, sort_order), None
+    
+    with cache['lock']:
+        refresh = refresh_category_async(category)
+        progress = cache['progress'].get(category)
+    if progress is None:
+        # The refresh finished in the meantime
+        return sort_stocks(refresh.result(), sort_order), None
+    return None, progress
+
+async def open_category_stream_async(category, sort_order='A'):
+    """open_category_stream for the ASGI server"""
+    if shared_categories is not None:
+        return fetch_stocks_data(category, sort_order), None
+    
+    stocks, state = lookup_category(category)
+    if state == 'stale':
+        refresh_category_aio(category)
+    if state != 'miss':
+        return sort_stocks(stocks, sort_order), None
+    
+    refresh = refresh_category_aio(category)
+    with cache['lock']:
+        progress = cache['progress'].get(category)
+    if progress is None:
+        return sort_stocks(await asyncio.shield(refresh), sort_order), None
+    return None, progress
+
+def category_events(category, stocks, progress, fmt):
+    """
+    Stream of a category: a 'start' event, one 'stock' event per stock - straight away when
+    cached, otherwise as soon as each one's price and chart are ready - then an 'end' event.
+    """
+    yield category_start_event(category, stocks, fmt)
+    count = 0
+    for stock in stocks if progress is None else progress.follow(timeout=TICKER_TIMEOUT + CHART_TIMEOUT):
+        count += 1
+        yield encode_event(fmt, 'stock', stock)
+    yield category_end_event(category, count, fmt)
+
+async def category_events_async(category, stocks, progress, fmt):
+    """category_events for the ASGI server"""
+    yield category_start_event(category, stocks, fmt)
+    count = 0
+    if progress is None:
+        for stock in stocks:
+            count += 1
+            yield encode_event(fmt, 'stock', stock)
+    else:
+        async for stock in progress.follow_async():
+            count += 1
+            yield encode_event(fmt, 'stock', stock)
+    yield category_end_event(category, count, fmt)
+
+def category_start_event(category, stocks, fmt):
+    return encode_event(fmt, 'start', {'category': category, 'total': len(STOCK_CATEGORIES[category]),
+                                       'cached': stocks is not None})
+
+def category_end_event(category, count, fmt):
+    return encode_event(fmt, 'end', {'category': category, 'count': count})
+
+def lookup_category(category):
+    """
+    Returns (stocks, state) for a category's cached data and counts the lookup.
+    State is 'fresh', 'stale' (expired but still servable) or 'miss' (nothing usable).
+    """
+    with cache['lock']:
+        stocks = cache['data'].get(category)
+        age = time.time() - cache['timestamp'].get(category, 0)
+        if stocks is None:
+            cache['stats']['misses'] += 1
+            return None, 'miss'
+        if age < CACHE_EXPIRY:
+            cache['stats']['hits'] += 1
+            return stocks, 'fresh'
+        if age < CACHE_EXPIRY + MAX_STALENESS:
+            cache['stats']['hits'] += 1
+            cache['stats']['stale_hits'] += 1
+            return stocks, 'stale'
+        # Too old to serve - counts as evicted even though it stays until the refresh replaces it
+        cache['stats']['misses'] += 1
+        cache['stats']['evictions'] += 1
+        return None, 'miss'
+
+def sort_stocks(stocks, sort_order='A'):
+    """Return a copy of the stocks sorted by price (stocks without a price go last)"""
+    return sorted(stocks, key=lambda x: x['price'] if x['price'] > 0 else float('inf'),
+                  reverse=(sort_order == 'D'))
+
+def refresh_category_async(category):
+    """
+    Start refreshing a category unless a refresh is already in flight (single-flight).
+    Returns the Future of the in-flight refresh, which resolves to the fresh stock list.
+    """
+    with cache['lock']:
+        future = cache['refreshes'].get(category)
+        if future is not None:
+            return future
+        progress = new_progress(category)
+        future = refresh_executor.submit(load_category, category, progress)
+        cache['refreshes'][category] = future
+    
+    def on_done(_):
+        with cache['lock']:
+            if cache['refreshes'].get(category) is future:
+                del cache['refreshes'][category]
+            finish_progress(category, progress)
+    
+    future.add_done_callback(on_done)
+    return future
+
+def refresh_category_aio(category):
+    """
+    refresh_category_async for the ASGI server: returns the asyncio Task of the in-flight
+    refresh of the category, which fetches every ticker without blocking the event loop.
+    """
+    task = async_refreshes.get(category)
+    if task is None:
         with cache['lock']:
-            stocks = cache['data'].get(category, [])
-            logger.info(f"Using cached data for {category}")
-            # Still apply sorting as requested
-            stocks.sort(key=lambda x: x['price'] if x['price'] > 0 else float('inf'), 
-                       reverse=(sort_order == 'D'))
-            return stocks
-    
-    # If not in cache or expired, fetch fresh data
-    stocks = []
-    for stock_info in STOCK_CATEGORIES[category]:
-        ticker = stock_info['ticker']
+            progress = new_progress(category)
+        task = asyncio.ensure_future(load_category_async(category, progress))
+        async_refreshes[category] = task
+        
+        def on_done(_):
+            async_refreshes.pop(category, None)
+            with cache['lock']:
+                finish_progress(category, progress)
         
+        task.add_done_callback(on_done)
+    return task
+
+def new_progress(category):
+    progress = ProgressFeed(total=len(STOCK_CATEGORIES[category]), key=lambda stock: stock['ticker'])
+    cache['progress'][category] = progress
+    return progress
+
+def finish_progress(category, progress):
+    progress.finish()
+    if cache['progress'].get(category) is progress:
+        del cache['progress'][category]
+
+def report_progress(progress, stock, chart=None):
+    """Hands a finished stock (with its chart, if any) to the streams following the refresh"""
+    if progress is not None and stock is not None:
+        progress.add(with_chart(stock, chart))
+
+def with_chart(stock, chart):
+    stock = dict(stock)
+    if chart:
+        stock['chart_url'] = chart_url(stock['ticker'], chart)
+        stock['chart_hash'] = chart['etag']
+    return stock
+
+def load_stock(stock_info):
+    """
+    Fetch one stock's history and derive its price from it, so a single download
+    feeds both the price and the chart. Returns (stock, chart future or None).
+    """
+    ticker = stock_info['ticker']
+    history = get_price_history(ticker)
+    
+    if not history.empty and 'Close' in history.columns:
+        price = float(history['Close'].iloc[-1])
+        # Start rendering the chart; it renders on the pool while other stocks are fetched
+        chart = generate_stock_chart_async(ticker, history=history)
+    else:
+        price = get_stock_data(ticker)
+        chart = None
+    
+    return build_stock(stock_info, price), chart
+
+async def load_stock_async(stock_info):
+    """load_stock for the ASGI server; returns (stock, chart future or None)"""
+    ticker = stock_info['ticker']
+    history = await get_price_history_async(ticker)
+    
+    if not history.empty and 'Close' in history.columns:
+        price = float(history['Close'].iloc[-1])
+        chart = asyncio.wrap_future(generate_stock_chart_async(ticker, history=history))
+    else:
+        price = await get_stock_data_async(ticker)
+        chart = None
+    
+    return build_stock(stock_info, price), chart
+
+def build_stock(stock_info, price):
+    return {
+        'ticker': stock_info['ticker'],
+        'name': stock_info['name'],
+        'price': price,
+        'sector': stock_info['sector'],
+        'industry': stock_info['industry'],
+        'chart_url': None,
+        'chart_hash': None
+    }
+
+def load_category(category, progress=None):
+    """
+    Fetch fresh data for every stock in a category and store it in the cache.
+    Each stock is also reported to `progress` as soon as its price and chart are ready.
+    """
+    # Fetch every stock of the category concurrently on the shared upstream pool
+    stock_infos = STOCK_CATEGORIES[category]
+    pending = {upstream_executor.submit(load_stock, stock_info): stock_info for stock_info in stock_infos}
+    
+    loaded = {}
+    charts = []
+    
+    def on_error(stock_info, message):
+        logger.error(f"Error processing stock {stock_info['ticker']}: {message}")
+        # Add fallback data
+        fallback = get_fallback_data(stock_info)
+        if fallback:
+            loaded[stock_info['ticker']] = fallback
+            report_progress(progress, fallback)
+    
+    try:
+        for future in as_completed(pending, timeout=TICKER_TIMEOUT):
+            stock_info = pending[future]
+            try:
+                stock, chart = future.result()
+            except Exception as e:
+                logger.error(traceback.format_exc())
+                on_error(stock_info, str(e))
+                continue
+            loaded[stock['ticker']] = stock
+            if chart is None:
+                report_progress(progress, stock)
+            else:
+                charts.append((stock['ticker'], chart))
+                if progress is not None:
+                    chart.add_done_callback(lambda f, stock=stock: report_progress(progress, stock, f.result()))
+    except TimeoutError:
+        for stock_info in stock_infos:
+            if stock_info['ticker'] not in loaded:
+                on_error(stock_info, "timed out")
+    
+    # Collect the rendered charts
+    rendered = {}
+    for ticker, future in charts:
+        try:
+            rendered[ticker] = future.result(timeout=CHART_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error generating chart for {ticker}: {str(e)}")
+            report_progress(progress, loaded[ticker])
+    stocks = [loaded[stock_info['ticker']] for stock_info in stock_infos if stock_info['ticker'] in loaded]
+    return store_category(category, stocks, rendered)
+
+async def load_category_async(category, progress=None):
+    """load_category for the ASGI server: every ticker is fetched concurrently on the event loop"""
+    async def load(stock_info):
         try:
-            # Get current price
-            price = get_stock_data(ticker)
-            
-            # Generate chart
-            chart = generate_stock_chart(ticker)
-            
-            # Create stock object
-            stock = {
-                'ticker': ticker,
-                'name': stock_info['name'],
-                'price': price,
-                'sector': stock_info['sector'],
-                'industry': stock_info['industry'],
-                'chart': chart
-            }
-            
-            stocks.append(stock)
+            stock, chart = await asyncio.wait_for(load_stock_async(stock_info), TICKER_TIMEOUT)
         except Exception as e:
-            logger.error(f"Error processing stock {ticker}: {str(e)}")
-            logger.error(traceback.format_exc())
-            # Add fallback data
+            logger.error(f"Error processing stock {stock_info['ticker']}: {str(e) or type(e).__name__}")
             fallback = get_fallback_data(stock_info)
-            if fallback:
-                stocks.append(fallback)
+            report_progress(progress, fallback)
+            return fallback, None
+        rendered = None
+        if chart is not None:
+            try:
+                rendered = await asyncio.wait_for(chart, CHART_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Error generating chart for {stock['ticker']}: {str(e) or type(e).__name__}")
+        report_progress(progress, stock, rendered)
+        return stock, rendered
+    
+    results = await asyncio.gather(*(load(stock_info) for stock_info in STOCK_CATEGORIES[category]))
+    stocks = [stock for stock, _ in results if stock]
+    rendered = {stock['ticker']: chart for stock, chart in results if stock and chart}
+    return store_category(category, stocks, rendered)
+
+def store_category(category, stocks, rendered):
+    """Links each stock to its rendered chart and caches the category"""
+    for stock in stocks:
+        chart = rendered.get(stock['ticker'])
+        if chart:
+            stock['chart_url'] = chart_url(stock['ticker'], chart)
+            stock['chart_hash'] = chart['etag']
     
-    # Sort stocks by price
-    stocks.sort(key=lambda x: x['price'] if x['price'] > 0 else float('inf'), 
-               reverse=(sort_order == 'D'))
+    # Encode the responses once here, so requests only pick the variant they accept
+    responses = encode_category(stocks)
     
     # Update cache
     with cache['lock']:
-        cache['data'][category] = stocks.copy()  # Store a copy to prevent modification
+        cache['data'][category] = stocks
+        cache['responses'][category] = responses
         cache['timestamp'][category] = time.time()
     
     return stocks
 
+def encode_category(stocks):
+    """{sort order: EncodedResponse} of a category's stocks"""
+    started = time.perf_counter()
+    responses = {order: EncodedResponse.encode(sort_stocks(stocks, order)) for order in SORT_ORDERS}
+    RESPONSE_ENCODE_SECONDS.observe(time.perf_counter() - started)
+    return responses
+
+def shared_chart_name(ticker, period, style):
+    return f"chart:{ticker}|{period}|{style}"
+
+def get_shared_chart(ticker, period='1mo', style='default'):
+    """A chart entry from the published categories file, or None if it wasn't published"""
+    shared = shared_categories.get() if shared_categories is not None else None
+    if shared is None:
+        return None
+    name = shared_chart_name(ticker, period, style)
+    etag = shared.meta['charts'].get(name)
+    if etag is None:
+        return None
+    return {'png': bytes(shared.blob(name)), 'etag': etag}
+
+def shared_response_name(category, sort_order):
+    return f"response:{category}|{sort_order}"
+
+def get_shared_response(category, sort_order='A'):
+    """A category's EncodedResponse from the published categories file, or None if it wasn't published"""
+    shared = shared_categories.get() if shared_categories is not None else None
+    if shared is None:
+        return None
+    name = shared_response_name(category, response_order(sort_order))
+    entry = shared.meta['responses'].get(name)
+    if entry is None:
+        return None
+    # Views of the mapped file - every worker serves the same pages
+    return EncodedResponse({coding: shared.blob(f"{name}|{coding}") for coding in entry['codings']},
+                           entry['etag'])
+
+def publish_categories(path):
+    """
+    Writes every cached category, its encoded responses and its default charts
+    to the shared categories file
+    """
+    with cache['lock']:
+        data = dict(cache['data'])
+        timestamps = dict(cache['timestamp'])
+        encoded = dict(cache['responses'])
+    charts = {}
+    buffers = {}
+    for stocks in data.values():
+        for stock in stocks:
+            chart = cache['charts'].peek((stock['ticker'], '1mo', 'default'))
+            if chart is not MISSING:
+                name = shared_chart_name(stock['ticker'], '1mo', 'default')
+                charts[name] = chart['etag']
+                buffers[name] = chart['png']
+    responses = {}
+    for category, variants in encoded.items():
+        for order, response in variants.items():
+            name = shared_response_name(category, order)
+            responses[name] = {'etag': response.etag, 'codings': sorted(response.bodies)}
+            for coding, body in response.bodies.items():
+                buffers[f"{name}|{coding}"] = body
+    meta = {'data': data, 'timestamp': timestamps, 'charts': charts, 'responses': responses,
+            'published_at': time.time()}
+    write_shared_file(path, meta, buffers)
+    logger.info(f"Published {len(data)} categories and {len(charts)} charts to {path}")
+
+def publish_categories_forever(path, interval=CACHE_EXPIRY):
+    """Runs the single loader of production mode: reload every category, publish, repeat"""
+    while True:
+        preload_cache()
+        try:
+            publish_categories(path)
+        except Exception as e:
+            logger.error(f"Error publishing categories: {str(e)}")
+        time.sleep(interval)
+
+def data_cache_stats():
+    """Counters for cache['data'] in the same form as BoundedCache.stats()"""
+    with cache['lock']:
+        stats = dict(cache['stats'], size=len(cache['data']))
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    return stats
+
+def category_ages():
+    """Seconds since each cached category was loaded"""
+    with cache['lock']:
+        timestamps = dict(cache['timestamp'])
+    now = time.time()
+    return {(category,): round(now - loaded, 3) for category, loaded in timestamps.items()}
+
+register_cache('data', data_cache_stats)
+register_cache('charts', cache['charts'])
+CATEGORY_AGE = Gauge("tradeflow_category_data_age_seconds", "Age of the cached data for each category",
+                     ["category"], callback=category_ages)
+LIVE_TICKERS = Gauge("tradeflow_live_price_tickers", "Distinct tickers with live price subscribers",
+                     callback=lambda: price_hub.stats()["tickers"])
+LIVE_SUBSCRIPTIONS = Gauge("tradeflow_live_price_subscriptions", "Open live price subscriptions",
+                           callback=lambda: price_hub.stats()["subscriptions"])
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+instrument_app(app)
+use_fast_json(app)
+
+# Checks shared by the Flask routes and asgi_app below; each failure is (data, status, headers)
+STILL_LOADING = ({"error": "Stock data is still loading, please retry shortly"}, 503, {"Retry-After": "5"})
+
+def category_error(category):
+    if category not in STOCK_CATEGORIES:
+        return {"error": f"Category '{category}' not found"}, 404, None
+    return None
+
+def chart_request_error(ticker, period, style):
+    if ticker not in KNOWN_TICKERS:
+        return {"error": f"Ticker '{ticker}' not found"}, 404, None
+    if period not in PERIOD_OFFSETS or style not in CHART_STYLES:
+        return {"error": "Invalid period or style"}, 400, None
+    return None
+
+def stream_tickers(tickers):
+    """(tickers, None) for a /prices/stream ?tickers= value, or (None, failure)"""
+    try:
+        tickers = parse_tickers(tickers)
+    except ValueError as e:
+        return None, ({"error": str(e)}, 400, None)
+    if not tickers:
+        return None, ({"error": "No tickers given"}, 400, None)
+    return tickers, None
+
+def flask_response(result):
+    data, status, headers = result
+    return jsonify(data), status, headers or {}
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -298,36 +845,278 @@ def get_stocks_by_category(category):
     """Get stocks by category with optional sorting by price"""
     try:
         # Check if the category exists
-        if category not in STOCK_CATEGORIES:
-            return jsonify({"error": f"Category '{category}' not found"}), 404
+        error = category_error(category)
+        if error:
+            return flask_response(error)
         
         # Get sort order from query parameter (A for ascending, D for descending)
         sort_order = request.args.get('order', 'A')
         
-        # Process request in a separate thread pool to avoid blocking
-        stocks = fetch_stocks_data(category, sort_order)
+        # Served from the cache; a cold category waits for its single in-flight refresh
+        # (this request thread is held meanwhile - asgi_app below waits without one)
+        encoded = fetch_category_response(category, sort_order)
+        if encoded is None:
+            return flask_response(STILL_LOADING)
         
-        return jsonify(stocks)
+        return encoded_response(encoded)
     
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({"error": str(e)}), 500
 
+@app.route('/stocks/<category>/stream', methods=['GET'])
+def stream_stocks_by_category(category):
+    """
+    Streams a category's stocks as NDJSON lines (or Server-Sent Events with ?format=sse or
+    Accept: text/event-stream), each stock as soon as it is ready. Cached categories are
+    sent sorted by ?order=; a loading category is sent in the order stocks finish.
+    """
+    error = category_error(category)
+    if error:
+        return flask_response(error)
+    
+    fmt = stream_format(request.headers.get('Accept'), request.args.get('format'))
+    try:
+        stocks, progress = open_category_stream(category, request.args.get('order', 'A'))
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    if stocks is None and progress is None:
+        return flask_response(STILL_LOADING)
+    
+    return Response(category_events(category, stocks, progress, fmt), headers=stream_headers(fmt))
+
+@app.route('/prices/stream', methods=['GET'])
+def stream_live_prices():
+    """
+    Live prices of ?tickers=A,B,... as NDJSON lines (or Server-Sent Events): the last known
+    prices straight away, then a 'prices' event with just the tickers whose price changed
+    """
+    tickers, error = stream_tickers(request.args.get('tickers'))
+    if error:
+        return flask_response(error)
+    
+    fmt = stream_format(request.headers.get('Accept'), request.args.get('format'))
+    subscription = price_hub.subscribe(tickers)
+    
+    def events():
+        try:
+            while True:
+                prices = subscription.get(timeout=LIVE_PRICE_HEARTBEAT)
+                yield encode_event(fmt, 'prices', prices_event(prices)) if prices else encode_heartbeat(fmt)
+        finally:
+            subscription.close()
+    
+    return Response(events(), headers=stream_headers(fmt))
+
+def prices_event(prices):
+    return {'prices': prices, 'time': time.time()}
+
+@app.route('/charts/<ticker>', methods=['GET'])
+def get_chart(ticker):
+    """Serve a stock chart as a PNG image, with ETag/conditional GET support"""
+    period = request.args.get('period', '1mo')
+    style = request.args.get('style', 'default')
+    error = chart_request_error(ticker, period, style)
+    if error:
+        return flask_response(error)
+    
+    try:
+        chart = get_shared_chart(ticker, period, style)
+        if chart is None:
+            chart = generate_stock_chart_async(ticker, period, style).result(timeout=CHART_TIMEOUT)
+    except Exception as e:
+        logger.error(f"Error serving chart for {ticker}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    if not chart:
+        return jsonify({"error": f"No chart available for '{ticker}'"}), 404
+    
+    response = Response(chart['png'], mimetype='image/png')
+    response.set_etag(chart['etag'])
+    response.headers['Cache-Control'] = chart_cache_control(chart, request.args.get('v'))
+    # Answers 304 Not Modified when the client already has this ETag
+    return response.make_conditional(request)
+
+def encoded_response(encoded):
+    """Serves the variant of an EncodedResponse the request accepts, with ETag/conditional GET support"""
+    coding, body = encoded.negotiate(request.headers.get('Accept-Encoding'))
+    response = Response(bytes(body), mimetype='application/json', headers=encoded.headers(coding))
+    return response.make_conditional(request)
+
+def chart_cache_control(chart, version):
+    if version == chart['etag']:
+        # The URL names this exact image, so it can be cached for good
+        return f'public, max-age={CHART_IMMUTABLE_MAX_AGE}, immutable'
+    return f'public, max-age={CHART_MAX_AGE}'
+
 # Preload cache on startup in a separate thread
 def preload_cache():
-    """Preload cache with data for all categories"""
+    """Preload cache with data for all categories (all categories load concurrently)"""
     logger.info("Preloading cache...")
-    for category in STOCK_CATEGORIES:
+    refreshes = {category: refresh_category_async(category) for category in STOCK_CATEGORIES}
+    for category, future in refreshes.items():
         try:
-            fetch_stocks_data(category)
+            future.result()
             logger.info(f"Preloaded data for {category}")
         except Exception as e:
             logger.error(f"Error preloading cache for {category}: {str(e)}")
 
+# Asyncio serving mode (e.g. uvicorn stock_api:asgi_app --port 5000): the same routes, but a
+# request waiting on Yahoo holds no thread, so one process can keep thousands of slow clients
+asgi_app = ASGIApp()
+
+@asgi_app.on_startup
+def start_preload():
+    if shared_categories is None:
+        for category in STOCK_CATEGORIES:
+            refresh_category_aio(category)
+
+@asgi_app.route('/health')
+async def health_check_async(request):
+    return json_response({'status': 'healthy', 'timestamp': time.time()})
+
+@asgi_app.route('/stocks/<category>')
+async def get_stocks_by_category_async(request):
+    category = request.path_params['category']
+    error = category_error(category)
+    if error:
+        return json_response(*error)
+    
+    try:
+        encoded = await fetch_category_response_async(category, request.args.get('order', 'A'))
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}")
+        logger.error(traceback.format_exc())
+        return json_response({"error": str(e)}, 500)
+    if encoded is None:
+        return json_response(*STILL_LOADING)
+    return asgi_encoded_response(request, encoded)
+
+def asgi_encoded_response(request, encoded):
+    """encoded_response for the ASGI server"""
+    coding, body = encoded.negotiate(request.headers.get('accept-encoding'))
+    headers = encoded.headers(coding)
+    if etag_matches(request, encoded.variant_etag(coding)):
+        return ASGIResponse(status=304, headers=headers, content_type=None)
+    return ASGIResponse(bytes(body), headers=headers)
+
+@asgi_app.route('/stocks/<category>/stream')
+async def stream_stocks_by_category_async(request):
+    category = request.path_params['category']
+    error = category_error(category)
+    if error:
+        return json_response(*error)
+    
+    fmt = stream_format(request.headers.get('accept'), request.args.get('format'))
+    try:
+        stocks, progress = await open_category_stream_async(category, request.args.get('order', 'A'))
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}")
+        return json_response({"error": str(e)}, 500)
+    if stocks is None and progress is None:
+        return json_response(*STILL_LOADING)
+    
+    return StreamingResponse(category_events_async(category, stocks, progress, fmt), headers=stream_headers(fmt))
+
+@asgi_app.route('/prices/stream')
+async def stream_live_prices_async(request):
+    tickers, error = stream_tickers(request.args.get('tickers'))
+    if error:
+        return json_response(*error)
+    
+    fmt = stream_format(request.headers.get('accept'), request.args.get('format'))
+    subscription = price_hub.subscribe(tickers)
+    
+    async def events():
+        try:
+            while True:
+                prices = await subscription.get_async(timeout=LIVE_PRICE_HEARTBEAT)
+                yield encode_event(fmt, 'prices', prices_event(prices)) if prices else encode_heartbeat(fmt)
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(events(), headers=stream_headers(fmt))
+
+@asgi_app.websocket('/prices/ws')
+async def live_prices_websocket(websocket):
+    """
+    Live prices over a WebSocket. Clients send {"subscribe": [...]} and {"unsubscribe": [...]}
+    (initial tickers may also be given as ?tickers=) and receive {"event": "prices", "data": ...}
+    messages with the tickers whose price changed.
+    """
+    await websocket.accept()
+    subscription = price_hub.subscribe()
+    
+    async def change_subscriptions(message):
+        try:
+            # One change, so a client at the ticker limit can swap tickers and a rejected message changes nothing
+            subscription.change(subscribe=parse_tickers(message.get('subscribe')),
+                                unsubscribe=parse_tickers(message.get('unsubscribe')))
+        except (AttributeError, ValueError) as e:
+            await websocket.send_json({'event': 'error', 'data': {'message': str(e)}})
+            return
+        await websocket.send_json({'event': 'subscribed', 'data': {'tickers': sorted(subscription.tickers)}})
+    
+    async def read_messages():
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except ValueError:
+                await websocket.send_json({'event': 'error', 'data': {'message': "Messages must be JSON"}})
+                continue
+            if message is None:
+                return
+            await change_subscriptions(message)
+    
+    try:
+        if websocket.args.get('tickers'):
+            await change_subscriptions({'subscribe': websocket.args['tickers']})
+        reader = asyncio.ensure_future(read_messages())
+        while not reader.done():
+            update = asyncio.ensure_future(subscription.get_async(timeout=LIVE_PRICE_HEARTBEAT))
+            await asyncio.wait({reader, update}, return_when=asyncio.FIRST_COMPLETED)
+            if reader.done() or not update.done():
+                update.cancel()
+            elif update.result():
+                await websocket.send_json({'event': 'prices', 'data': prices_event(update.result())})
+        reader.result()
+    finally:
+        subscription.close()
+
+@asgi_app.route('/charts/<ticker>')
+async def get_chart_async(request):
+    ticker = request.path_params['ticker']
+    period = request.args.get('period', '1mo')
+    style = request.args.get('style', 'default')
+    error = chart_request_error(ticker, period, style)
+    if error:
+        return json_response(*error)
+    
+    try:
+        chart = get_shared_chart(ticker, period, style)
+        if chart is None:
+            chart = await asyncio.wait_for(generate_stock_chart_aio(ticker, period, style), CHART_TIMEOUT)
+    except Exception as e:
+        logger.error(f"Error serving chart for {ticker}: {str(e)}")
+        return json_response({"error": str(e)}, 500)
+    if not chart:
+        return json_response({"error": f"No chart available for '{ticker}'"}, 404)
+    
+    headers = {'ETag': f'"{chart["etag"]}"', 'Cache-Control': chart_cache_control(chart, request.args.get('v'))}
+    if etag_matches(request, chart['etag']):
+        return ASGIResponse(status=304, headers=headers, content_type=None)
+    return ASGIResponse(chart['png'], headers=headers, content_type='image/png')
+
 if __name__ == '__main__':
-    # Start preloading cache in a separate thread
-    threading.Thread(target=preload_cache).start()
+    if '--publish' in sys.argv:
+        if not CATEGORIES_FILE:
+            sys.exit("Set TRADEFLOW_CATEGORIES_FILE to the file the server workers read categories from")
+        publish_categories_forever(CATEGORIES_FILE)
+    
+    # Start preloading cache in a separate thread (production workers read the published file instead)
+    if shared_categories is None:
+        threading.Thread(target=preload_cache).start()
     
     # Run the Flask app
     app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
\ No newline at end of file
@@ -1,95 +1,300 @@
-import yfinance as yf
+import pandas as pd
 import math
 import time
-import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-def fetch_stock_data(stock_symbols):
+from indicators import FALLBACK_WINDOW, LONG_MA_WINDOW, MIN_BARS, IndicatorState
+from market_data import default_provider
+from metrics import Counter, Histogram
+from price_panel import PricePanel
+from price_store import PriceStore
+from risk_model import BENCHMARK_SYMBOL, BETA_WINDOWS, SCORING_BETA, CovarianceEngine
+from universe import UniverseSnapshot
+
+# Fetch engine tuning (can be adjusted)
+FETCH_WORKERS = 16          # Tickers fetched in parallel
+FETCH_RATE_LIMIT = 8.0      # Upstream calls per second across all workers
+FETCH_BURST = 16            # Calls allowed back-to-back before pacing kicks in
+TICKER_TIMEOUT = 30         # Seconds a single ticker may take before it is skipped
+
+# Batched history download - one window long enough for every indicator (MA200 needs 200 bars)
+HISTORY_PERIOD = "1y"
+HISTORY_CHUNK_SIZE = 50     # Tickers per bulk download request
+
+# Recent daily bars of the whole universe, kept between refreshes so that later
+# refreshes only download the bars since each ticker's last one
+price_panel = PricePanel()
+
+# Rolling returns covariance of the universe, read from the same panel
+risk_engine = CovarianceEngine(price_panel)
+
+# Smoothed indicator values between refreshes, so a refresh only steps over the bars it added
+indicator_state = IndicatorState()
+
+# Where quotes, history and fundamentals come from (swap for a ReplayProvider to run offline)
+provider = default_provider()
+
+# Instrumentation (exposed on /metrics)
+INDICATOR_SECONDS = Histogram("tradeflow_indicator_duration_seconds",
+                              "Time to compute the technical indicators of the whole universe")
+SKIPPED_SYMBOLS = Counter("tradeflow_skipped_symbols_total",
+                          "Symbols left out of a refresh, by reason", ["reason"])
+
+# Local price history store for warm restarts (set to None to disable)
+price_store = PriceStore()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to pace upstream calls.
+    Replaces the fixed sleeps so that workers only wait when the rate is actually exceeded.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until the requested number of tokens is available"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate
+            # Sleep outside the lock so other workers can refill/check
+            time.sleep(wait_time)
+
+
+def fetch_stock_data(stock_symbols, max_workers=FETCH_WORKERS, rate_limit=FETCH_RATE_LIMIT,
+                     timeout=TICKER_TIMEOUT, progress=None):
     """
     Fetches real-time stock data and additional attributes for the given list of stock symbols.
     Adds technical indicators and resiliency features to improve data quality.
+    Returns a UniverseSnapshot, which can still be read like a {symbol: {attribute: value}} dict.
+    Tickers are fetched concurrently on a bounded worker pool, with upstream calls paced by a
+    token bucket and each ticker given at most `timeout` seconds.
+    `progress`, if given, is called as progress(completed, total) as tickers finish.
     """
-    stock_data = {}
+    limiter = TokenBucket(rate_limit, max(FETCH_BURST, max_workers))
+    results = {}
     missing_data_count = 0
+    started = {}
+    total = len(stock_symbols)
     
-    for symbol in stock_symbols:
-        try:
-            # Add delay to avoid rate limiting (can be adjusted)
-            if len(stock_data) % 10 == 0 and len(stock_data) > 0:
-                time.sleep(1)
-                
-            stock = yf.Ticker(symbol)
+    # Download price history for the whole universe in a few bulk requests.
+    # Tickers already in the price panel only need the bars since their last one.
+    # The benchmark index rides along in the same downloads; it only feeds the beta regression
+    universe = list(stock_symbols) + [BENCHMARK_SYMBOL]
+    seed_price_panel(universe)
+    last_dates = price_panel.last_dates()
+    starts = {}
+    for symbol in universe:
+        last_date = last_dates.get(symbol)
+        starts.setdefault(last_date.date() if last_date is not None else None, []).append(symbol)
+    price_history = {}
+    for start, symbols in starts.items():
+        price_history.update(load_price_history(symbols, start=start, limiter=limiter, timeout=timeout))
+    if price_store is not None and BENCHMARK_SYMBOL in price_history:
+        price_store.append(BENCHMARK_SYMBOL, price_history[BENCHMARK_SYMBOL])
+
+    # Indicators, covariance and betas for every ticker at once; workers only fetch fundamentals
+    price_panel.merge(price_history)
+    update_risk_engine()
+    betas = regression_betas()
+    indicators = panel_indicators(stock_symbols)
+
+    def task(symbol):
+        started[symbol] = time.monotonic()
+        history = price_history.get(symbol)
+        if price_store is not None and history is not None:
+            price_store.append(symbol, history)
+        return fetch_symbol_data(symbol, indicators.get(symbol), limiter,
+                                 {name: values.get(symbol, math.nan) for name, values in betas.items()})
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stock-fetch")
+    try:
+        pending = {executor.submit(task, symbol): symbol for symbol in stock_symbols}
+        while pending:
+            done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                symbol = pending.pop(future)
+                try:
+                    data = future.result()
+                except Exception as e:
+                    missing_data_count += 1
+                    SKIPPED_SYMBOLS.inc(reason="error")
+                    print(f"Skipping {symbol}: Error fetching data ({str(e)}).")
+                    continue
+                if data is None:
+                    missing_data_count += 1
+                    SKIPPED_SYMBOLS.inc(reason="insufficient_data")
+                    print(f"Skipping {symbol}: Insufficient data found.")
+                else:
+                    results[symbol] = data
             
-            # Get historical data for calculations - more data for better indicators
-            hist_short = stock.history(period="1mo")  # Short term for recent indicators
-            hist_long = stock.history(period="6mo")   # Longer term for trend analysis
+            # Give up on tickers that have been running for longer than the per-ticker timeout
+            now = time.monotonic()
+            for future, symbol in list(pending.items()):
+                if symbol in started and now - started[symbol] > timeout:
+                    del pending[future]
+                    missing_data_count += 1
+                    SKIPPED_SYMBOLS.inc(reason="timeout")
+                    print(f"Skipping {symbol}: Timed out after {timeout}s.")
             
-            if not hist_short.empty and len(hist_short) >= 5:
-                # Get basic info
-                info = stock.info
-                
-                # Fetch additional attributes with fallback values
-                market_cap = info.get("marketCap", info.get("totalAssets", 0))
-                sector = info.get("sector", info.get("industry", "Unknown"))
-                beta = info.get("beta", calculate_beta_fallback(hist_long))
-                dividend_yield = info.get("dividendYield", calculate_div_yield_fallback(info, hist_long))
-                
-                # Calculate change percentage
-                change_percent = 0.0
-                if len(hist_short) >= 2:
-                    previous_close = hist_short['Close'].iloc[-2]
-                    current_close = hist_short['Close'].iloc[-1]
-                    if previous_close > 0:
-                        change_percent = ((current_close - previous_close) / previous_close) * 100
-                
-                # Calculate additional technical indicators
-                rsi = calculate_rsi(hist_short)
-                moving_avg_50 = calculate_moving_average(hist_long, 50)
-                moving_avg_200 = calculate_moving_average(hist_long, 200)
-                price_to_ma_ratio = hist_short['Close'].iloc[-1] / moving_avg_50 if moving_avg_50 > 0 else 1.0
-                
-                # Calculate volatility (standard deviation of returns)
-                returns = hist_short['Close'].pct_change().dropna()
-                volatility = returns.std() * 100 if len(returns) > 0 else 0
-                
-                # Ensure we have valid values
-                if beta is None or beta == 0 or math.isnan(beta):
-                    beta = 1.0
-                if dividend_yield is None or math.isnan(dividend_yield):
-                    dividend_yield = 0
-                if market_cap is None or math.isnan(market_cap):
-                    market_cap = 0
-                
-                # Store all data
-                stock_data[symbol] = {
-                    "current_price": hist_short['Close'].iloc[-1],
-                    "day_high": hist_short['High'].iloc[-1],
-                    "day_low": hist_short['Low'].iloc[-1],
-                    "volume": hist_short['Volume'].iloc[-1],
-                    "market_cap": market_cap,
-                    "sector": sector if sector is not None else "Unknown",
-                    "beta": beta,
-                    "dividend_yield": dividend_yield,
-                    "change_percent": change_percent,
-                    # New technical indicators
-                    "rsi": rsi,
-                    "moving_avg_50": moving_avg_50,
-                    "moving_avg_200": moving_avg_200,
-                    "price_to_ma_ratio": price_to_ma_ratio,
-                    "volatility": volatility,
-                    "above_ma50": hist_short['Close'].iloc[-1] > moving_avg_50,
-                    "above_ma200": hist_short['Close'].iloc[-1] > moving_avg_200
-                }
-            else:
-                missing_data_count += 1
-                print(f"Skipping {symbol}: Insufficient data found.")
-        except Exception as e:
-            missing_data_count += 1
-            print(f"Skipping {symbol}: Error fetching data ({str(e)}).")
+            if progress is not None:
+                progress(total - len(pending), total)
+    finally:
+        # Don't wait for stuck upstream calls; their results are discarded
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    # Keep the input ordering so ties in scoring resolve the same way as before
+    fetched = [symbol for symbol in stock_symbols if symbol in results]
+    stock_data = UniverseSnapshot.from_records({symbol: results[symbol] for symbol in fetched},
+                                               risk=risk_engine.model(fetched))
     
     print(f"Fetched data for {len(stock_data)} stocks. Skipped {missing_data_count} stocks.")
     return stock_data
 
 
+def load_price_history(stock_symbols, period=HISTORY_PERIOD, chunk_size=HISTORY_CHUNK_SIZE,
+                       limiter=None, timeout=TICKER_TIMEOUT, start=None):
+    """
+    Downloads OHLCV history for many symbols using bulk multi-ticker requests.
+    Downloads `period` of history, or everything from `start` (inclusive) when given.
+    Returns a dictionary of symbol -> DataFrame of daily history.
+    Symbols that the upstream didn't return are left out.
+    """
+    price_history = {}
+    symbols = list(stock_symbols)
+    
+    for i in range(0, len(symbols), chunk_size):
+        chunk = symbols[i:i + chunk_size]
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            price_history.update(provider.history_batch(chunk, period=period, start=start, timeout=timeout))
+        except Exception as e:
+            print(f"Bulk history download failed for {len(chunk)} symbols ({str(e)}).")
+    
+    return price_history
+
+
+def seed_price_panel(stock_symbols):
+    """
+    Loads the local price store's history of tickers the price panel doesn't hold yet
+    (e.g. after a restart), so the download only needs the bars since the stored ones.
+    """
+    if price_store is None:
+        return
+    stored = {}
+    for symbol in stock_symbols:
+        if symbol in price_panel:
+            continue
+        try:
+            history = price_store.read(symbol, bars=price_panel.bars)
+        except Exception as e:
+            print(f"Ignoring stored history for {symbol} ({str(e)}).")
+            continue
+        # Too little stored history (e.g. only a chart's month) - download the full window instead
+        if history is not None and len(history) >= LONG_MA_WINDOW:
+            stored[symbol] = history
+    price_panel.merge(stored)
+
+
+def update_risk_engine():
+    """Brings the covariance engine up to date with the bars merged into the price panel"""
+    try:
+        risk_engine.update()
+    except Exception as e:
+        # Recommendations still work without allocations - don't fail the refresh
+        print(f"Error updating the returns covariance ({str(e)}).")
+
+
+def regression_betas():
+    """
+    Betas of every ticker to the benchmark index over each of BETA_WINDOWS, regressed in one
+    pass over the covariance engine's returns panel: {window name: {symbol: beta}}
+    """
+    try:
+        return risk_engine.betas(BENCHMARK_SYMBOL, BETA_WINDOWS)
+    except Exception as e:
+        # Betas fall back to the provider's and the volatility estimate
+        print(f"Error regressing betas on {BENCHMARK_SYMBOL} ({str(e)}).")
+        return {name: {} for name in BETA_WINDOWS}
+
+
+def panel_indicators(stock_symbols):
+    """
+    Technical indicators of every ticker in the price panel, computed in one pass over the
+    whole universe and carried on from the last refresh (see IndicatorState):
+    {symbol: {indicator: value}}. Tickers with too few bars are left out.
+    """
+    with INDICATOR_SECONDS.time():
+        dates, symbols, prices = price_panel.arrays(stock_symbols)
+        columns, bars = indicator_state.update(dates, symbols, prices)
+        names = list(columns)
+        rows = zip(*(columns[name].tolist() for name in names))
+        return {symbol: dict(zip(names, row)) for symbol, row, count in zip(symbols, rows, bars.tolist())
+                if count >= MIN_BARS}
+
+
+def fetch_symbol_data(symbol, indicators, limiter, betas=None):
+    """
+    Fetches a single symbol's fundamentals and combines them with its technical
+    `indicators` (see panel_indicators) and regression `betas` by window name.
+    Returns None when there isn't enough history to work with.
+    """
+    if indicators is None:
+        return None
+    data = dict(indicators)
+    
+    # Get basic info
+    limiter.acquire()
+    info = provider.fundamentals(symbol)
+    
+    # Fetch additional attributes with fallback values (fallbacks only computed when needed)
+    market_cap = info.get("marketCap", info.get("totalAssets", 0))
+    sector = info.get("sector", info.get("industry", "Unknown"))
+    # Regression beta against the benchmark first, then the provider's, then the volatility estimate
+    betas = betas or {}
+    beta = betas.get(SCORING_BETA, math.nan)
+    if beta is None or math.isnan(beta):
+        beta = info["beta"] if "beta" in info else calculate_beta_fallback(recent_history(symbol))
+    dividend_yield = (info["dividendYield"] if "dividendYield" in info
+                      else calculate_div_yield_fallback(info, recent_history(symbol)))
+    
+    # Ensure we have valid values
+    if beta is None or beta == 0 or math.isnan(beta):
+        beta = 1.0
+    if dividend_yield is None or math.isnan(dividend_yield):
+        dividend_yield = 0
+    if market_cap is None or math.isnan(market_cap):
+        market_cap = 0
+    
+    data.update({
+        "market_cap": market_cap,
+        "sector": sector if sector is not None else "Unknown",
+        "beta": beta,
+        "dividend_yield": dividend_yield,
+    })
+    data.update(betas)
+    return data
+
+
+def recent_history(symbol, bars=FALLBACK_WINDOW):
+    """A ticker's last `bars` bars from the price panel (empty when it has none)"""
+    history = price_panel.history(symbol, bars=bars)
+    return history if history is not None else pd.DataFrame(columns=["Close", "Dividends"])
+
+
 def calculate_beta_fallback(historical_data):
     """Calculate a fallback beta value from price volatility if API doesn't provide it"""
     if len(historical_data) < 30:
@@ -125,27 +330,3 @@ def calculate_div_yield_fallback(info, historical_data):
             return annual_div / info['previousClose']
     
     return 0.0  # Default if no dividend info available
-
-
-def calculate_rsi(data, window=14):
-    """Calculate the Relative Strength Index"""
-    if len(data) < window + 1:
-        return 50  # Default value if not enough data
-        
-    delta = data['Close'].diff()
-    gain = delta.where(delta > 0, 0).rolling(window=window).mean()
-    loss = -delta.where(delta < 0, 0).rolling(window=window).mean()
-    
-    if loss.iloc[-1] == 0:
-        return 100
-        
-    rs = gain.iloc[-1] / loss.iloc[-1]
-    return 100 - (100 / (1 + rs))
-
-
-def calculate_moving_average(data, window):
-    """Calculate moving average of closing prices"""
-    if len(data) < window:
-        return data['Close'].mean() if not data.empty else 0
-    
-    return data['Close'].rolling(window=window).mean().iloc[-1]
\ No newline at end of file
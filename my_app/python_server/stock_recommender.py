@@ -1,3 +1,32 @@
+import numpy as np
+
+from metrics import Histogram
+from universe import UniverseSnapshot
+
+# Stock attributes the scoring engine reads
+SCORE_FIELDS = ("beta", "market_cap", "dividend_yield", "change_percent")
+
+# Minimum scores tried in turn until some stock qualifies, and how many stocks are recommended
+SCORE_THRESHOLDS = (60, 50, 40, 30, 20)
+MAX_RECOMMENDATIONS = 10
+
+# Price guidance per risk appetite: (buy discount, profit target, stop loss) per unit of beta.
+# Low risk gets a conservative entry point and profit target and a tight stop loss
+GUIDANCE_FACTORS = {
+    "low": (0.03, 0.08, 0.05),
+    "medium": (0.05, 0.15, 0.08),
+    "high": (0.08, 0.25, 0.12),
+}
+
+# recommend_stocks_batch scores this many profile x stock cells per vectorized pass (bounds memory)
+BATCH_CELLS = 2_000_000
+
+# Instrumentation (exposed on /metrics)
+SCORING_SECONDS = Histogram("tradeflow_scoring_duration_seconds", "Time to score the whole universe for one profile")
+BATCH_SCORING_SECONDS = Histogram("tradeflow_batch_scoring_duration_seconds",
+                                  "Time to score and select recommendations for a batch of profiles")
+
+
 def recommend_stocks(user_input, stock_data):
     """
     Recommends stocks based on user input and stock data.
@@ -9,7 +38,6 @@ def recommend_stocks(user_input, stock_data):
     sector_preference = user_input["sector_preference"]
     market_cap_preference = user_input["market_cap_preference"]
     dividend_preference = user_input["dividend_preference"]
-    investment_amount = user_input["investment_amount"]
 
     # Step 1: Score all stocks based on user preferences
     scored_stocks = score_all_stocks(stock_data, risk_appetite, investment_horizon, investment_goal,
@@ -17,24 +45,24 @@ def recommend_stocks(user_input, stock_data):
     
     # Step 2: Filter stocks by minimum threshold score
     # Higher threshold for stricter filtering
-    threshold_score = 60  # Minimum score out of 100
+    threshold_score = SCORE_THRESHOLDS[0]  # Minimum score out of 100
     
     filtered_stocks = [symbol for symbol, score in scored_stocks if score >= threshold_score]
     
     # Step 3: If no stocks match, gradually reduce threshold until we get matches
     if not filtered_stocks:
-        for lower_threshold in [50, 40, 30, 20]:
+        for lower_threshold in SCORE_THRESHOLDS[1:]:
             filtered_stocks = [symbol for symbol, score in scored_stocks if score >= lower_threshold]
             if filtered_stocks:
                 break
     
     # Step 4: Final fallback - use top scored stocks regardless of threshold
     if not filtered_stocks and scored_stocks:
-        filtered_stocks = [symbol for symbol, score in scored_stocks[:10]]
+        filtered_stocks = [symbol for symbol, score in scored_stocks[:MAX_RECOMMENDATIONS]]
     
     # Step 5: Add buy/sell guidance for each recommended stock
     recommended_stocks = []
-    for symbol in filtered_stocks[:10]:  # Limit to top 10
+    for symbol in filtered_stocks[:MAX_RECOMMENDATIONS]:  # Limit to top 10
         if symbol in stock_data:
             price_guidance = generate_price_guidance(symbol, stock_data[symbol], risk_appetite, investment_horizon)
             recommended_stocks.append((symbol, price_guidance))
@@ -42,116 +70,256 @@ def recommend_stocks(user_input, stock_data):
     return recommended_stocks
 
 
+def recommend_stocks_batch(user_inputs, stock_data):
+    """
+    recommend_stocks for many profiles at once. The profiles x stocks score matrix is
+    computed in vectorized passes, then every row gets the same threshold fallback and
+    top-10 selection. Returns one list of (symbol, price_guidance) per profile, in order.
+    Guidance dictionaries may be shared between profiles and must not be modified.
+    """
+    snapshot = as_snapshot(stock_data)
+    symbols = snapshot.symbols
+    
+    # Guidance only depends on the stock, the risk appetite and the horizon range
+    guidance_cache = {}
+    
+    def guidance(symbol, risk_appetite, investment_horizon):
+        key = (symbol, risk_appetite, guidance_horizon(investment_horizon))
+        if key not in guidance_cache:
+            guidance_cache[key] = generate_price_guidance(symbol, snapshot[symbol], risk_appetite, investment_horizon)
+        return guidance_cache[key]
+    
+    return [[(symbols[i], guidance(symbols[i], profile["risk_appetite"], profile["investment_horizon"]))
+             for i in picked]
+            for profile, picked in zip(user_inputs, recommended_rows(snapshot, user_inputs))]
+
+
+def recommended_rows(snapshot, user_inputs):
+    """
+    Snapshot row indices of every profile's recommended stocks, best first, in profile order.
+    Profiles are scored in chunks of about BATCH_CELLS profile x stock cells.
+    """
+    rows = np.flatnonzero(snapshot.valid)
+    columns = {field: snapshot.columns[field][rows] for field in SCORE_FIELDS}
+    
+    picks = []
+    chunk_size = max(1, BATCH_CELLS // max(len(rows), 1))
+    for start in range(0, len(user_inputs), chunk_size):
+        profiles = user_inputs[start:start + chunk_size]
+        with BATCH_SCORING_SECONDS.time():
+            scores = score_profiles(snapshot, rows, columns, profiles)
+            picks.extend(rows[picked] for picked in select_top_stocks(scores))
+    return picks
+
+
+def score_profiles(snapshot, rows, columns, profiles):
+    """(profiles, stocks) score matrix for the stocks at `rows` of the snapshot"""
+    def preference(field):
+        return np.array([profile[field] for profile in profiles])[:, None]
+    
+    sector_masks = {}
+    market_cap_masks = {}
+    for profile in profiles:
+        sector_preference = profile["sector_preference"]
+        market_cap_preference = profile["market_cap_preference"]
+        if sector_preference not in sector_masks or market_cap_preference not in market_cap_masks:
+            sector_match, market_cap_match = preference_masks(snapshot, sector_preference, market_cap_preference)
+            sector_masks.setdefault(sector_preference, sector_match[rows])
+            market_cap_masks.setdefault(market_cap_preference, market_cap_match[rows])
+    sector_match = np.stack([sector_masks[profile["sector_preference"]] for profile in profiles])
+    market_cap_match = np.stack([market_cap_masks[profile["market_cap_preference"]] for profile in profiles])
+    
+    return score_columns(columns, preference("risk_appetite"), preference("investment_horizon"),
+                         preference("investment_goal"), sector_match, preference("market_cap_preference"),
+                         market_cap_match, preference("dividend_preference"))
+
+
+def select_top_stocks(scores):
+    """
+    Column indices of the recommended stocks for each row of a score matrix, best first:
+    the top MAX_RECOMMENDATIONS scoring at least the first threshold of SCORE_THRESHOLDS
+    that any stock of the row reaches, or the top ones regardless if none is reached.
+    """
+    profiles, stocks = scores.shape
+    if stocks == 0:
+        return [np.empty(0, dtype=np.intp) for _ in range(profiles)]
+    
+    order = top_columns(scores, min(MAX_RECOMMENDATIONS, stocks))
+    best = scores.max(axis=1)
+    
+    # Qualifying stocks sort first, so each row's picks are a prefix of its order
+    counts = np.full(profiles, stocks)
+    unresolved = np.ones(profiles, dtype=bool)
+    for threshold in SCORE_THRESHOLDS:
+        reached = unresolved & (best >= threshold)
+        if reached.any():
+            counts[reached] = (scores[reached] >= threshold).sum(axis=1)
+        unresolved &= ~reached
+    counts = np.minimum(counts, MAX_RECOMMENDATIONS)
+    return [row[:count] for row, count in zip(order, counts)]
+
+
+def top_columns(scores, count):
+    """
+    Column indices of the `count` highest scores of each row, best first, in the same order as
+    a stable descending sort (ties keep column order) without sorting whole rows.
+    """
+    # Everything scoring at least the count-th best - exactly `count` columns unless there are ties
+    kth = -np.partition(-scores, count - 1, axis=1)[:, count - 1]
+    candidates = scores >= kth[:, None]
+    per_row = candidates.sum(axis=1)
+    
+    top = np.empty((len(scores), count), dtype=np.intp)
+    exact = per_row == count
+    if exact.any():
+        # np.nonzero lists each row's columns in ascending order, so the stable sort keeps ties in order
+        columns = np.nonzero(candidates[exact])[1].reshape(-1, count)
+        ranked = np.argsort(-np.take_along_axis(scores[exact], columns, axis=1), axis=1, kind="stable")
+        top[exact] = np.take_along_axis(columns, ranked, axis=1)
+    for row in np.flatnonzero(~exact):
+        columns = np.flatnonzero(candidates[row])
+        top[row] = columns[np.argsort(-scores[row, columns], kind="stable")[:count]]
+    return top
+
+
+def guidance_horizon(investment_horizon):
+    """The horizon ranges generate_price_guidance and determine_trading_strategy distinguish"""
+    if investment_horizon > 5:
+        return "long"
+    if investment_horizon < 2:
+        return "short"
+    return "medium"
+
+
 def score_all_stocks(stock_data, risk_appetite, investment_horizon, investment_goal,
                     sector_preference, market_cap_preference, dividend_preference):
     """
     Scores all stocks based on user preferences on a scale of 0-100.
     Returns a list of (symbol, score) tuples sorted by score in descending order.
     """
-    scored_stocks = []
-    
-    for symbol, data in stock_data.items():
-        # Skip if missing critical data
-        if "beta" not in data or "market_cap" not in data or "sector" not in data:
-            continue
+    with SCORING_SECONDS.time():
+        snapshot = as_snapshot(stock_data)
         
-        # Initialize score components
-        risk_score = 0
-        market_cap_score = 0
-        sector_score = 0
-        dividend_score = 0
-        goal_score = 0
+        # Skip stocks missing critical data
+        rows = np.flatnonzero(snapshot.valid)
+        columns = {field: snapshot.columns[field][rows] for field in SCORE_FIELDS}
         
-        # Calculate risk score (0-25 points)
-        beta = data.get("beta", 1.0)
-        if risk_appetite == "low":
-            # Lower beta is better for low risk
-            risk_score = max(0, 25 - (beta * 10)) if beta < 1.5 else 0
-        elif risk_appetite == "medium":
+        # Preference matches come straight from the snapshot's sector and market cap indexes
+        sector_match, market_cap_match = preference_masks(snapshot, sector_preference, market_cap_preference)
+        scores = score_columns(columns, risk_appetite, investment_horizon, investment_goal,
+                               sector_match[rows], market_cap_preference, market_cap_match[rows],
+                               dividend_preference)
+        
+        # Stable sort keeps the input order for ties, same as sorted(..., reverse=True)
+        order = np.argsort(-scores, kind="stable")
+    symbols = snapshot.symbols
+    return [(symbols[rows[i]], float(scores[i])) for i in order]
+
+
+def as_snapshot(stock_data):
+    """Accepts either a UniverseSnapshot or a {symbol: {attribute: value}} dictionary"""
+    if isinstance(stock_data, UniverseSnapshot):
+        return stock_data
+    return UniverseSnapshot.from_records(stock_data)
+
+
+def preference_masks(snapshot, sector_preference, market_cap_preference):
+    """
+    Returns boolean masks of the stocks that fully match the sector and market cap preferences.
+    "all" matches every stock.
+    """
+    if sector_preference == "all":
+        sector_match = np.ones(len(snapshot), dtype=bool)
+    else:
+        sector_match = snapshot.sector_mask(sector_preference)
+    
+    if market_cap_preference == "all":
+        market_cap_match = np.ones(len(snapshot), dtype=bool)
+    else:
+        market_cap_match = snapshot.market_cap_mask(market_cap_preference)
+    
+    return sector_match, market_cap_match
+
+
+def score_columns(columns, risk_appetite, investment_horizon, investment_goal,
+                  sector_match, market_cap_preference, market_cap_match, dividend_preference):
+    """
+    Computes the 0-100 suitability score for every stock at once.
+    `columns` holds one array per attribute in SCORE_FIELDS, and `sector_match` /
+    `market_cap_match` are the full-match masks from preference_masks. Preferences can be
+    scalars or arrays shaped (profiles, 1) with masks shaped (profiles, stocks), in which
+    case a (profiles, stocks) score matrix is returned.
+    """
+    beta = columns["beta"]
+    market_cap = columns["market_cap"]
+    dividend_yield = columns["dividend_yield"]
+    change_percent = columns["change_percent"]
+    
+    risk_appetite = np.asarray(risk_appetite)
+    investment_horizon = np.asarray(investment_horizon)
+    investment_goal = np.asarray(investment_goal)
+    market_cap_preference = np.asarray(market_cap_preference)
+    dividend_preference = np.asarray(dividend_preference)
+    
+    # Calculate risk score (0-25 points)
+    risk_score = np.where(
+        risk_appetite == "low",
+        # Lower beta is better for low risk
+        np.where(beta < 1.5, np.fmax(0, 25 - (beta * 10)), 0),
+        np.where(
+            risk_appetite == "medium",
             # Beta close to 1.0 is ideal for medium risk
-            risk_score = max(0, 25 - (abs(beta - 1.0) * 20))
-        else:  # high risk
+            np.fmax(0, 25 - (np.abs(beta - 1.0) * 20)),
             # Higher beta is better for high risk (up to about 2.0)
-            risk_score = min(beta * 12.5, 25) if beta > 0.8 else 0
-        
-        # Calculate market cap score (0-15 points)
-        market_cap = data.get("market_cap", 0)
-        if market_cap_preference == "all":
-            market_cap_score = 15
-        elif market_cap_preference == "large-cap" and market_cap >= 50000000000:
-            market_cap_score = 15
-        elif market_cap_preference == "mid-cap" and market_cap >= 10000000000 and market_cap < 50000000000:
-            market_cap_score = 15
-        elif market_cap_preference == "small-cap" and market_cap < 10000000000:
-            market_cap_score = 15
-        else:
-            # Partial score for close matches
-            if market_cap_preference == "large-cap" and market_cap >= 30000000000:
-                market_cap_score = 8
-            elif market_cap_preference == "mid-cap" and market_cap >= 5000000000:
-                market_cap_score = 8
-            elif market_cap_preference == "small-cap" and market_cap < 20000000000:
-                market_cap_score = 8
-        
-        # Calculate sector score (0-20 points)
-        if sector_preference == "all":
-            sector_score = 20
-        elif data.get("sector", "").lower() == sector_preference.lower():
-            sector_score = 20
-        
-        # Calculate dividend score (0-15 points)
-        dividend_yield = data.get("dividend_yield", 0)
-        if dividend_preference == "yes":
-            dividend_score = min(dividend_yield * 750, 15)  # Max score at 2% dividend yield
-        else:
-            dividend_score = 15 - min(dividend_yield * 300, 10)  # Lower dividends preferred
-        
-        # Calculate goal score (0-25 points)
-        if investment_goal == "growth":
-            # For growth: higher beta, lower dividend, positive momentum
-            change_percent = data.get("change_percent", 0)
-            momentum_factor = min(max(change_percent, -5), 10) + 5  # Scale from 0-15
-            
-            goal_score = min(beta * 8, 15) + (15 - min(dividend_yield * 375, 15)) + (momentum_factor * 0.5)
-            goal_score = min(goal_score, 25)  # Cap at 25
-            
-        elif investment_goal == "dividends":
-            # For dividends: stable beta, higher dividend yield
-            stability_factor = 15 - min(abs(beta - 0.8) * 10, 15)  # More stable stocks
-            goal_score = min(dividend_yield * 1000, 20) + stability_factor * 0.25
-            goal_score = min(goal_score, 25)  # Cap at 25
-            
-        else:  # "both"
-            # For both: balanced approach
-            balanced_factor = 15 - min(abs(beta - 1.0) * 15, 15)  # Beta around 1.0
-            goal_score = min(dividend_yield * 500, 12.5) + balanced_factor + min(max(data.get("change_percent", 0), 0), 5)
-            goal_score = min(goal_score, 25)  # Cap at 25
-        
-        # Investment horizon alignment bonus (0-10)
-        horizon_bonus = 0
-        if investment_horizon <= 2:  # Short term
-            # Favor lower beta stocks for short term investments
-            horizon_bonus = max(0, 10 - (beta * 5)) if beta < 1.5 else 0
-        elif investment_horizon <= 5:  # Medium term
-            # Balanced stocks for medium term
-            horizon_bonus = max(0, 10 - (abs(beta - 1.0) * 8))
-        else:  # Long term
-            # Growth stocks for long term
-            if investment_goal == "growth":
-                horizon_bonus = min(beta * 5, 10) if beta < 2 else 5
-            elif investment_goal == "dividends":
-                horizon_bonus = min(dividend_yield * 500, 10)
-            else:
-                horizon_bonus = min((beta * 2.5) + (dividend_yield * 250), 10)
-        
-        # Total score (max 100)
-        total_score = risk_score + market_cap_score + sector_score + dividend_score + goal_score + horizon_bonus
-        
-        # Save score
-        scored_stocks.append((symbol, total_score))
+            np.where(beta > 0.8, np.minimum(beta * 12.5, 25), 0)))
+    
+    # Calculate market cap score (0-15 points)
+    # Partial score for close matches
+    close_match = (((market_cap_preference == "large-cap") & (market_cap >= 30000000000))
+                   | ((market_cap_preference == "mid-cap") & (market_cap >= 5000000000))
+                   | ((market_cap_preference == "small-cap") & (market_cap < 20000000000)))
+    market_cap_score = np.where(market_cap_match, 15, np.where(close_match, 8, 0))
+    
+    # Calculate sector score (0-20 points)
+    sector_score = np.where(sector_match, 20, 0)
+    
+    # Calculate dividend score (0-15 points)
+    dividend_score = np.where(
+        dividend_preference == "yes",
+        np.minimum(dividend_yield * 750, 15),  # Max score at 2% dividend yield
+        15 - np.minimum(dividend_yield * 300, 10))  # Lower dividends preferred
+    
+    # Calculate goal score (0-25 points)
+    # For growth: higher beta, lower dividend, positive momentum
+    momentum_factor = np.minimum(np.maximum(change_percent, -5), 10) + 5  # Scale from 0-15
+    growth_score = (np.minimum(beta * 8, 15) + (15 - np.minimum(dividend_yield * 375, 15))
+                    + (momentum_factor * 0.5))
+    # For dividends: stable beta, higher dividend yield
+    stability_factor = 15 - np.minimum(np.abs(beta - 0.8) * 10, 15)  # More stable stocks
+    dividends_score = np.minimum(dividend_yield * 1000, 20) + stability_factor * 0.25
+    # For both: balanced approach
+    balanced_factor = 15 - np.minimum(np.abs(beta - 1.0) * 15, 15)  # Beta around 1.0
+    both_score = (np.minimum(dividend_yield * 500, 12.5) + balanced_factor
+                  + np.minimum(np.maximum(change_percent, 0), 5))
+    goal_score = np.minimum(np.where(
+        investment_goal == "growth", growth_score,
+        np.where(investment_goal == "dividends", dividends_score, both_score)), 25)  # Cap at 25
     
-    # Sort by score in descending order
-    return sorted(scored_stocks, key=lambda x: x[1], reverse=True)
+    # Investment horizon alignment bonus (0-10)
+    # Short term: favor lower beta stocks
+    short_bonus = np.where(beta < 1.5, np.fmax(0, 10 - (beta * 5)), 0)
+    # Medium term: balanced stocks
+    medium_bonus = np.fmax(0, 10 - (np.abs(beta - 1.0) * 8))
+    # Long term: growth stocks
+    long_bonus = np.where(
+        investment_goal == "growth", np.where(beta < 2, np.minimum(beta * 5, 10), 5),
+        np.where(investment_goal == "dividends", np.minimum(dividend_yield * 500, 10),
+                 np.minimum((beta * 2.5) + (dividend_yield * 250), 10)))
+    horizon_bonus = np.where(investment_horizon <= 2, short_bonus,
+                             np.where(investment_horizon <= 5, medium_bonus, long_bonus))
+    
+    # Total score (max 100)
+    return risk_score + market_cap_score + sector_score + dividend_score + goal_score + horizon_bonus
 
 
 def generate_price_guidance(symbol, stock_data, risk_appetite, investment_horizon):
@@ -167,18 +335,8 @@ def generate_price_guidance(symbol, stock_data, risk_appetite, investment_horizo
     volatility_factor = max(beta, 0.5)
     
     # Adjust based on risk appetite
-    if risk_appetite == "low":
-        buy_discount = 0.03 * volatility_factor  # Conservative entry point
-        profit_target = 0.08 * volatility_factor  # Conservative profit target
-        stop_loss = 0.05 * volatility_factor  # Tight stop loss
-    elif risk_appetite == "medium":
-        buy_discount = 0.05 * volatility_factor
-        profit_target = 0.15 * volatility_factor
-        stop_loss = 0.08 * volatility_factor
-    else:  # high
-        buy_discount = 0.08 * volatility_factor
-        profit_target = 0.25 * volatility_factor
-        stop_loss = 0.12 * volatility_factor
+    factors = GUIDANCE_FACTORS.get(risk_appetite, GUIDANCE_FACTORS["high"])
+    buy_discount, profit_target, stop_loss = (factor * volatility_factor for factor in factors)
     
     # Adjust based on recent price movement
     if change_percent > 5:
@@ -212,6 +370,31 @@ def generate_price_guidance(symbol, stock_data, risk_appetite, investment_horizo
     }
 
 
+def price_guidance_levels(current_price, beta, change_percent, risk_appetite, investment_horizon):
+    """
+    Unrounded (buy target, sell target, stop loss) prices of generate_price_guidance for whole
+    arrays of stocks and profiles at once (all arguments broadcast together), as used by the
+    backtester. Must follow the same rules as generate_price_guidance.
+    """
+    volatility_factor = np.maximum(beta, 0.5)
+    
+    factors = np.array([GUIDANCE_FACTORS[risk] for risk in ("low", "medium", "high")])
+    risk = np.select([risk_appetite == "low", risk_appetite == "medium"], [0, 1], default=2)
+    buy_discount, profit_target, stop_loss = (factors[risk, i] * volatility_factor for i in range(3))
+    
+    buy_discount = buy_discount + np.where(change_percent > 5, 0.02, np.where(change_percent < -5, 0.01, 0.0))
+    stop_loss = stop_loss + np.where(change_percent < -5, 0.02, 0.0)
+    
+    long_term = investment_horizon > 5
+    short_term = investment_horizon < 2
+    profit_target = profit_target * np.where(long_term, 1.5, np.where(short_term, 0.7, 1.0))
+    buy_discount = buy_discount * np.where(long_term, 1.2, 1.0)
+    stop_loss = stop_loss * np.where(short_term, 0.8, 1.0)
+    
+    return (current_price * (1 - buy_discount), current_price * (1 + profit_target),
+            current_price * (1 - stop_loss))
+
+
 def determine_trading_strategy(stock_data, risk_appetite, investment_horizon):
     """
     Determines an appropriate trading strategy based on stock metrics and user preferences.
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+
+from responses import dumps
+
+# Streaming response formats: one JSON object per line, or Server-Sent Events
+NDJSON = "ndjson"
+SSE = "sse"
+CONTENT_TYPES = {NDJSON: "application/x-ndjson", SSE: "text/event-stream"}
+
+
+def stream_format(accept=None, requested=None):
+    """Picks the stream format from ?format= or, failing that, the Accept header (NDJSON by default)"""
+    if requested in CONTENT_TYPES:
+        return requested
+    if accept and CONTENT_TYPES[SSE] in accept:
+        return SSE
+    return NDJSON
+
+
+def stream_headers(fmt):
+    return {
+        "Content-Type": CONTENT_TYPES[fmt],
+        "Cache-Control": "no-cache",
+        # Stop reverse proxies (nginx) from buffering the stream
+        "X-Accel-Buffering": "no",
+    }
+
+
+def encode_event(fmt, event, data):
+    """
+    One event as bytes: an `event: ...`/`data: ...` SSE block, or an NDJSON line with an "event"
+    field. Data is encoded like the JSON endpoints (see responses.dumps).
+    """
+    if fmt == SSE:
+        return f"event: {event}\ndata: ".encode("utf-8") + dumps(data) + b"\n"
+    return dumps({"event": event, "data": data})
+
+
+def encode_heartbeat(fmt):
+    """Keeps idle connections open through proxies (an SSE comment, or an empty NDJSON line)"""
+    return b": keep-alive\n\n" if fmt == SSE else b"\n"
+
+
+class ProgressFeed:
+    """
+    Items produced by one in-flight job, in the order they became ready, for any number
+    of followers. Followers that join late first get everything produced so far.
+    Producers may be threads or coroutines; followers can block (follow) or await (follow_async).
+    With `key`, an item whose key was already added is ignored.
+    """
+
+    def __init__(self, total=None, key=None):
+        self.total = total
+        self.key = key
+        self.items = []
+        self.done = False
+        self._keys = set()
+        self._condition = threading.Condition()
+        self._waiters = set()  # (loop, asyncio.Event) of async followers
+
+    def add(self, item):
+        with self._condition:
+            if self.done:
+                return
+            if self.key is not None:
+                key = self.key(item)
+                if key in self._keys:
+                    return
+                self._keys.add(key)
+            self.items.append(item)
+            self._notify()
+
+    def finish(self):
+        with self._condition:
+            self.done = True
+            self._notify()
+
+    def follow(self, timeout=None):
+        """Yields every item until the job finishes (or nothing arrives for `timeout` seconds)"""
+        position = 0
+        while True:
+            with self._condition:
+                if not self._condition.wait_for(lambda: len(self.items) > position or self.done, timeout):
+                    return
+                items, done = self.items[position:], self.done
+            position += len(items)
+            yield from items
+            if done:
+                return
+
+    async def follow_async(self):
+        """Async iterator over every item until the job finishes"""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        waiter = (loop, ready)
+        position = 0
+        try:
+            while True:
+                with self._condition:
+                    items, done = self.items[position:], self.done
+                    if not items and not done:
+                        ready.clear()
+                        self._waiters.add(waiter)
+                if not items and not done:
+                    await ready.wait()
+                    continue
+                position += len(items)
+                for item in items:
+                    yield item
+                if done:
+                    return
+        finally:
+            with self._condition:
+                self._waiters.discard(waiter)
+
+    def _notify(self):
+        self._condition.notify_all()
+        for loop, ready in self._waiters:
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:  # The follower's event loop has closed
+                pass
+        self._waiters.clear()
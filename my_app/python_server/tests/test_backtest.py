@@ -0,0 +1,164 @@
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+from backtest import EXPIRED, GUIDANCE_VARIANTS, NOT_FILLED, STOP, TARGET, Backtest
+from price_panel import PricePanel
+from risk_model import BENCHMARK_SYMBOL
+
+# Every trade below is placed at the close of row 0 with these levels
+BUY, SELL, STOP_LOSS = 100.0, 110.0, 95.0
+ENTRY_BARS, TRADE_BARS = 5, 10
+
+FLAT = (102, 102, 102, 102)
+# After the trade window: would hit both the target and the stop if it were still watched
+BEYOND = (120, 130, 90, 125)
+
+# Open, high, low, close of the bars after row 0, and the expected (outcome, exit / fill - 1, bars held)
+TRADES = {
+    # Fills on its second bar at the buy target, exits at the target two bars later
+    "TARGET": ([FLAT, (101, 101.5, 99, 100), (100, 105, 99, 104), (104, 111, 103, 109)],
+               (TARGET, 110 / 100 - 1, 2)),
+    # Fills on its first bar, stopped out at the stop loss
+    "STOP": ([(100.5, 101, 99.5, 100), (100, 101, 96, 97), (97, 98, 94, 95)],
+             (STOP, 95 / 100 - 1, 2)),
+    # Target and stop on the same bar: the stop wins
+    "BOTH": ([(101, 101, 99, 100), (100, 111, 94, 105)],
+             (STOP, 95 / 100 - 1, 1)),
+    # Opens below the buy target (filled at that open), then gaps below the stop (out at that open)
+    "GAPS": ([(98, 99, 97, 98), (93, 94, 92, 93)],
+             (STOP, 93 / 98 - 1, 1)),
+    # Opens above the sell target: out at that open
+    "GAP_UP": ([(101, 101, 99, 100), (112, 113, 111, 112)],
+               (TARGET, 112 / 100 - 1, 1)),
+    # Neither level within TRADE_BARS: out at the close of the last bar of the window
+    "EXPIRES": ([(101, 101, 99, 100)] + [FLAT] * 8 + [(103, 104, 102, 103.5)],
+                (EXPIRED, 103.5 / 100 - 1, 9)),
+    # The entry bar reaches the target, but exits are only watched from the bar after it
+    "ENTRY_BAR": ([(101, 111, 99, 105)],
+                  (EXPIRED, 102 / 100 - 1, 9)),
+    # Reaches the buy target only after the order expired
+    "LATE": ([(103, 104, 101, 103)] * ENTRY_BARS + [(101, 101, 99, 100)],
+             (NOT_FILLED, np.nan, np.nan)),
+}
+
+
+def trade_panel():
+    dates = pd.bdate_range("2024-01-01", periods=1 + TRADE_BARS + 2)
+    histories = {}
+    for symbol, (bars, _) in TRADES.items():
+        bars = [FLAT] + list(bars) + [FLAT] * (TRADE_BARS - len(bars)) + [BEYOND] * 2
+        histories[symbol] = pd.DataFrame(bars, index=dates, columns=["Open", "High", "Low", "Close"]).assign(
+            Dividends=0.0)
+    panel = PricePanel(bars=None, fields=("Open", "High", "Low", "Close", "Dividends"))
+    panel.merge(histories)
+    return panel
+
+
+def fixed_levels(current_price, beta, change_percent, risk_appetite, investment_horizon):
+    shape = np.broadcast(current_price, risk_appetite).shape
+    return tuple(np.full(shape, level) for level in (BUY, SELL, STOP_LOSS))
+
+
+@pytest.fixture
+def trades(monkeypatch):
+    monkeypatch.setattr(backtest, "price_guidance_levels", fixed_levels)
+    monkeypatch.setattr(backtest, "ENTRY_BARS", ENTRY_BARS)
+    monkeypatch.setattr(backtest, "TRADE_BARS", TRADE_BARS)
+    test = Backtest(trade_panel(), {})
+    held = np.arange(len(test.symbols))
+    snapshot = types.SimpleNamespace(columns={name: np.full(len(held), 102.0)
+                                              for name in ("current_price", "beta", "change_percent")})
+    return test.symbols, test.trade(0, held, snapshot)
+
+
+@pytest.mark.parametrize("symbol", TRADES)
+def test_trade_fills_and_exits(trades, symbol):
+    symbols, results = trades
+    column = symbols.index(symbol)
+    outcome, trade_return, bars = TRADES[symbol][1]
+    for name in ("outcome", "return", "bars"):
+        assert results[name].shape == (len(GUIDANCE_VARIANTS), len(symbols))
+    assert (results["outcome"][:, column] == outcome).all()
+    np.testing.assert_allclose(results["return"][:, column], trade_return, rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(results["bars"][:, column], bars)
+
+
+def random_panel(seed, closes=None):
+    """300 bars of a benchmark and six tickers, with gaps, a late listing and dividends (but not T5)"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2022-01-03", periods=300)
+    market = rng.normal(0.0003, 0.01, len(dates))
+    histories = {}
+    for i, symbol in enumerate([BENCHMARK_SYMBOL] + [f"T{i}" for i in range(6)]):
+        returns = (0.5 + 0.3 * i) * market + rng.normal(0, 0.012, len(dates))
+        close = 100 * np.exp(np.cumsum(returns))
+        spread = close * rng.uniform(0, 0.02, len(dates))
+        history = pd.DataFrame({"Open": close + rng.normal(0, 1, len(dates)), "High": close + spread,
+                                "Low": close - spread, "Close": close,
+                                "Dividends": np.where(rng.random(len(dates)) < 0.02, close * 0.01, 0.0)},
+                               index=dates)
+        if i == 2:
+            history = history.iloc[40:]
+        elif i == 6:
+            history["Dividends"] = 0.0
+        elif i == 3:
+            history = history.drop(history.index[rng.choice(len(dates), 30, replace=False)])
+        histories[symbol] = history
+    if closes is not None:
+        # Keeps each ticker's last close, which the market caps are scaled by
+        for symbol, close in closes.items():
+            histories[symbol].loc[histories[symbol].index[-1], "Close"] = close
+    panel = PricePanel(bars=None, fields=("Open", "High", "Low", "Close", "Dividends"))
+    panel.merge(histories)
+    return panel, histories
+
+
+def test_snapshot_uses_no_later_bars():
+    row = 270
+    panel, histories = random_panel(1)
+    fundamentals = {f"T{i}": {"marketCap": 1e9 * (i + 1), "sector": "Energy" if i % 2 else "Technology",
+                              "beta": 1.1, "dividendYield": 0.01} for i in range(6)}
+    # Identical up to and including `row`, different after it (where every ticker pays dividends)
+    cutoff = panel.dates[row]
+    other, _ = random_panel(2, closes={symbol: history["Close"].iloc[-1] for symbol, history in histories.items()})
+    changed = {}
+    for symbol, history in histories.items():
+        later = other.history(symbol).loc[cutoff:].iloc[1:]
+        changed[symbol] = pd.concat([history.loc[:cutoff], later.assign(Dividends=later["Close"] * 0.01)])
+    changed_panel = PricePanel(bars=None, fields=("Open", "High", "Low", "Close", "Dividends"))
+    changed_panel.merge(changed)
+    assert not np.allclose(panel.arrays()[2]["Close"][row + 1:], changed_panel.arrays()[2]["Close"][row + 1:],
+                           equal_nan=True)
+
+    expected = Backtest(panel, fundamentals).snapshot(row)
+    snapshot = Backtest(changed_panel, fundamentals).snapshot(row)
+    assert snapshot.created_at == expected.created_at
+    np.testing.assert_array_equal(snapshot.valid, expected.valid)
+    assert set(snapshot.columns) == set(expected.columns)
+    for name, values in expected.columns.items():
+        np.testing.assert_allclose(snapshot.columns[name], values, rtol=1e-12, err_msg=name)
+
+
+def test_snapshot_ignores_provider_beta_and_dividend_yield():
+    panel, _ = random_panel(3)
+    fundamentals = {f"T{i}": {"marketCap": 1e9 * (i + 1), "sector": "Energy"} for i in range(6)}
+    today = {symbol: dict(info, beta=3.0, dividendYield=0.2) for symbol, info in fundamentals.items()}
+    expected = Backtest(panel, fundamentals).snapshot(270)
+    snapshot = Backtest(panel, today).snapshot(270)
+    for name, values in expected.columns.items():
+        np.testing.assert_array_equal(snapshot.columns[name], values, err_msg=name)
+    # T1, listed 230 bars before, gets its beta from a shorter window instead of a default
+    beta = snapshot.columns["beta"][snapshot.symbols.index("T1")]
+    assert np.isfinite(beta) and beta != 1.0
+    assert snapshot.columns["dividend_yield"][snapshot.symbols.index("T5")] == 0.0
+
+
+def test_caveats_name_the_lookaheads():
+    panel, _ = random_panel(3)
+    caveats = Backtest(panel, {}).caveats
+    assert any(caveat.startswith("Lookahead: market caps") for caveat in caveats)
+    assert any(caveat.startswith("Survivorship") for caveat in caveats)
@@ -0,0 +1,96 @@
+"""Batch recommendations against one recommend_stocks call per profile"""
+import itertools
+import random
+
+import pytest
+
+from recommendation_cache import RecommendationCache
+from stock_recommender import recommend_stocks, recommend_stocks_batch
+from universe import UniverseSnapshot
+
+SECTORS = ("Technology", "Energy", "Financial Services", "Healthcare")
+
+
+@pytest.fixture(scope="module")
+def snapshot():
+    rng = random.Random(11)
+    return UniverseSnapshot.from_records({
+        f"S{i:03d}.NS": {
+            "current_price": rng.uniform(10, 3000),
+            "beta": rng.uniform(-0.2, 2.4),
+            "market_cap": rng.uniform(1e9, 9e10),
+            "sector": rng.choice(SECTORS),
+            "dividend_yield": rng.choice([0.0, rng.uniform(0, 0.06)]),
+            "change_percent": rng.uniform(-8, 8),
+        }
+        for i in range(150)
+    })
+
+
+def profile(risk="medium", horizon=3, goal="both", sector="all", market_cap="all", dividend="no", amount=10000):
+    return {"risk_appetite": risk, "investment_horizon": horizon, "investment_goal": goal,
+            "sector_preference": sector, "market_cap_preference": market_cap,
+            "dividend_preference": dividend, "investment_amount": amount}
+
+
+ALL_PROFILES = [profile(risk, horizon, goal, sector, market_cap, dividend)
+                for risk, horizon, goal, sector, market_cap, dividend in itertools.product(
+                    ["low", "medium", "high"], [1, 2, 4, 8], ["growth", "dividends", "both"],
+                    ["all", "energy", "Unknown"], ["all", "large-cap", "mid-cap", "small-cap"], ["yes", "no"])]
+
+# Different inputs that normalize to the same cache key, and exact repeats
+DUPLICATES = [profile(horizon=3), profile(horizon=5), profile(horizon=3), profile(sector="Energy"),
+              profile(sector="ENERGY", amount=500), profile(risk="low", horizon=1), profile(risk="low", horizon=0.5)]
+
+
+def sequential(profiles, snapshot):
+    return [recommend_stocks(user_input, snapshot) for user_input in profiles]
+
+
+def test_batch_matches_sequential(snapshot):
+    assert recommend_stocks_batch(ALL_PROFILES, snapshot) == sequential(ALL_PROFILES, snapshot)
+
+
+def test_batch_accepts_records(snapshot):
+    records = {symbol: snapshot[symbol] for symbol in snapshot}
+    profiles = ALL_PROFILES[::37]
+    assert recommend_stocks_batch(profiles, records) == sequential(profiles, records)
+
+
+def test_batch_with_duplicate_profiles(snapshot):
+    assert recommend_stocks_batch(DUPLICATES, snapshot) == sequential(DUPLICATES, snapshot)
+
+
+def test_cache_batch_uncached_profiles_are_cached(snapshot):
+    cache = RecommendationCache(maxsize=64)
+    profiles = DUPLICATES
+    assert cache.recommend_batch(profiles, snapshot, generation=1) == sequential(profiles, snapshot)
+    distinct = 3  # DUPLICATES holds three distinct normalized profiles
+    assert len(cache.cache) == distinct
+    assert cache.cache.stats()["misses"] == distinct
+
+
+def test_cache_batch_mixes_cached_and_uncached(snapshot):
+    cache = RecommendationCache(maxsize=64)
+    profiles = ALL_PROFILES[:12]
+    for user_input in profiles[::3]:
+        cache.recommend(user_input, snapshot, generation=1)
+    assert cache.recommend_batch(profiles, snapshot, generation=1) == sequential(profiles, snapshot)
+    # Cached results are served as they are and match a fresh computation
+    assert cache.recommend_batch(profiles, snapshot, generation=1) == sequential(profiles, snapshot)
+    assert len(cache.cache) == len(profiles)
+
+
+def test_cache_large_batch_is_not_cached(snapshot):
+    cache = RecommendationCache(maxsize=16)
+    cache.recommend(ALL_PROFILES[0], snapshot, generation=1)
+    profiles = ALL_PROFILES[:cache.cache.maxsize // 4 + 5] + DUPLICATES
+    assert cache.recommend_batch(profiles, snapshot, generation=1) == sequential(profiles, snapshot)
+    assert len(cache.cache) == 1
+
+
+def test_cache_batch_respects_generation(snapshot):
+    cache = RecommendationCache(maxsize=64)
+    cache.recommend(DUPLICATES[0], snapshot, generation=1)
+    other = UniverseSnapshot.from_records({symbol: dict(snapshot[symbol], beta=1.0) for symbol in snapshot})
+    assert cache.recommend_batch(DUPLICATES, other, generation=2) == sequential(DUPLICATES, other)
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from indicators import IndicatorState, compute_indicators
+
+FIELDS = ("Open", "High", "Low", "Close", "Volume", "Dividends")
+SYMBOLS = tuple(f"T{i}" for i in range(8))
+
+
+def synthetic_prices(bars=320, seed=3):
+    """(dates, {field: (dates x tickers)}) with a late listing, a halt, scattered gaps and a short history"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2023-01-02", periods=bars).values
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, (bars, len(SYMBOLS))), axis=0))
+    spread = close * rng.uniform(0, 0.02, close.shape)
+    prices = {"Open": close + rng.normal(0, 0.5, close.shape), "High": close + spread, "Low": close - spread,
+              "Close": close, "Volume": rng.integers(1_000, 1_000_000, close.shape).astype(float),
+              "Dividends": np.zeros(close.shape)}
+    missing = np.zeros(close.shape, dtype=bool)
+    missing[:150, 1] = True                           # Listed late
+    missing[200:215, 2] = True                        # Halted
+    missing[rng.random(bars) < 0.1, 3] = True         # Scattered gaps
+    missing[:bars - 3, 4] = True                      # Only the last few bars
+    for values in prices.values():
+        values[missing] = np.nan
+    return dates, prices
+
+
+def rows(prices, stop, start=0):
+    return {field: values[start:stop] for field, values in prices.items()}
+
+
+def revised(prices):
+    """The same bars with the newest row changed, as an intraday refresh would see it"""
+    prices = {field: values.copy() for field, values in prices.items()}
+    for field in ("High", "Low", "Close"):
+        prices[field][-1] *= 1.01
+    return prices
+
+
+def assert_same(actual, expected):
+    (columns, count), (expected_columns, expected_count) = actual, expected
+    np.testing.assert_array_equal(count, expected_count)
+    assert set(columns) == set(expected_columns)
+    for name, values in expected_columns.items():
+        np.testing.assert_allclose(np.asarray(columns[name], dtype=float), np.asarray(values, dtype=float),
+                                   rtol=1e-10, atol=1e-10, equal_nan=True, err_msg=name)
+
+
+def test_first_update_matches_compute_indicators():
+    dates, prices = synthetic_prices()
+    assert_same(IndicatorState().update(dates, SYMBOLS, prices), compute_indicators(prices))
+
+
+def test_incremental_updates_match_full_recompute():
+    dates, prices = synthetic_prices()
+    state = IndicatorState()
+    for stop in range(250, len(dates) + 1):
+        intraday = revised(rows(prices, stop))
+        assert_same(state.update(dates[:stop], SYMBOLS, intraday), compute_indicators(intraday))
+        final = rows(prices, stop)
+        assert_same(state.update(dates[:stop], SYMBOLS, final), compute_indicators(final))
+
+
+def test_smoothers_do_not_depend_on_the_panel_window():
+    # A 60-bar panel moving forward: EMAs, RSI, MACD and ATR carry on from the bars that left it,
+    # and the moving averages still see LONG_MA_WINDOW bars
+    dates, prices = synthetic_prices()
+    state = IndicatorState()
+    for stop in range(60, len(dates) + 1, 7):
+        assert_same(state.update(dates[stop - 60:stop], SYMBOLS, rows(prices, stop, stop - 60)),
+                    compute_indicators(rows(prices, stop)))
+
+
+def test_new_symbols_and_revised_history_start_over():
+    dates, prices = synthetic_prices()
+    state = IndicatorState()
+    state.update(dates[:280], SYMBOLS[:5], {field: values[:280, :5] for field, values in prices.items()})
+    # T2's bars before the newest are revised (e.g. a split adjustment), T5-T7 are new
+    changed = {field: values[:300].copy() for field, values in prices.items()}
+    for field in ("Open", "High", "Low", "Close"):
+        changed[field][:, 2] *= 0.5
+    assert_same(state.update(dates[:300], SYMBOLS, changed), compute_indicators(changed))
+    final = {field: np.vstack([changed[field], prices[field][300:301]]) for field in FIELDS}
+    assert_same(state.update(dates[:301], SYMBOLS, final), compute_indicators(final))
+
+
+def test_dropped_symbols_and_empty_panels():
+    dates, prices = synthetic_prices()
+    state = IndicatorState()
+    state.update(dates[:200], SYMBOLS, rows(prices, 200))
+    subset = {field: values[:, ::2] for field, values in prices.items()}
+    assert_same(state.update(dates, SYMBOLS[::2], subset), compute_indicators(subset))
+    columns, count = IndicatorState().update(dates[:0], SYMBOLS, rows(prices, 0))
+    assert (count == 0).all()
+    assert np.isnan(columns["current_price"]).all()
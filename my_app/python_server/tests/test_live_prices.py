@@ -0,0 +1,52 @@
+import pytest
+
+from live_prices import MAX_SUBSCRIBED_TICKERS, PriceHub
+
+
+class NoQuotes:
+    def quote_batch(self, symbols):
+        return {}
+
+
+def tickers(start, count):
+    return [f"T{i}" for i in range(start, start + count)]
+
+
+@pytest.fixture
+def hub():
+    return PriceHub(NoQuotes(), interval=3600)
+
+
+def test_limit_applies_to_accumulated_subscriptions(hub):
+    subscription = hub.subscribe(tickers(0, MAX_SUBSCRIBED_TICKERS - 1))
+    with pytest.raises(ValueError):
+        subscription.subscribe(tickers(MAX_SUBSCRIBED_TICKERS - 1, 2))
+    assert subscription.tickers == set(tickers(0, MAX_SUBSCRIBED_TICKERS - 1))
+    assert set(hub.subscribers) == subscription.tickers
+
+
+def test_resubscribing_and_swapping_stay_within_limit(hub):
+    subscription = hub.subscribe(tickers(0, MAX_SUBSCRIBED_TICKERS))
+    subscription.subscribe(tickers(0, 5))
+    subscription.unsubscribe(tickers(0, 5))
+    subscription.subscribe(tickers(MAX_SUBSCRIBED_TICKERS, 5))
+    assert len(subscription.tickers) == MAX_SUBSCRIBED_TICKERS
+
+
+def test_limit_is_per_subscription(hub):
+    first = hub.subscribe(tickers(0, MAX_SUBSCRIBED_TICKERS))
+    second = hub.subscribe(tickers(MAX_SUBSCRIBED_TICKERS, MAX_SUBSCRIBED_TICKERS))
+    assert len(hub.subscribers) == 2 * MAX_SUBSCRIBED_TICKERS
+    first.close()
+    second.close()
+    assert hub.subscribers == {}
+
+
+def test_rejected_change_leaves_subscription_unchanged(hub):
+    subscription = hub.subscribe(tickers(0, MAX_SUBSCRIBED_TICKERS))
+    with pytest.raises(ValueError):
+        subscription.change(subscribe=tickers(MAX_SUBSCRIBED_TICKERS, 2), unsubscribe=tickers(0, 1))
+    assert subscription.tickers == set(tickers(0, MAX_SUBSCRIBED_TICKERS))
+    assert set(hub.subscribers) == subscription.tickers
+    subscription.change(subscribe=tickers(MAX_SUBSCRIBED_TICKERS, 2), unsubscribe=tickers(0, 2))
+    assert subscription.tickers == set(tickers(2, MAX_SUBSCRIBED_TICKERS))
@@ -0,0 +1,41 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from stock_recommender import generate_price_guidance, price_guidance_levels
+
+RISK_APPETITES = ["low", "medium", "high", "unknown"]
+INVESTMENT_HORIZONS = [0.5, 1, 1.99, 2, 3, 5, 5.01, 6, 10]
+CHANGE_PERCENTS = [-12.0, -5.01, -5.0, -1.0, 0.0, 4.99, 5.0, 5.01, 20.0]
+BETAS = [-0.8, 0.0, 0.3, 0.5, 0.51, 1.0, 1.7, 3.2]
+PRICES = [0.05, 12.34, 99.99, 2456.75, 31000.0]
+
+CASES = list(itertools.product(RISK_APPETITES, INVESTMENT_HORIZONS, CHANGE_PERCENTS, BETAS, PRICES))
+
+
+@pytest.fixture(scope="module")
+def levels():
+    """price_guidance_levels of every case in one broadcast call"""
+    risk, horizon, change, beta, price = (np.array(values) for values in zip(*CASES))
+    return price_guidance_levels(price, beta, change, risk, horizon)
+
+
+def test_levels_follow_generate_price_guidance(levels):
+    buy, sell, stop = levels
+    for i, (risk, horizon, change, beta, price) in enumerate(CASES):
+        guidance = generate_price_guidance("TEST.NS", {"current_price": price, "beta": beta, "change_percent": change},
+                                           risk, horizon)
+        assert (round(float(buy[i]), 2), round(float(sell[i]), 2), round(float(stop[i]), 2)) == (
+            guidance["buy_target"], guidance["sell_target"], guidance["stop_loss"]), (risk, horizon, change, beta, price)
+
+
+def test_levels_broadcast_profiles_against_stocks():
+    prices, betas, changes = np.array([100.0, 250.5]), np.array([0.8, 1.4]), np.array([-6.0, 6.0])
+    risk = np.array(["low", "medium", "high"])[:, None]
+    horizon = np.array([1, 3, 6])[:, None]
+    buy, sell, stop = price_guidance_levels(prices, betas, changes, risk, horizon)
+    assert buy.shape == sell.shape == stop.shape == (3, 2)
+    for row, column in itertools.product(range(3), range(2)):
+        single = price_guidance_levels(prices[column], betas[column], changes[column], risk[row, 0], horizon[row, 0])
+        assert (buy[row, column], sell[row, column], stop[row, column]) == single
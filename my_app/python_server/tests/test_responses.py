@@ -0,0 +1,65 @@
+import math
+
+import numpy as np
+import pytest
+
+import responses
+from responses import dumps
+
+orjson = pytest.importorskip("orjson")
+
+PAYLOADS = [
+    {"status": "success", "data": []},
+    {
+        "status": "success",
+        "data": [
+            {"symbol": "RELIANCE.NS", "price": 2456.75, "pe_ratio": None, "beta": 1.05, "above_ma": True,
+             "dividend_yield": 0.0035, "market_cap": 16612345678901, "sector": "Energy"},
+            {"symbol": "TCS.NS", "price": float("nan"), "pe_ratio": float("inf"), "beta": -float("inf"),
+             "above_ma": False, "dividend_yield": 0.012, "market_cap": 0, "sector": "Technologie – Ünïcode"},
+        ],
+        "generated": 1760000000.125,
+    },
+    {
+        "numpy": {
+            "int": np.int64(42), "float": np.float64(0.1), "float32": np.float32(0.1), "bool": np.bool_(True),
+            "nan": np.float64("nan"), "array": np.array([1.5, np.nan, np.inf, -2.25]),
+            "matrix": np.arange(6, dtype=np.int32).reshape(2, 3), "narrow": np.array([0.1, np.nan], dtype=np.float32),
+        },
+        "nested": [[float("nan"), 1.0], (2, float("-inf")), {"z": {"a": [math.nan]}}],
+        "ratios": [0.5, 1.25, 99.99, 123456.789, 1e-4, -0.0],
+    },
+    [1, "two", 3.0, None, False, {"b": 1, "a": 2}],
+]
+
+
+def fallback_dumps(monkeypatch, data, default=None):
+    with monkeypatch.context() as patch:
+        patch.setattr(responses, "orjson", None)
+        return dumps(data, default=default)
+
+
+@pytest.mark.parametrize("data", PAYLOADS)
+def test_fallback_matches_orjson(monkeypatch, data):
+    assert fallback_dumps(monkeypatch, data) == dumps(data)
+
+
+def test_non_finite_floats_are_null(monkeypatch):
+    data = {"nan": float("nan"), "inf": float("inf"), "array": np.array([np.nan])}
+    expected = b'{"array":[null],"inf":null,"nan":null}\n'
+    assert dumps(data) == expected
+    assert fallback_dumps(monkeypatch, data) == expected
+
+
+def test_default_converts_other_types(monkeypatch):
+    class Price:
+        def __init__(self, value):
+            self.value = value
+
+    data = {"prices": [Price(1.5), Price(float("nan"))]}
+    default = lambda value: {"value": value.value}
+    assert fallback_dumps(monkeypatch, data, default) == dumps(data, default) == b'{"prices":[{"value":1.5},{"value":null}]}\n'
+    with pytest.raises(TypeError):
+        fallback_dumps(monkeypatch, data)
+    with pytest.raises(TypeError):
+        dumps(data)
@@ -0,0 +1,101 @@
+"""Regression betas and the returns covariance against pandas, on tickers with gaps"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_model import MIN_RISK_OBSERVATIONS, CovarianceEngine, daily_returns
+
+BENCHMARK = "BENCH"
+WINDOW = 252
+BETA_WINDOWS = {"beta_3m": 63, "beta_6m": 126, "beta_1y": 252}
+
+
+def synthetic_closes(days=320, seed=3):
+    """Closes loading on a market factor, NaN where a ticker has no bar"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2023-01-02", periods=days)
+    market = rng.normal(0.0004, 0.01, days)
+    returns = {BENCHMARK: market}
+    for i, beta in enumerate([0.3, 0.8, 1.0, 1.4, 2.0, -0.5]):
+        returns[f"T{i}"] = beta * market + rng.normal(0, 0.012, days)
+    closes = pd.DataFrame({symbol: 100 * np.cumprod(1 + values) for symbol, values in returns.items()},
+                          index=dates)
+    closes.iloc[:days - 150, closes.columns.get_loc("T1")] = np.nan     # Listed recently
+    closes.iloc[-90:-75, closes.columns.get_loc("T2")] = np.nan         # Halted for three weeks
+    closes.iloc[rng.choice(days, 25, replace=False), closes.columns.get_loc("T3")] = np.nan  # Scattered gaps
+    closes.iloc[:days - 40, closes.columns.get_loc("T4")] = np.nan      # Too little history
+    closes.iloc[[-30, -120], closes.columns.get_loc(BENCHMARK)] = np.nan  # Benchmark holidays
+    return closes
+
+
+def engine_for(closes, window=WINDOW):
+    engine = CovarianceEngine(window=window)
+    engine.update({symbol: closes[[symbol]].rename(columns={symbol: "Close"}).dropna() for symbol in closes})
+    return engine
+
+
+def expected_beta(returns, symbol, window):
+    """returns.cov() / benchmark.var() over the days in the window both have a return"""
+    pair = returns[[symbol, BENCHMARK]].iloc[-window:].dropna()
+    if len(pair) < min(MIN_RISK_OBSERVATIONS, int(window * 0.8)):
+        return np.nan
+    return pair.cov().loc[symbol, BENCHMARK] / pair[BENCHMARK].var()
+
+
+@pytest.fixture(scope="module")
+def closes():
+    return synthetic_closes()
+
+
+@pytest.fixture(scope="module")
+def returns(closes):
+    # The returns the engine holds: the last WINDOW days, NaN wherever either day lacks a bar
+    return closes.pct_change(fill_method=None).iloc[-WINDOW:]
+
+
+def test_betas_match_pandas(closes, returns):
+    betas = engine_for(closes).betas(BENCHMARK, BETA_WINDOWS)
+    for name, window in BETA_WINDOWS.items():
+        for symbol in closes:
+            assert betas[name][symbol] == pytest.approx(expected_beta(returns, symbol, window),
+                                                        rel=1e-9, nan_ok=True), (name, symbol)
+    assert np.isnan(betas["beta_1y"]["T4"])
+    assert betas["beta_1y"][BENCHMARK] == pytest.approx(1.0)
+
+
+def test_missing_bars_are_masked_not_flat():
+    closes = pd.DataFrame({"A": [10.0, 11.0, np.nan, np.nan, 12.1, 13.31], "B": [np.nan, 5.0, 5.5, 5.5, 5.5, 6.05]})
+    returns, observed = daily_returns(closes)
+    # No return during the halt, nor for the day it resumes (that would span the halt)
+    assert observed[:, 0].tolist() == [True, False, False, False, True]
+    assert observed[:, 1].tolist() == [False, True, True, True, True]
+    assert returns[:, 0] == pytest.approx([0.1, 0.0, 0.0, 0.0, 0.1])
+    assert returns[:, 1] == pytest.approx([0.0, 0.1, 0.0, 0.0, 0.1])
+
+
+def test_rolling_betas_match_pandas(closes, returns):
+    window = 63
+    rolling = engine_for(closes).rolling_betas(window, BENCHMARK)
+    assert len(rolling) == WINDOW - window + 1
+    for end in range(window, WINDOW + 1, 17):
+        for symbol in ("T0", "T2", "T3"):
+            assert rolling[symbol].iloc[end - window] == pytest.approx(
+                expected_beta(returns.iloc[:end], symbol, window), rel=1e-9, nan_ok=True), (end, symbol)
+
+
+def test_covariance_matches_pandas(closes, returns):
+    model = engine_for(closes).model()
+    expected = returns[list(model.symbols)].cov().to_numpy()
+    assert np.allclose(model.covariance, np.nan_to_num(expected), rtol=1e-9, atol=1e-15)
+    assert model.observations.tolist() == returns[list(model.symbols)].notna().sum().tolist()
+
+
+def test_incremental_update_matches_full_recompute(closes):
+    engine = engine_for(closes.iloc[:-5])
+    for day in range(5, 0, -1):
+        bars = closes.iloc[-day:len(closes) - day + 1]
+        engine.update({symbol: bars[[symbol]].rename(columns={symbol: "Close"}).dropna() for symbol in bars})
+    assert engine._updates > 0
+    incremental, full = engine.model(), engine_for(closes).model()
+    assert incremental.symbols == full.symbols
+    assert np.allclose(incremental.covariance, full.covariance, rtol=1e-9, atol=1e-15)
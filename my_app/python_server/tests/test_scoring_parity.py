@@ -0,0 +1,163 @@
+"""score_all_stocks (vectorized) against the original per-stock scoring loop"""
+import itertools
+import random
+
+import pytest
+
+from stock_recommender import score_all_stocks
+from universe import UniverseSnapshot
+
+
+def baseline_score_all_stocks(stock_data, risk_appetite, investment_horizon, investment_goal,
+                              sector_preference, market_cap_preference, dividend_preference):
+    """The scoring loop as it was before vectorization - keep it frozen"""
+    scored_stocks = []
+    
+    for symbol, data in stock_data.items():
+        if "beta" not in data or "market_cap" not in data or "sector" not in data:
+            continue
+        
+        risk_score = 0
+        market_cap_score = 0
+        sector_score = 0
+        dividend_score = 0
+        goal_score = 0
+        
+        beta = data.get("beta", 1.0)
+        if risk_appetite == "low":
+            risk_score = max(0, 25 - (beta * 10)) if beta < 1.5 else 0
+        elif risk_appetite == "medium":
+            risk_score = max(0, 25 - (abs(beta - 1.0) * 20))
+        else:
+            risk_score = min(beta * 12.5, 25) if beta > 0.8 else 0
+        
+        market_cap = data.get("market_cap", 0)
+        if market_cap_preference == "all":
+            market_cap_score = 15
+        elif market_cap_preference == "large-cap" and market_cap >= 50000000000:
+            market_cap_score = 15
+        elif market_cap_preference == "mid-cap" and market_cap >= 10000000000 and market_cap < 50000000000:
+            market_cap_score = 15
+        elif market_cap_preference == "small-cap" and market_cap < 10000000000:
+            market_cap_score = 15
+        else:
+            if market_cap_preference == "large-cap" and market_cap >= 30000000000:
+                market_cap_score = 8
+            elif market_cap_preference == "mid-cap" and market_cap >= 5000000000:
+                market_cap_score = 8
+            elif market_cap_preference == "small-cap" and market_cap < 20000000000:
+                market_cap_score = 8
+        
+        if sector_preference == "all":
+            sector_score = 20
+        elif data.get("sector", "").lower() == sector_preference.lower():
+            sector_score = 20
+        
+        dividend_yield = data.get("dividend_yield", 0)
+        if dividend_preference == "yes":
+            dividend_score = min(dividend_yield * 750, 15)
+        else:
+            dividend_score = 15 - min(dividend_yield * 300, 10)
+        
+        if investment_goal == "growth":
+            change_percent = data.get("change_percent", 0)
+            momentum_factor = min(max(change_percent, -5), 10) + 5
+            goal_score = min(beta * 8, 15) + (15 - min(dividend_yield * 375, 15)) + (momentum_factor * 0.5)
+            goal_score = min(goal_score, 25)
+        elif investment_goal == "dividends":
+            stability_factor = 15 - min(abs(beta - 0.8) * 10, 15)
+            goal_score = min(dividend_yield * 1000, 20) + stability_factor * 0.25
+            goal_score = min(goal_score, 25)
+        else:
+            balanced_factor = 15 - min(abs(beta - 1.0) * 15, 15)
+            goal_score = min(dividend_yield * 500, 12.5) + balanced_factor + min(max(data.get("change_percent", 0), 0), 5)
+            goal_score = min(goal_score, 25)
+        
+        horizon_bonus = 0
+        if investment_horizon <= 2:
+            horizon_bonus = max(0, 10 - (beta * 5)) if beta < 1.5 else 0
+        elif investment_horizon <= 5:
+            horizon_bonus = max(0, 10 - (abs(beta - 1.0) * 8))
+        else:
+            if investment_goal == "growth":
+                horizon_bonus = min(beta * 5, 10) if beta < 2 else 5
+            elif investment_goal == "dividends":
+                horizon_bonus = min(dividend_yield * 500, 10)
+            else:
+                horizon_bonus = min((beta * 2.5) + (dividend_yield * 250), 10)
+        
+        total_score = risk_score + market_cap_score + sector_score + dividend_score + goal_score + horizon_bonus
+        scored_stocks.append((symbol, total_score))
+    
+    return sorted(scored_stocks, key=lambda x: x[1], reverse=True)
+
+
+EDGE_BETAS = (0.0, 0.8, 1.0, 1.5, 2.0, -0.4)
+CAP_BOUNDARIES = (5e9, 1e10, 2e10, 3e10, 5e10)
+SECTORS = ("Technology", "technology", "Energy", "")
+
+
+def synthetic_universe(seed=7):
+    """Records at every edge beta and cap boundary (and just either side), random ones and incomplete ones"""
+    rng = random.Random(seed)
+    stocks = {}
+    
+    def add(**record):
+        stocks[f"S{len(stocks):03d}"] = record
+    
+    caps = [cap + offset for cap in CAP_BOUNDARIES for offset in (-1, 0, 1)]
+    for beta, market_cap in itertools.product(EDGE_BETAS, caps):
+        add(beta=beta, market_cap=market_cap, sector=rng.choice(SECTORS),
+            dividend_yield=rng.choice([0.0, 0.01, 0.02, 0.05]), change_percent=rng.choice([-7.0, 0.0, 3.0, 12.0]))
+    for _ in range(60):
+        add(beta=rng.uniform(-0.5, 2.5), market_cap=rng.uniform(1e9, 8e10), sector=rng.choice(SECTORS),
+            dividend_yield=rng.uniform(0, 0.06), change_percent=rng.uniform(-10, 15))
+    # Optional fields missing - scored with their defaults
+    add(beta=1.2, market_cap=2e10, sector="Energy")
+    # Critical fields missing - never scored
+    add(market_cap=2e10, sector="Energy", dividend_yield=0.01)
+    add(beta=0.9, sector="Technology", change_percent=2.0)
+    add(beta=0.9, market_cap=6e10, dividend_yield=0.03)
+    # Tied scores keep input order
+    add(beta=1.0, market_cap=2e10, sector="Energy", dividend_yield=0.01, change_percent=1.0)
+    add(beta=1.0, market_cap=2e10, sector="Energy", dividend_yield=0.01, change_percent=1.0)
+    return stocks
+
+
+RISK_APPETITES = ["low", "medium", "high"]
+INVESTMENT_HORIZONS = [1, 2, 3, 5, 6, 10]
+INVESTMENT_GOALS = ["growth", "dividends", "both"]
+SECTOR_PREFERENCES = ["all", "Technology", "ENERGY", "Unknown"]
+MARKET_CAP_PREFERENCES = ["all", "large-cap", "mid-cap", "small-cap"]
+DIVIDEND_PREFERENCES = ["yes", "no"]
+
+
+@pytest.fixture(scope="module")
+def universe():
+    stocks = synthetic_universe()
+    return stocks, UniverseSnapshot.from_records(stocks)
+
+
+@pytest.mark.parametrize("risk_appetite, investment_horizon, investment_goal", list(itertools.product(
+    RISK_APPETITES, INVESTMENT_HORIZONS, INVESTMENT_GOALS)))
+def test_scores_match_baseline(universe, risk_appetite, investment_horizon, investment_goal):
+    stocks, snapshot = universe
+    for sector_preference, market_cap_preference, dividend_preference in itertools.product(
+            SECTOR_PREFERENCES, MARKET_CAP_PREFERENCES, DIVIDEND_PREFERENCES):
+        profile = (risk_appetite, investment_horizon, investment_goal,
+                   sector_preference, market_cap_preference, dividend_preference)
+        expected = baseline_score_all_stocks(stocks, *profile)
+        for stock_data in (stocks, snapshot):
+            scored = score_all_stocks(stock_data, *profile)
+            assert [symbol for symbol, _ in scored] == [symbol for symbol, _ in expected], profile
+            assert [score for _, score in scored] == pytest.approx([score for _, score in expected],
+                                                                    rel=0, abs=1e-9), profile
+
+
+def test_incomplete_records_are_skipped(universe):
+    stocks, snapshot = universe
+    scored = {symbol for symbol, _ in score_all_stocks(snapshot, "medium", 3, "both", "all", "all", "no")}
+    incomplete = {symbol for symbol, record in stocks.items()
+                  if not {"beta", "market_cap", "sector"} <= record.keys()}
+    assert len(incomplete) == 3
+    assert scored == set(stocks) - incomplete
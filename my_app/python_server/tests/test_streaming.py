@@ -0,0 +1,23 @@
+import json
+
+import numpy as np
+
+from streaming import NDJSON, SSE, encode_event
+
+DATA = {"symbol": "TCS.NS", "price": np.float64(3456.5), "change": float("nan"), "volume": np.int64(1200),
+        "history": np.array([1.0, np.inf])}
+EXPECTED = {"symbol": "TCS.NS", "price": 3456.5, "change": None, "volume": 1200, "history": [1.0, None]}
+
+
+def test_ndjson_event_is_one_json_line():
+    body = encode_event(NDJSON, "stock", DATA)
+    assert body.endswith(b"\n") and body.count(b"\n") == 1
+    assert json.loads(body) == {"event": "stock", "data": EXPECTED}
+
+
+def test_sse_event_block():
+    body = encode_event(SSE, "stock", DATA)
+    event, data, end = body.split(b"\n", 2)
+    assert event == b"event: stock"
+    assert data.startswith(b"data: ") and json.loads(data[len(b"data: "):]) == EXPECTED
+    assert end == b"\n"
@@ -0,0 +1,219 @@
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
+
+import numpy as np
+
+from risk_model import RiskModel
+from shared_file import write_shared_file
+
+# Market cap buckets (same boundaries the recommender scores against)
+LARGE_CAP_MIN = 50000000000
+MID_CAP_MIN = 10000000000
+MARKET_CAP_BUCKETS = ("large-cap", "mid-cap", "small-cap")
+
+# Per-symbol attributes stored as float64 columns
+NUMERIC_FIELDS = (
+    "current_price", "day_high", "day_low", "volume", "market_cap", "beta",
+    "dividend_yield", "change_percent", "rsi", "moving_avg_50", "moving_avg_200",
+    "price_to_ma_ratio", "volatility", "beta_3m", "beta_6m", "beta_1y",
+    "ema_50", "ema_200", "macd", "macd_signal", "macd_histogram",
+    "bollinger_upper", "bollinger_lower", "atr",
+)
+BOOL_FIELDS = ("above_ma50", "above_ma200")
+
+# Keys a stock must have to be scored
+CRITICAL_FIELDS = ("beta", "market_cap", "sector")
+
+# Defaults used for missing attributes (mirrors the .get() fallbacks used by consumers).
+# Regression betas (see risk_model.BETA_WINDOWS) and the indicators that need a full
+# window (see indicators.py) are NaN when there wasn't enough history
+FIELD_DEFAULTS = {"beta": 1.0, "beta_3m": float("nan"), "beta_6m": float("nan"), "beta_1y": float("nan"),
+                  "atr": float("nan")}
+
+
+def market_cap_bucket(market_cap):
+    """
+    Returns the bucket index (see MARKET_CAP_BUCKETS) for each market cap value.
+    Unknown (NaN) market caps get -1 and belong to no bucket.
+    """
+    market_cap = np.asarray(market_cap, dtype=float)
+    return np.select([market_cap >= LARGE_CAP_MIN, market_cap >= MID_CAP_MIN, market_cap < MID_CAP_MIN],
+                     [0, 1, 2], default=-1).astype(np.int8)
+
+
+class UniverseSnapshot(Mapping):
+    """
+    Immutable, column-oriented snapshot of the fetched stock universe.
+    Behaves like the old {symbol: {attribute: value}} dictionary for existing consumers,
+    while storing every attribute as one array and carrying precomputed indexes
+    by sector and market cap bucket.
+    `risk`, if given, is the RiskModel (returns covariance) of the same refresh.
+    """
+
+    def __init__(self, symbols, columns, sectors, sector_codes, valid, created_at=None, risk=None):
+        self._symbols = tuple(symbols)
+        self._positions = {symbol: i for i, symbol in enumerate(self._symbols)}
+        self._columns = MappingProxyType({name: _frozen(values) for name, values in columns.items()})
+        self._sectors = tuple(sectors)
+        self._sector_codes = _frozen(np.asarray(sector_codes, dtype=np.int16))
+        self._valid = _frozen(np.asarray(valid, dtype=bool))
+        self._market_cap_buckets = _frozen(market_cap_bucket(self._columns["market_cap"]))
+        self.created_at = created_at if created_at is not None else time.time()
+        self.risk = risk
+
+        # Lowercased sector name -> row indices
+        sector_index = {}
+        for code, sector in enumerate(self._sectors):
+            rows = np.flatnonzero(self._sector_codes == code)
+            key = sector.lower()
+            sector_index[key] = _frozen(np.union1d(sector_index[key], rows)) if key in sector_index else _frozen(rows)
+        self._sector_index = MappingProxyType(sector_index)
+
+        # Market cap bucket name -> row indices
+        self._market_cap_index = MappingProxyType({
+            bucket: _frozen(np.flatnonzero(self._market_cap_buckets == i))
+            for i, bucket in enumerate(MARKET_CAP_BUCKETS)
+        })
+
+    @classmethod
+    def from_records(cls, stock_data, created_at=None, risk=None):
+        """Builds a snapshot from a {symbol: {attribute: value}} dictionary"""
+        symbols = list(stock_data)
+        rows = [stock_data[symbol] for symbol in symbols]
+
+        columns = {}
+        for field in NUMERIC_FIELDS:
+            default = FIELD_DEFAULTS.get(field, 0)
+            columns[field] = np.array([_to_float(row.get(field, default)) for row in rows], dtype=float)
+        for field in BOOL_FIELDS:
+            columns[field] = np.array([bool(row.get(field, False)) for row in rows], dtype=bool)
+
+        sectors = []
+        sector_lookup = {}
+        sector_codes = np.empty(len(rows), dtype=np.int16)
+        for i, row in enumerate(rows):
+            sector = row.get("sector", "")
+            sector = "" if sector is None else str(sector)
+            if sector not in sector_lookup:
+                sector_lookup[sector] = len(sectors)
+                sectors.append(sector)
+            sector_codes[i] = sector_lookup[sector]
+
+        valid = [all(field in row for field in CRITICAL_FIELDS) for row in rows]
+        return cls(symbols, columns, sectors, sector_codes, valid, created_at=created_at, risk=risk)
+
+    def write_shared(self, path, **meta):
+        """
+        Publishes the snapshot to a shared file (see shared_file.py) that other processes
+        can map with from_shared(). Extra keyword arguments are stored as metadata.
+        """
+        buffers = {f"column:{name}": values for name, values in self._columns.items()}
+        buffers["sector_codes"] = self._sector_codes
+        buffers["valid"] = self._valid
+        meta = dict(meta, symbols=list(self._symbols), sectors=list(self._sectors),
+                    columns=list(self._columns), created_at=self.created_at)
+        if self.risk is not None:
+            risk_buffers, meta["risk"] = self.risk.buffers()
+            buffers.update(risk_buffers)
+        write_shared_file(path, meta, buffers)
+
+    @classmethod
+    def from_shared(cls, shared):
+        """Builds a snapshot whose columns are views into a mapped SharedFile (nothing is copied)"""
+        meta = shared.meta
+        columns = {name: shared.array(f"column:{name}") for name in meta["columns"]}
+        risk = RiskModel.from_shared(shared, meta["risk"]) if "risk" in meta else None
+        return cls(meta["symbols"], columns, meta["sectors"], shared.array("sector_codes"),
+                   shared.array("valid"), created_at=meta["created_at"], risk=risk)
+
+    # Mapping interface - rows are materialized on demand for dict-style consumers
+    def __getitem__(self, symbol):
+        i = self._positions[symbol]
+        row = {field: values[i].item() for field, values in self._columns.items()}
+        row["sector"] = self._sectors[self._sector_codes[i]]
+        return row
+
+    def __iter__(self):
+        return iter(self._symbols)
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self._positions
+
+    def __repr__(self):
+        return f"<UniverseSnapshot {len(self)} symbols, {len(self._sectors)} sectors>"
+
+    @property
+    def symbols(self):
+        return self._symbols
+
+    @property
+    def columns(self):
+        """Read-only mapping of attribute name -> array"""
+        return self._columns
+
+    @property
+    def sectors(self):
+        return self._sectors
+
+    @property
+    def sector_codes(self):
+        return self._sector_codes
+
+    @property
+    def valid(self):
+        """Mask of stocks that have all critical attributes"""
+        return self._valid
+
+    @property
+    def market_cap_buckets(self):
+        return self._market_cap_buckets
+
+    @property
+    def sector_index(self):
+        return self._sector_index
+
+    @property
+    def market_cap_index(self):
+        return self._market_cap_index
+
+    def position(self, symbol):
+        return self._positions[symbol]
+
+    def sector_mask(self, sector_preference):
+        """Boolean mask of stocks in the given sector (case-insensitive)"""
+        mask = np.zeros(len(self), dtype=bool)
+        rows = self._sector_index.get(str(sector_preference).lower())
+        if rows is not None:
+            mask[rows] = True
+        return mask
+
+    def market_cap_mask(self, market_cap_preference):
+        """Boolean mask of stocks in the given market cap bucket"""
+        mask = np.zeros(len(self), dtype=bool)
+        rows = self._market_cap_index.get(market_cap_preference)
+        if rows is not None:
+            mask[rows] = True
+        return mask
+
+    @property
+    def nbytes(self):
+        """Approximate memory used by the column arrays"""
+        arrays = list(self._columns.values()) + [self._sector_codes, self._valid, self._market_cap_buckets]
+        return sum(values.nbytes for values in arrays)
+
+
+def _frozen(values):
+    values = np.asarray(values)
+    values.flags.writeable = False
+    return values
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")